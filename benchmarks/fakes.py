@@ -0,0 +1,206 @@
+"""
+Local stand-ins for the external services the chatbot talks to.
+
+FakeAnthropic implements POST /v1/messages and replays a scripted sequence of
+tool_use blocks per user message, so a turn exercises the real MCP servers
+without calling the real API. The script position is derived from the request
+itself (number of tool_result messages since the last user text), which keeps
+the fake stateless and deterministic across concurrent sessions.
+
+FakeArxiv answers arXiv API queries with a fixed Atom feed.
+"""
+import json
+import threading
+from html import escape
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# message text -> list of steps; a step is ("tool", name, input) or ("text", reply)
+SCRIPTS = {
+    "create my friends collection": [
+        ("tool", "create_user_collection_only", {"collection_name": "friends"}),
+        ("text", "Your friends collection is ready."),
+    ],
+    "add dana from haifa to my friends": [
+        ("tool", "insert_to_collection", {"collection_name": "friends", "new_data": {"name": "Dana", "city": "Haifa", "age": 31}}),
+        ("text", "Dana was added to your friends."),
+    ],
+    "list my collections": [
+        ("tool", "get_user_collections", {}),
+        ("text", "You have the following collections: friends."),
+    ],
+    "who lives in haifa": [
+        ("tool", "get_collection_schema", {"collection_name": "friends"}),
+        ("tool", "find_documents_by_filter", {"collection_name": "friends", "filter_query": {"city": "Haifa"}}),
+        ("text", "Dana lives in Haifa."),
+    ],
+    "how many friends do i have": [
+        ("tool", "count_documents", {"collection_name": "friends", "filter_query": {}}),
+        ("text", "You have some friends saved."),
+    ],
+    "find papers about graph neural networks": [
+        ("tool", "search_papers", {"topic": "graph neural networks", "max_results": 3}),
+        ("text", "I found three papers about graph neural networks."),
+    ],
+}
+
+SETUP_MESSAGES = ["create my friends collection", "add dana from haifa to my friends"]
+WORKLOAD_MESSAGES = [
+    "list my collections",
+    "who lives in haifa",
+    "how many friends do i have",
+    "find papers about graph neural networks",
+]
+
+
+def _script_position(messages):
+    """Return (user text of the current turn, number of tool results already returned)."""
+    tool_results = 0
+    for message in reversed(messages):
+        if message.get("role") != "user":
+            continue
+        content = message.get("content")
+        if isinstance(content, str):
+            return content, tool_results
+        if isinstance(content, list) and any(block.get("type") == "tool_result" for block in content):
+            tool_results += 1
+            continue
+        texts = [block.get("text", "") for block in content or [] if block.get("type") == "text"]
+        return " ".join(texts), tool_results
+    return "", tool_results
+
+
+def scripted_response(request: dict, counter: int) -> dict:
+    query, position = _script_position(request.get("messages", []))
+    steps = SCRIPTS.get(query.strip().lower(), [("text", f"(fake) I received: {query}")])
+    step = steps[min(position, len(steps) - 1)]
+    if step[0] == "tool":
+        content = [{"type": "tool_use", "id": f"toolu_bench_{counter:08d}", "name": step[1], "input": step[2]}]
+        stop_reason = "tool_use"
+    else:
+        content = [{"type": "text", "text": step[1]}]
+        stop_reason = "end_turn"
+    body_chars = len(json.dumps(request.get("messages", []))) + len(json.dumps(request.get("tools", []))) + len(request.get("system", ""))
+    return {
+        "id": f"msg_bench_{counter:08d}",
+        "type": "message",
+        "role": "assistant",
+        "model": request.get("model", "fake"),
+        "content": content,
+        "stop_reason": stop_reason,
+        "stop_sequence": None,
+        "usage": {"input_tokens": body_chars // 4, "output_tokens": 20},
+    }
+
+
+class _BackgroundServer:
+    handler_class = None
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        self.httpd = ThreadingHTTPServer((host, port), self.handler_class)
+        self.httpd.daemon_threads = True
+        self.httpd.owner = self
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class _AnthropicHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        owner = self.server.owner
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        with owner.lock:
+            owner.requests += 1
+            counter = owner.requests
+        if owner.latency_seconds:
+            time.sleep(owner.latency_seconds)
+        response = scripted_response(request, counter)
+        with owner.lock:
+            owner.input_tokens_seen += response["usage"]["input_tokens"]
+        body = json.dumps(response).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class FakeAnthropic(_BackgroundServer):
+    handler_class = _AnthropicHandler
+
+    def __init__(self, latency_seconds: float = 0.0, **kwargs):
+        super().__init__(**kwargs)
+        self.latency_seconds = latency_seconds
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.input_tokens_seen = 0
+
+
+ATOM_ENTRY = """
+  <entry>
+    <id>http://arxiv.org/abs/2401.{num:05d}v1</id>
+    <updated>2024-01-{day:02d}T00:00:00Z</updated>
+    <published>2024-01-{day:02d}T00:00:00Z</published>
+    <title>Benchmark Paper {num} on {topic}</title>
+    <summary>A deterministic abstract about {topic} used for load testing.</summary>
+    <author><name>Bench Author {num}</name></author>
+    <link href="http://arxiv.org/abs/2401.{num:05d}v1" rel="alternate" type="text/html"/>
+    <link title="pdf" href="http://arxiv.org/pdf/2401.{num:05d}v1" rel="related" type="application/pdf"/>
+    <arxiv:primary_category xmlns:arxiv="http://arxiv.org/schemas/atom" term="cs.LG" scheme="http://arxiv.org/schemas/atom"/>
+    <category term="cs.LG" scheme="http://arxiv.org/schemas/atom"/>
+  </entry>"""
+
+ATOM_FEED = """<?xml version="1.0" encoding="UTF-8"?>
+<feed xmlns="http://www.w3.org/2005/Atom" xmlns:opensearch="http://a9.com/-/spec/opensearch/1.1/">
+  <title type="html">ArXiv Query</title>
+  <id>http://arxiv.org/api/bench</id>
+  <updated>2024-01-01T00:00:00Z</updated>
+  <opensearch:totalResults>{total}</opensearch:totalResults>
+  <opensearch:startIndex>{start}</opensearch:startIndex>
+  <opensearch:itemsPerPage>{count}</opensearch:itemsPerPage>{entries}
+</feed>
+"""
+
+
+class _ArxivHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        params = parse_qs(urlparse(self.path).query)
+        topic = escape(params.get("search_query", ["papers"])[0])
+        start = int(params.get("start", ["0"])[0])
+        count = int(params.get("max_results", ["5"])[0])
+        total = self.server.owner.total_results
+        numbers = range(start, min(start + count, total))
+        entries = "".join(ATOM_ENTRY.format(num=n, day=(n % 28) + 1, topic=topic) for n in numbers)
+        body = ATOM_FEED.format(total=total, start=start, count=len(numbers), entries=entries).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/atom+xml")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class FakeArxiv(_BackgroundServer):
+    handler_class = _ArxivHandler
+
+    def __init__(self, total_results: int = 50, **kwargs):
+        super().__init__(**kwargs)
+        self.total_results = total_results
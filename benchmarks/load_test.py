@@ -0,0 +1,283 @@
+"""
+End-to-end load and latency benchmark for the chat API.
+
+Starts src/api/server.py under uvicorn with a deterministic fake Anthropic
+backend and a fake arXiv API, launches the real mongo/research MCP servers over
+stdio (against `mongomock://` or a local mongod), and drives the API with many
+concurrent simulated users.
+
+    python -m benchmarks.load_test --users 20 --messages 8
+    python -m benchmarks.load_test --save-baseline default
+    python -m benchmarks.load_test --compare default
+
+Comparing against a saved baseline exits non-zero when a tracked metric
+regresses by more than --tolerance.
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+import jwt
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+
+# Support both `python -m benchmarks.load_test` and direct script execution
+try:
+    from benchmarks.fakes import SETUP_MESSAGES, WORKLOAD_MESSAGES, FakeAnthropic, FakeArxiv
+except ModuleNotFoundError:
+    if str(ROOT_DIR) not in sys.path:
+        sys.path.append(str(ROOT_DIR))
+    from benchmarks.fakes import SETUP_MESSAGES, WORKLOAD_MESSAGES, FakeAnthropic, FakeArxiv
+
+BASELINE_DIR = ROOT_DIR / "benchmarks" / "baselines"
+JWT_SECRET = "bench-secret"
+
+# metric -> True if higher is better
+TRACKED_METRICS = {
+    "message_latency_ms.p50": False,
+    "message_latency_ms.p95": False,
+    "message_latency_ms.p99": False,
+    "init_latency_ms.p95": False,
+    "requests_per_second": True,
+    "processes_per_session": False,
+    "rss_mb_per_session": False,
+    "llm_input_tokens_per_message": False,
+}
+
+
+def percentile(values, pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def summarize(latencies) -> dict:
+    return {
+        "count": len(latencies),
+        "mean": round(sum(latencies) / len(latencies), 2) if latencies else 0.0,
+        "p50": round(percentile(latencies, 50), 2),
+        "p95": round(percentile(latencies, 95), 2),
+        "p99": round(percentile(latencies, 99), 2),
+    }
+
+
+def process_tree(root_pid: int) -> list:
+    """PIDs of root_pid and all its descendants (Linux /proc only)."""
+    children = {}
+    for stat_path in Path("/proc").glob("[0-9]*/stat"):
+        try:
+            fields = stat_path.read_text().rsplit(")", 1)[1].split()
+        except (OSError, IndexError):
+            continue
+        children.setdefault(int(fields[1]), []).append(int(stat_path.parent.name))
+    pids, stack = [], [root_pid]
+    while stack:
+        pid = stack.pop()
+        pids.append(pid)
+        stack.extend(children.get(pid, []))
+    return pids
+
+
+def rss_mb(pid: int) -> float:
+    try:
+        for line in Path(f"/proc/{pid}/status").read_text().splitlines():
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return 0.0
+
+
+def write_server_config(tmp_dir: Path, mongo_uri: str, arxiv_url: str) -> Path:
+    env = {
+        "PATH": os.environ.get("PATH", ""),
+        "HOME": os.environ.get("HOME", ""),
+        "MONGO_URI": mongo_uri,
+        "ARXIV_API_URL": arxiv_url + "/api/query",
+        "ARXIV_REQUEST_INTERVAL": "0",  # The fake arXiv has no rate limit to respect
+        "PAPER_DIR": str(tmp_dir / "papers"),
+        "METRICS_DIR": str(tmp_dir / "metrics"),
+    }
+    config = {"mcpServers": {
+        name: {"command": sys.executable, "args": [str(ROOT_DIR / "src" / "servers" / script)], "env": env}
+        for name, script in (("mongo", "mongo_server.py"), ("research", "research_server.py"))
+    }}
+    path = tmp_dir / "server_config.json"
+    path.write_text(json.dumps(config, indent=2), encoding="utf-8")
+    return path
+
+
+async def wait_for_health(client: httpx.AsyncClient, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if (await client.get("/health")).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError("API server did not become healthy in time")
+
+
+async def simulate_user(client, index: int, messages: int, results: dict) -> None:
+    user_id = f"bench-user-{index:04d}"
+    headers = {"Authorization": f"Bearer {jwt.encode({'user_id': user_id}, JWT_SECRET, algorithm='HS256')}"}
+
+    start = time.perf_counter()
+    response = await client.post("/api/init", json={"user_id": user_id})
+    results["init"].append((time.perf_counter() - start) * 1000)
+    if response.status_code != 200:
+        results["errors"] += 1
+        return
+    session_id = response.json()["session_id"]
+
+    script = SETUP_MESSAGES + [WORKLOAD_MESSAGES[i % len(WORKLOAD_MESSAGES)] for i in range(messages)]
+    for message in script:
+        start = time.perf_counter()
+        response = await client.post("/api/message", json={"session_id": session_id, "message": message}, headers=headers)
+        elapsed = (time.perf_counter() - start) * 1000
+        if response.status_code == 200:
+            results["message"].append(elapsed)
+        elif response.status_code == 429:
+            results["shed"] += 1
+        else:
+            results["errors"] += 1
+
+
+async def run_load(args, base_url: str, server_pid: int, fake_llm: FakeAnthropic) -> dict:
+    results = {"init": [], "message": [], "errors": 0, "shed": 0}
+    limits = httpx.Limits(max_connections=args.users * 2)
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.request_timeout, limits=limits) as client:
+        await wait_for_health(client)
+        start = time.perf_counter()
+        await asyncio.gather(*(simulate_user(client, i, args.messages, results) for i in range(args.users)))
+        wall_seconds = time.perf_counter() - start
+
+        pids = process_tree(server_pid)
+        total_rss = sum(rss_mb(pid) for pid in pids)
+        cache_stats = (await client.get("/api/cache/stats")).json()
+
+    sessions = max(1, len(results["init"]) - results["errors"])
+    completed = len(results["message"])
+    return {
+        "config": {
+            "users": args.users,
+            "messages_per_user": args.messages + len(SETUP_MESSAGES),
+            "llm_latency_ms": args.llm_latency_ms,
+            "mongo_uri": args.mongo_uri,
+            "fast_path": args.fast_path,
+        },
+        "wall_seconds": round(wall_seconds, 2),
+        "init_latency_ms": summarize(results["init"]),
+        "message_latency_ms": summarize(results["message"]),
+        "requests_per_second": round(completed / wall_seconds, 2) if wall_seconds else 0.0,
+        "errors": results["errors"],
+        "shed": results["shed"],
+        "processes": len(pids),
+        "processes_per_session": round((len(pids) - 1) / sessions, 2),
+        "rss_mb_total": round(total_rss, 1),
+        "rss_mb_per_session": round(total_rss / sessions, 1),
+        "llm_requests": fake_llm.requests,
+        "llm_input_tokens_per_message": round(fake_llm.input_tokens_seen / completed, 1) if completed else 0.0,
+        "tool_cache": cache_stats,
+    }
+
+
+def lookup(report: dict, dotted: str):
+    value = report
+    for part in dotted.split("."):
+        value = value.get(part) if isinstance(value, dict) else None
+    return value
+
+
+def compare(report: dict, baseline: dict, tolerance: float) -> bool:
+    """Print a comparison table; return True if any tracked metric regressed beyond tolerance."""
+    regressed = False
+    print(f"\n{'metric':34} {'baseline':>12} {'current':>12} {'change':>9}")
+    for metric, higher_is_better in TRACKED_METRICS.items():
+        old, new = lookup(baseline, metric), lookup(report, metric)
+        if not old or new is None:
+            continue
+        change = (new - old) / old
+        worse = -change if higher_is_better else change
+        flag = "  REGRESSION" if worse > tolerance else ""
+        regressed = regressed or bool(flag)
+        print(f"{metric:34} {old:>12} {new:>12} {change:>+8.1%}{flag}")
+    return regressed
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Load and latency benchmark for the chat API")
+    parser.add_argument("--users", type=int, default=20, help="Concurrent simulated users")
+    parser.add_argument("--messages", type=int, default=8, help="Workload messages per user (after setup)")
+    parser.add_argument("--llm-latency-ms", type=float, default=50.0, help="Simulated latency of each fake LLM call")
+    parser.add_argument("--mongo-uri", default="mongomock://", help="MONGO_URI for mongo_server (mongomock:// or a local mongod)")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--request-timeout", type=float, default=120.0)
+    parser.add_argument("--max-active-turns", type=int, default=None, help="Override MAX_ACTIVE_TURNS for the API")
+    parser.add_argument("--fast-path", action="store_true", help="Enable CHATBOT_FAST_PATH in the API")
+    parser.add_argument("--output", type=Path, help="Write the JSON report here")
+    parser.add_argument("--save-baseline", metavar="NAME", help="Save the report as benchmarks/baselines/NAME.json")
+    parser.add_argument("--compare", metavar="NAME", help="Compare against benchmarks/baselines/NAME.json")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative regression (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="datalo-bench-") as tmp, \
+            FakeAnthropic(latency_seconds=args.llm_latency_ms / 1000) as fake_llm, \
+            FakeArxiv() as fake_arxiv:
+        tmp_dir = Path(tmp)
+        env = {
+            **os.environ,
+            "ANTHROPIC_BASE_URL": fake_llm.url,
+            "ANTHROPIC_API_KEY": "bench",
+            "MCP_SERVER_CONFIG": str(write_server_config(tmp_dir, args.mongo_uri, fake_arxiv.url)),
+            "METRICS_DIR": str(tmp_dir / "metrics"),
+            "JWT_SECRET": JWT_SECRET,
+        }
+        if args.mongo_uri.startswith("mongomock://"):
+            env["CHANGE_FEED"] = "off"  # In-memory data lives inside mongo_server; there is nothing to watch
+        if args.fast_path:
+            env["CHATBOT_FAST_PATH"] = "1"
+        if args.max_active_turns:
+            env["MAX_ACTIVE_TURNS"] = str(args.max_active_turns)
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "src.api.server:app", "--port", str(args.port), "--log-level", "warning"],
+            cwd=ROOT_DIR,
+            env=env,
+            stdout=subprocess.DEVNULL,
+        )
+        try:
+            report = asyncio.run(run_load(args, f"http://127.0.0.1:{args.port}", server.pid, fake_llm))
+        finally:
+            server.terminate()
+            try:
+                server.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                server.kill()
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    if args.save_baseline:
+        BASELINE_DIR.mkdir(parents=True, exist_ok=True)
+        path = BASELINE_DIR / f"{args.save_baseline}.json"
+        path.write_text(json.dumps(report, indent=2) + "\n", encoding="utf-8")
+        print(f"Baseline saved to {path}")
+    if args.compare:
+        baseline = json.loads((BASELINE_DIR / f"{args.compare}.json").read_text(encoding="utf-8"))
+        if compare(report, baseline, args.tolerance):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,115 @@
+"""
+Cold-start benchmark for the Python MCP servers.
+
+For each server it reports:
+  * import_ms     - time to execute the module without starting the server
+  * handshake_ms  - spawn to completed MCP initialize, per launch mode
+  * list_tools_ms - first tools/list round-trip after the handshake
+
+    python -m benchmarks.startup --runs 5
+    python -m benchmarks.startup --modes direct uv --output startup.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from mcp import ClientSession, StdioServerParameters
+from mcp.client.stdio import stdio_client
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+SERVERS = {
+    "mongo": "src/servers/mongo_server.py",
+    "research": "src/servers/research_server.py",
+}
+
+IMPORT_PROBE = """
+import runpy, sys, time
+start = time.perf_counter()
+runpy.run_path(sys.argv[1], run_name="startup_probe")
+print((time.perf_counter() - start) * 1000)
+"""
+
+
+def launch_params(script: str, mode: str, env: dict) -> StdioServerParameters:
+    if mode == "uv":
+        return StdioServerParameters(command="uv", args=["run", script], env=env, cwd=str(ROOT_DIR))
+    return StdioServerParameters(command=sys.executable, args=[script], env=env, cwd=str(ROOT_DIR))
+
+
+def measure_import(script: str, env: dict) -> float:
+    output = subprocess.run(
+        [sys.executable, "-c", IMPORT_PROBE, script],
+        cwd=ROOT_DIR, env=env, capture_output=True, text=True, check=True,
+    )
+    return float(output.stdout.strip().splitlines()[-1])
+
+
+async def measure_handshake(script: str, mode: str, env: dict):
+    start = time.perf_counter()
+    async with stdio_client(launch_params(script, mode, env)) as (read, write):
+        async with ClientSession(read, write) as session:
+            await session.initialize()
+            handshake = (time.perf_counter() - start) * 1000
+            start = time.perf_counter()
+            await session.list_tools()
+            list_tools = (time.perf_counter() - start) * 1000
+    return handshake, list_tools
+
+
+def describe(samples) -> dict:
+    return {
+        "median": round(statistics.median(samples), 1),
+        "min": round(min(samples), 1),
+        "max": round(max(samples), 1),
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Startup time of the Python MCP servers")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--modes", nargs="+", default=["direct", "uv"], choices=["direct", "uv"])
+    parser.add_argument("--servers", nargs="+", default=list(SERVERS), choices=list(SERVERS))
+    parser.add_argument("--mongo-uri", default="mongodb://localhost:27017/")
+    parser.add_argument("--output", type=Path, help="Write the JSON report here")
+    args = parser.parse_args()
+
+    modes = [mode for mode in args.modes if mode != "uv" or shutil.which("uv")]
+    if len(modes) < len(args.modes):
+        print("uv not found on PATH; skipping the uv launch mode", file=sys.stderr)
+
+    report = {}
+    with tempfile.TemporaryDirectory(prefix="datalo-startup-") as tmp:
+        env = {
+            "PATH": os.environ.get("PATH", ""),
+            "HOME": os.environ.get("HOME", ""),
+            "MONGO_URI": args.mongo_uri,
+            "PAPER_DIR": str(Path(tmp) / "papers"),
+            "METRICS_DIR": str(Path(tmp) / "metrics"),
+        }
+        for name in args.servers:
+            script = SERVERS[name]
+            result = {"import_ms": describe([measure_import(script, env) for _ in range(args.runs)])}
+            for mode in modes:
+                samples = [asyncio.run(measure_handshake(script, mode, env)) for _ in range(args.runs)]
+                result[mode] = {
+                    "handshake_ms": describe([handshake for handshake, _ in samples]),
+                    "list_tools_ms": describe([list_tools for _, list_tools in samples]),
+                }
+            report[name] = result
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,6 +2,7 @@
 import { useNavigate } from 'react-router-dom'
 
 type Message = { role: 'user' | 'assistant', text: string }
+type ChangeEvent = { user_id: string, collection: string | null, operation: string, at: string }
 
 const apiBase = import.meta.env.VITE_API_BASE ?? 'http://localhost:8000'
 const promptLibrary = [
@@ -16,6 +17,7 @@ export function Chat() {
   const [input, setInput] = useState('')
   const [loading, setLoading] = useState(false)
   const [sessionId, setSessionId] = useState<string | null>(null)
+  const [lastChange, setLastChange] = useState<ChangeEvent | null>(null)
   const messagesRef = useRef<HTMLDivElement | null>(null)
   const textareaRef = useRef<HTMLTextAreaElement | null>(null)
   const navigate = useNavigate()
@@ -39,6 +41,16 @@ export function Chat() {
     })()
   }, [navigate, token, userId])
 
+  // Live data changes pushed by the API (writes from any session, worker or direct DB edit)
+  useEffect(() => {
+    if (!token) return
+    const source = new EventSource(`${apiBase}/api/events?token=${encodeURIComponent(token)}`)
+    source.addEventListener('change', event => {
+      setLastChange(JSON.parse((event as MessageEvent).data))
+    })
+    return () => source.close()
+  }, [token])
+
   const appendMessage = useCallback((message: Message) => {
     setMessages(previous => [...previous, message])
   }, [])
@@ -106,6 +118,14 @@ export function Chat() {
             <span className="session-label">Status</span>
             <span className="session-value">{loading ? 'Waiting on assistant' : 'Ready to chat'}</span>
           </div>
+          <div className="session-pill">
+            <span className="session-label">Data</span>
+            <span className="session-value">
+              {lastChange
+                ? `${lastChange.operation} in ${lastChange.collection ?? 'your collections'} at ${new Date(lastChange.at).toLocaleTimeString()}`
+                : 'No changes yet'}
+            </span>
+          </div>
         </div>
       </section>
 
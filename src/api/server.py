@@ -1,19 +1,25 @@
-from fastapi import FastAPI, HTTPException, Header, Depends
+from fastapi import FastAPI, HTTPException, Header, Depends, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
 import asyncio
+import json
+import time
+from contextlib import asynccontextmanager
 from typing import Dict
 
 # Support both `python -m src.api.server` and direct script execution
 try:
-    from src.chatbot.app import MCP_ChatBot
+    from src.chatbot.app import MCP_ChatBot, TOOL_CACHE
 except ModuleNotFoundError:
     import sys
     from pathlib import Path
     ROOT_DIR = Path(__file__).resolve().parents[2]
     if str(ROOT_DIR) not in sys.path:
         sys.path.append(str(ROOT_DIR))
-    from src.chatbot.app import MCP_ChatBot
+    from src.chatbot.app import MCP_ChatBot, TOOL_CACHE
+from src.telemetry import REGISTRY, render_all
+from src.change_feed import ChangeBus, ChangeWatcher
 from pymongo import MongoClient
 import jwt
 import os
@@ -30,6 +36,33 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+HTTP_SECONDS = REGISTRY.histogram("http_request_seconds", "Latency of API requests", ["method", "route", "status"])
+SESSIONS_ACTIVE = REGISTRY.gauge("chat_sessions_active", "Chatbot sessions held by this API process")
+TURNS_ACTIVE = REGISTRY.gauge("llm_turns_active", "LLM turns currently running")
+TURNS_QUEUED = REGISTRY.gauge("llm_turns_queued", "Requests waiting for an LLM turn slot")
+REQUESTS_SHED = REGISTRY.counter("http_requests_shed_total", "Requests rejected with 429", ["reason"])
+TOOL_CACHE_EVENTS = REGISTRY.gauge("tool_cache_events", "Tool result cache counters", ["event"])
+CHANGE_EVENTS = REGISTRY.counter("change_events_total", "Data change events received", ["source", "operation"])
+EVENT_STREAMS = REGISTRY.gauge("event_streams_active", "Open /api/events connections")
+
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        HTTP_SECONDS.observe(
+            time.perf_counter() - start,
+            method=request.method,
+            route=getattr(route, "path", "unmatched"),
+            status=status,
+        )
+
 
 class InitRequest(BaseModel):
     user_id: str
@@ -51,6 +84,131 @@ mongo_client = MongoClient("mongodb://localhost:27017/")
 USERS_DB_NAME = os.environ.get("USERS_DB_NAME", "admin")
 USERS_COLLECTION_NAME = os.environ.get("USERS_COLLECTION_NAME", "users")
 
+# Load shedding for /api/message: at most MAX_ACTIVE_TURNS LLM turns run at once,
+# MAX_QUEUED_TURNS more may wait up to TURN_QUEUE_TIMEOUT seconds for a slot, and
+# each session may have at most MAX_SESSION_QUEUE requests pending behind its lock.
+MAX_ACTIVE_TURNS = int(os.environ.get("MAX_ACTIVE_TURNS", "8"))
+MAX_QUEUED_TURNS = int(os.environ.get("MAX_QUEUED_TURNS", "32"))
+MAX_SESSION_QUEUE = int(os.environ.get("MAX_SESSION_QUEUE", "2"))
+TURN_QUEUE_TIMEOUT = float(os.environ.get("TURN_QUEUE_TIMEOUT", "20"))
+RETRY_AFTER_SECONDS = int(os.environ.get("RETRY_AFTER_SECONDS", "5"))
+
+
+class Overloaded(Exception):
+    """Raised when a turn cannot be admitted without exceeding the configured limits."""
+
+    def __init__(self, detail: str, reason: str = "global"):
+        super().__init__(detail)
+        self.reason = reason
+
+
+class TurnLimiter:
+    """Global limiter for in-flight LLM turns with a bounded wait queue."""
+
+    def __init__(self, max_active: int, max_queued: int, queue_timeout: float):
+        self.max_active = max_active
+        self.max_queued = max_queued
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self.queued = 0
+        self._semaphore = asyncio.Semaphore(max_active)
+
+    @asynccontextmanager
+    async def slot(self):
+        if self._semaphore.locked() and self.queued >= self.max_queued:
+            raise Overloaded("Too many requests waiting for an LLM slot")
+        self.queued += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            raise Overloaded("Timed out waiting for an LLM slot")
+        finally:
+            self.queued -= 1
+        self.active += 1
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self._semaphore.release()
+
+
+class SessionGate:
+    """Serializes requests per session so only one turn touches a bot's chat_history at a time."""
+
+    def __init__(self, max_pending: int):
+        self.max_pending = max_pending
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._pending: Dict[str, int] = {}
+
+    @asynccontextmanager
+    async def hold(self, session_id: str):
+        pending = self._pending.get(session_id, 0)
+        if pending > self.max_pending:
+            raise Overloaded(f"Too many pending requests for session '{session_id}'", reason="session")
+        lock = self._locks.setdefault(session_id, asyncio.Lock())
+        self._pending[session_id] = pending + 1
+        try:
+            async with lock:
+                yield
+        finally:
+            self._pending[session_id] -= 1
+            if self._pending[session_id] == 0:
+                self._pending.pop(session_id, None)
+                self._locks.pop(session_id, None)
+
+
+turn_limiter = TurnLimiter(MAX_ACTIVE_TURNS, MAX_QUEUED_TURNS, TURN_QUEUE_TIMEOUT)
+session_gate = SessionGate(MAX_SESSION_QUEUE)
+# /api/init uses its own gate (no pending limit) so concurrent inits don't spawn duplicate bots
+init_gate = SessionGate(max_pending=1_000_000)
+
+
+# Change feed: invalidates the tool cache when data changes in any process (another API
+# worker, a schema migration, a direct DB edit) and pushes the events to /api/events.
+# CHANGE_FEED: auto | changestream | outbox | off
+CHANGE_FEED = os.environ.get("CHANGE_FEED", "auto")
+EVENT_HEARTBEAT_SECONDS = float(os.environ.get("EVENT_HEARTBEAT_SECONDS", "15"))
+change_bus = ChangeBus()
+change_watcher = ChangeWatcher(
+    lambda: MongoClient(os.environ.get("MONGO_URI", "mongodb://localhost:27017/")),
+    change_bus,
+    mode=CHANGE_FEED,
+    tenancy_mode=os.environ.get("TENANCY_MODE", "database"),
+    shared_db=os.environ.get("SHARED_DB_NAME", "datalo"),
+    outbox_db=os.environ.get("CHANGE_FEED_DB", "datalo_events"),
+    ignored_dbs=(USERS_DB_NAME, os.environ.get("JOBS_DB_NAME", "datalo_jobs")),
+)
+
+
+def invalidate_cached_results(event: dict) -> None:
+    CHANGE_EVENTS.inc(source=event["source"], operation=event["operation"])
+    if event["user_id"] is None:
+        TOOL_CACHE.clear()  # The owner of the change is unknown
+    else:
+        TOOL_CACHE.invalidate(event["user_id"], event["collection"], include_user_level=event["user_level"])
+
+
+change_bus.add_listener(invalidate_cached_results)
+
+
+@app.on_event("startup")
+async def start_change_feed():
+    change_bus.bind(asyncio.get_running_loop())
+    change_watcher.start()
+
+
+@app.on_event("shutdown")
+async def stop_change_feed():
+    change_watcher.stop()
+
+
+def too_many_requests(detail: str) -> HTTPException:
+    return HTTPException(
+        status_code=429,
+        detail=detail,
+        headers={"Retry-After": str(RETRY_AFTER_SECONDS)},
+    )
+
 
 class LoginRequest(BaseModel):
     email: str
@@ -68,15 +226,15 @@ async def init_chat(req: InitRequest):
     if session_id in chatbot_sessions:
         return {"session_id": session_id}
 
-    bot = MCP_ChatBot()
-    await bot.connect_to_servers()
-    bot.user_id = req.user_id
-    chatbot_sessions[session_id] = bot
+    async with init_gate.hold(session_id):
+        if session_id in chatbot_sessions:
+            return {"session_id": session_id}
+        bot = MCP_ChatBot()
+        await bot.connect_to_servers()
+        bot.user_id = req.user_id
+        chatbot_sessions[session_id] = bot
     return {"session_id": session_id}
-def get_user_id_from_auth(authorization: str | None = Header(default=None)) -> str:
-    if not authorization or not authorization.lower().startswith("bearer "):
-        raise HTTPException(status_code=401, detail="Missing or invalid Authorization header")
-    token = authorization.split(" ", 1)[1]
+def user_id_from_token(token: str) -> str:
     try:
         payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALG])
         return payload.get("user_id")
@@ -84,6 +242,12 @@ def get_user_id_from_auth(authorization: str | None = Header(default=None)) -> s
         raise HTTPException(status_code=401, detail="Invalid token")
 
 
+def get_user_id_from_auth(authorization: str | None = Header(default=None)) -> str:
+    if not authorization or not authorization.lower().startswith("bearer "):
+        raise HTTPException(status_code=401, detail="Missing or invalid Authorization header")
+    return user_id_from_token(authorization.split(" ", 1)[1])
+
+
 @app.post("/auth/login", response_model=LoginResponse)
 async def login(req: LoginRequest):
     # Lookup user by email in 'users' database, 'users' collection
@@ -112,12 +276,67 @@ async def send_message(req: MessageRequest, user_id: str = Depends(get_user_id_f
     if not bot:
         raise HTTPException(status_code=404, detail="Session not found. Initialize with /api/init")
 
-    # Ensure session user_id matches token's user
-    bot.user_id = user_id
-    reply = await bot.ask(req.message)
+    # One turn per session at a time; turns across sessions share the global LLM limiter
+    try:
+        async with session_gate.hold(req.session_id):
+            async with turn_limiter.slot():
+                # Ensure session user_id matches token's user
+                bot.user_id = user_id
+                reply = await bot.ask(req.message)
+    except Overloaded as e:
+        REQUESTS_SHED.inc(reason=e.reason)
+        raise too_many_requests(str(e))
     return MessageResponse(reply=reply or "")
 
 
+@app.get("/api/events")
+async def events(request: Request, token: str, collection: str | None = None):
+    """
+    Server-sent events for changes to the caller's data. EventSource cannot set
+    headers, so the JWT is passed as ?token=. Optional ?collection= filters events.
+    """
+    user_id = user_id_from_token(token)
+
+    async def stream():
+        queue = change_bus.subscribe(user_id)
+        EVENT_STREAMS.inc()
+        try:
+            yield "retry: 5000\n\n"
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=EVENT_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                if collection and event["collection"] not in (collection, None):
+                    continue
+                yield f"event: change\ndata: {json.dumps(event)}\n\n"
+        finally:
+            EVENT_STREAMS.dec()
+            change_bus.unsubscribe(user_id, queue)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get("/api/cache/stats")
+async def cache_stats():
+    return TOOL_CACHE.stats()
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    SESSIONS_ACTIVE.set(len(chatbot_sessions))
+    TURNS_ACTIVE.set(turn_limiter.active)
+    TURNS_QUEUED.set(turn_limiter.queued)
+    for event, value in TOOL_CACHE.stats().items():
+        TOOL_CACHE_EVENTS.set(value, event=event)
+    return PlainTextResponse(render_all(), media_type="text/plain; version=0.0.4")
+
+
 @app.get("/health")
 async def health():
     return {"status": "ok"}
@@ -0,0 +1,251 @@
+"""
+Per-(user, collection) change events.
+
+Sources:
+  * MongoDB change streams (replica sets and sharded clusters), which also see
+    writes made outside the tool servers, e.g. direct DB edits.
+  * An outbox: mongo_server appends one small document per successful write
+    to a capped collection, and the watcher tails it with a tailable cursor.
+    This works on a standalone mongod and in the shared tenancy mode.
+
+ChangeWatcher turns either source into event dicts
+    {"user_id", "collection", "operation", "user_level", "source", "at"}
+and hands them to a ChangeBus, which runs synchronous listeners (cache
+invalidation) and fans events out to asyncio subscribers (SSE clients).
+"""
+import asyncio
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+OUTBOX_COLLECTION = "changes"
+
+# Operations that change which collections exist, not just their documents
+USER_LEVEL_OPERATIONS = {"create", "drop", "rename", "dropDatabase"}
+
+# mongod answers $changeStream on a standalone server with this code
+CHANGE_STREAMS_UNSUPPORTED = 40573
+
+
+def make_event(user_id, collection, operation: str, source: str) -> dict:
+    return {
+        "user_id": user_id,
+        "collection": collection,
+        "operation": operation,
+        "user_level": operation in USER_LEVEL_OPERATIONS or collection is None,
+        "source": source,
+        "at": datetime.now(timezone.utc).isoformat(),
+    }
+
+
+class ChangeOutbox:
+    """Writer side of the outbox; used by mongo_server after successful writes."""
+
+    def __init__(self, db_factory, size_bytes: int = 16 * 1024 * 1024, enabled: bool = True):
+        self.db_factory = db_factory
+        self.size_bytes = size_bytes
+        self.enabled = enabled
+        self._collection = None
+
+    def _get_collection(self):
+        if self._collection is None:
+            db = self.db_factory()
+            if OUTBOX_COLLECTION not in db.list_collection_names():
+                try:
+                    db.create_collection(OUTBOX_COLLECTION, capped=True, size=self.size_bytes)
+                except Exception as e:
+                    # Another process may have created it first; anything else disables the outbox
+                    if OUTBOX_COLLECTION not in db.list_collection_names():
+                        raise RuntimeError(f"cannot create capped outbox: {e}")
+            self._collection = db[OUTBOX_COLLECTION]
+        return self._collection
+
+    def record(self, user_id: str, collection_name, operation: str) -> None:
+        if not self.enabled:
+            return
+        try:
+            self._get_collection().insert_one({
+                "user_id": user_id,
+                "collection": collection_name,
+                "operation": operation,
+                "at": datetime.now(timezone.utc),
+            })
+        except RuntimeError as e:
+            self.enabled = False
+            print(f"Change outbox disabled: {e}", file=sys.stderr)
+        except Exception as e:
+            print(f"Change outbox write failed: {e}", file=sys.stderr)
+
+
+class ChangeBus:
+    """Thread-safe fan-out from the watcher thread to listeners and asyncio subscribers."""
+
+    def __init__(self, queue_size: int = 100):
+        self.queue_size = queue_size
+        self._listeners = []
+        self._subscribers = {}  # user_id -> set of asyncio.Queue
+        self._loop = None
+        self._lock = threading.Lock()
+
+    def bind(self, loop) -> None:
+        self._loop = loop
+
+    def add_listener(self, callback) -> None:
+        """callback(event) runs on the publishing thread; keep it quick."""
+        self._listeners.append(callback)
+
+    def subscribe(self, user_id: str) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        with self._lock:
+            self._subscribers.setdefault(user_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, user_id: str, queue: asyncio.Queue) -> None:
+        with self._lock:
+            queues = self._subscribers.get(user_id)
+            if queues is not None:
+                queues.discard(queue)
+                if not queues:
+                    del self._subscribers[user_id]
+
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return sum(len(queues) for queues in self._subscribers.values())
+
+    def publish(self, event: dict) -> None:
+        for callback in self._listeners:
+            try:
+                callback(event)
+            except Exception as e:
+                print(f"Change listener failed: {e}", file=sys.stderr)
+        with self._lock:
+            queues = list(self._subscribers.get(event["user_id"], ()))
+        if queues and self._loop is not None:
+            self._loop.call_soon_threadsafe(self._deliver, queues, event)
+
+    @staticmethod
+    def _deliver(queues, event) -> None:
+        for queue in queues:
+            if queue.full():
+                queue.get_nowait()  # A slow client loses its oldest event rather than stalling the rest
+            queue.put_nowait(event)
+
+
+class ChangeWatcher:
+    """
+    Background thread feeding a ChangeBus.
+
+    mode: "changestream", "outbox", "auto" (change streams in database tenancy
+    when the server supports them, otherwise the outbox) or "off".
+    """
+
+    def __init__(self, client_factory, bus: ChangeBus, mode: str = "auto", tenancy_mode: str = "database",
+                 shared_db: str = "datalo", outbox_db: str = "datalo_events", ignored_dbs=()):
+        self.client_factory = client_factory
+        self.bus = bus
+        self.mode = mode
+        self.tenancy_mode = tenancy_mode
+        self.shared_db = shared_db
+        self.outbox_db = outbox_db
+        self.ignored_dbs = {"admin", "local", "config", outbox_db, *ignored_dbs}
+        self.source = None
+        self._resume_token = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self) -> None:
+        if self.mode == "off" or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="change-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _run(self) -> None:
+        from pymongo.errors import OperationFailure
+
+        client = self.client_factory()
+        use_streams = self.mode == "changestream" or (self.mode == "auto" and self.tenancy_mode == "database")
+        backoff = 1.0
+        while not self._stop.is_set():
+            try:
+                if use_streams:
+                    self.source = "changestream"
+                    self._watch_change_stream(client)
+                else:
+                    self.source = "outbox"
+                    self._tail_outbox(client)
+                backoff = 1.0
+            except OperationFailure as e:
+                if use_streams and self.mode == "auto" and (
+                    e.code == CHANGE_STREAMS_UNSUPPORTED or "replica set" in str(e)
+                ):
+                    print("Change streams unavailable; tailing the change outbox instead", file=sys.stderr)
+                    use_streams = False
+                    continue
+                print(f"Change watcher error: {e}", file=sys.stderr)
+            except Exception as e:
+                print(f"Change watcher error: {e}", file=sys.stderr)
+            self._stop.wait(backoff)
+            backoff = min(backoff * 2, 30.0)
+
+    # -- change streams -----------------------------------------------------
+
+    def _watch_change_stream(self, client) -> None:
+        if self.tenancy_mode == "shared":
+            match = {"ns.db": self.shared_db}
+        else:
+            match = {"ns.db": {"$nin": sorted(self.ignored_dbs)}}
+        pipeline = [
+            {"$match": match},
+            # Only the routing fields are needed; skip shipping whole documents
+            {"$project": {
+                "operationType": 1, "ns": 1,
+                "fullDocument._tenant_id": 1, "fullDocument._collection": 1,
+                "fullDocument.tenant_id": 1, "fullDocument.name": 1,
+            }},
+        ]
+        options = {"full_document": "updateLookup"} if self.tenancy_mode == "shared" else {}
+        with client.watch(pipeline, resume_after=self._resume_token, max_await_time_ms=1000, **options) as stream:
+            while not self._stop.is_set() and stream.alive:
+                change = stream.try_next()
+                if change is None:
+                    continue
+                self._resume_token = stream.resume_token
+                event = self._event_from_change(change)
+                if event is not None:
+                    self.bus.publish(event)
+
+    def _event_from_change(self, change: dict):
+        operation = change["operationType"]
+        ns = change.get("ns") or {}
+        if self.tenancy_mode != "shared":
+            if operation == "invalidate":
+                return None
+            return make_event(ns.get("db"), ns.get("coll"), operation, "changestream")
+
+        document = change.get("fullDocument") or {}
+        if ns.get("coll") == "collections":
+            return make_event(document.get("tenant_id"), document.get("name"), "create" if operation == "insert" else "drop", "changestream")
+        # Deletes carry no document, so the owner is unknown (user_id None)
+        return make_event(document.get("_tenant_id"), document.get("_collection"), operation, "changestream")
+
+    # -- outbox -------------------------------------------------------------
+
+    def _tail_outbox(self, client) -> None:
+        from pymongo import CursorType
+
+        outbox = client[self.outbox_db][OUTBOX_COLLECTION]
+        last = next(outbox.find({}, {"_id": 1}).sort("$natural", -1).limit(1), None)
+        last_id = last["_id"] if last else None
+        while not self._stop.is_set():
+            query = {} if last_id is None else {"_id": {"$gt": last_id}}
+            cursor = outbox.find(query, cursor_type=CursorType.TAILABLE_AWAIT).max_await_time_ms(1000)
+            while cursor.alive and not self._stop.is_set():
+                for entry in cursor:
+                    last_id = entry["_id"]
+                    self.bus.publish(make_event(entry["user_id"], entry.get("collection"), entry["operation"], "outbox"))
+            # An empty capped collection yields a dead cursor at once; don't spin on it
+            time.sleep(0.5)
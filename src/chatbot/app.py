@@ -1,19 +1,111 @@
 from dotenv import load_dotenv
 from anthropic import Anthropic
-from mcp import ClientSession, StdioServerParameters
+from mcp import ClientSession, StdioServerParameters, types
 from mcp.client.stdio import stdio_client
 from contextlib import AsyncExitStack
 from pathlib import Path
 import json
+import itertools
+import os
+import sys
 import asyncio
 import nest_asyncio
 
+ROOT_DIR = Path(__file__).resolve().parents[2]
+
+# Support both `python -m src.chatbot.app` and direct script execution
+try:
+    from src.chatbot.tool_cache import ToolResultCache
+except ModuleNotFoundError:
+    if str(ROOT_DIR) not in sys.path:
+        sys.path.append(str(ROOT_DIR))
+    from src.chatbot.tool_cache import ToolResultCache
+from src.chatbot.compaction import READ_TOOL_RESULT_TOOL, ToolResultStore, compact_tool_result
+from src.chatbot import fast_path
+from src.chatbot.tool_router import REQUEST_MORE_TOOLS_TOOL, ToolRouter
+from src.telemetry import REGISTRY, get_tracer, traceparent
+from src.tool_results import is_error_content
+
 nest_asyncio.apply()
 
 load_dotenv()
 
-ROOT_DIR = Path(__file__).resolve().parents[2]
-CONFIG_PATH = ROOT_DIR / "config" / "server_config.json"
+CONFIG_PATH = Path(os.environ.get("MCP_SERVER_CONFIG", ROOT_DIR / "config" / "server_config.json"))
+
+# Shared across sessions: keys include the user id, and writes invalidate by (user, collection)
+TOOL_CACHE = ToolResultCache(
+    max_entries=int(os.environ.get("TOOL_CACHE_MAX_ENTRIES", "512")),
+    ttl_seconds=float(os.environ.get("TOOL_CACHE_TTL", "60")),
+)
+
+# Tool results above this many (estimated) tokens are compacted before entering chat_history
+TOOL_RESULT_TOKEN_BUDGET = int(os.environ.get("TOOL_RESULT_TOKEN_BUDGET", "2000"))
+TOOL_RESULT_PREVIEW_ROWS = int(os.environ.get("TOOL_RESULT_PREVIEW_ROWS", "10"))
+
+ANTHROPIC_MODEL = os.environ.get("ANTHROPIC_MODEL", "claude-3-haiku-20240307")
+
+# Send only the K tools most relevant to each query (plus recently used ones); 0 sends every tool
+TOOL_ROUTER_TOP_K = int(os.environ.get("TOOL_ROUTER_TOP_K", "8"))
+# The system prompt tells the model to discover collections/schemas first, so these are always sent
+PINNED_TOOLS = ("get_user_collections", "get_collection_schema")
+
+# Answer simple data commands (list/count/find/schema) from templates without calling the LLM
+FAST_PATH_ENABLED = os.environ.get("CHATBOT_FAST_PATH", "0").lower() in ("1", "true", "yes")
+
+TRACER = get_tracer("chatbot")
+TURN_SECONDS = REGISTRY.histogram("chat_turn_seconds", "End-to-end latency of one user turn")
+LLM_SECONDS = REGISTRY.histogram("llm_request_seconds", "Latency of anthropic messages.create calls", ["model"])
+LLM_ERRORS = REGISTRY.counter("llm_errors_total", "Failed anthropic messages.create calls", ["model"])
+LLM_TOKENS = REGISTRY.counter("llm_tokens_total", "Tokens reported by the Anthropic API", ["model", "direction"])
+TOOL_SECONDS = REGISTRY.histogram("tool_call_seconds", "Latency of MCP tool calls as seen by the chatbot", ["tool"])
+TOOL_CALLS = REGISTRY.counter("tool_calls_total", "MCP tool calls by outcome (ok, error, cache_hit)", ["tool", "status"])
+CONNECT_SECONDS = REGISTRY.histogram("mcp_connect_seconds", "Time to spawn and initialize an MCP server", ["server"])
+CONNECT_ERRORS = REGISTRY.counter("mcp_connect_errors_total", "Failed MCP server connections", ["server"])
+MCP_CONNECTIONS = REGISTRY.gauge("mcp_server_connections", "Open MCP server connections (stdio = one subprocess each)", ["server", "transport"])
+TOOL_ROUTER_WIDENED = REGISTRY.counter("tool_router_widened_total", "Turns where the model needed tools outside the routed subset")
+FAST_PATH_QUERIES = REGISTRY.counter("fast_path_queries_total", "Queries seen by the fast path by outcome", ["intent", "outcome"])
+
+_url_counters = {}
+
+
+def pick_server_url(server_name, urls):
+    """Spread sessions round-robin across the instances of a shared server."""
+    if isinstance(urls, str):
+        return urls
+    counter = _url_counters.setdefault(server_name, itertools.count())
+    return urls[next(counter) % len(urls)]
+
+
+def call_tool_request(tool_name, tool_arguments):
+    """
+    A tools/call request carrying the current span as a W3C traceparent in _meta, so the
+    spans the tool server records join the chat turn's trace.
+    """
+    parent = traceparent()
+    return types.ClientRequest(types.CallToolRequest(
+        method="tools/call",
+        params=types.CallToolRequestParams(
+            name=tool_name,
+            arguments=tool_arguments,
+            _meta={"traceparent": parent} if parent else None,
+        ),
+    ))
+
+
+def direct_launch_config(server_config):
+    """
+    Rewrite `uv run <script.py> ...` to run the script with this interpreter.
+
+    Skips uv's environment resolution on every spawn; the chatbot's interpreter
+    already has the project dependencies. Other commands (npx, uvx) are unchanged.
+    """
+    args = server_config.get("args", [])
+    if "url" in server_config:
+        return server_config
+    if server_config.get("command") == "uv" and len(args) >= 2 and args[0] == "run" and args[1].endswith(".py"):
+        return {**server_config, "command": sys.executable, "args": args[1:]}
+    return server_config
+
 
 class MCP_ChatBot:
     def __init__(self):
@@ -24,6 +116,8 @@ class MCP_ChatBot:
         self.available_prompts = []
         self.sessions = {}
         self.user_id = None # Store the user ID here
+        self.result_store = ToolResultStore() # Full payloads of compacted tool results
+        self.tool_router = None # Built once all servers are connected
 
         # Define the initial system prompt
         # self.system_prompt = {
@@ -92,12 +186,29 @@ class MCP_ChatBot:
         """
 
     async def connect_to_server(self, server_name, server_config):
-        try:
+        with TRACER.span("mcp.connect", server=server_name), CONNECT_SECONDS.time(server=server_name):
+            await self._connect_to_server(server_name, server_config)
+
+    async def _open_transport(self, server_name, server_config):
+        """Open a stdio subprocess, or connect to a shared server when the config has a `url`."""
+        if "url" not in server_config:
             server_params = StdioServerParameters(**server_config)
-            stdio_transport = await self.exit_stack.enter_async_context(
-                stdio_client(server_params)
-            )
-            read, write = stdio_transport
+            return await self.exit_stack.enter_async_context(stdio_client(server_params))
+
+        url = pick_server_url(server_name, server_config["url"])
+        if server_config.get("transport", "streamable-http") == "sse":
+            from mcp.client.sse import sse_client
+            return await self.exit_stack.enter_async_context(sse_client(url))
+        from mcp.client.streamable_http import streamablehttp_client
+        read, write, _ = await self.exit_stack.enter_async_context(streamablehttp_client(url))
+        return read, write
+
+    async def _connect_to_server(self, server_name, server_config):
+        try:
+            read, write = await self._open_transport(server_name, server_config)
+            transport = server_config.get("transport", "streamable-http") if "url" in server_config else "stdio"
+            MCP_CONNECTIONS.inc(server=server_name, transport=transport)
+            self.exit_stack.callback(MCP_CONNECTIONS.dec, server=server_name, transport=transport)
             session = await self.exit_stack.enter_async_context(
                 ClientSession(read, write)
             )
@@ -132,6 +243,7 @@ class MCP_ChatBot:
                 print(f"Error listing tools/prompts/resources from {server_name}: {e}")
                 
         except Exception as e:
+            CONNECT_ERRORS.inc(server=server_name)
             print(f"Error connecting to {server_name}: {e}")
 
     async def connect_to_servers(self):
@@ -139,32 +251,52 @@ class MCP_ChatBot:
             with open(CONFIG_PATH, "r", encoding="utf-8") as file:
                 data = json.load(file)
             servers = data.get("mcpServers", {})
+            launch_mode = os.environ.get("MCP_LAUNCH_MODE", data.get("launchMode", "uv"))
             for server_name, server_config in servers.items():
+                if launch_mode == "direct":
+                    server_config = direct_launch_config(server_config)
                 await self.connect_to_server(server_name, server_config)
+            self.tool_router = ToolRouter(self.available_tools, TOOL_ROUTER_TOP_K, pinned=PINNED_TOOLS)
         except Exception as e:
             print(f"Error loading server config: {e}")
             raise
     
     async def process_query(self, query):
+        with TRACER.span("chat.turn", user_id=self.user_id or ""), TURN_SECONDS.time():
+            return await self._process_query(query)
+
+    async def _process_query(self, query):
         if len(self.chat_history) > 10:
             self.chat_history = self.chat_history[-9:] # Keep latest 9 user/assistant messages + current user query
         
         self.chat_history.append({'role': 'user', 'content': query})
+
+        if FAST_PATH_ENABLED:
+            reply = await self.try_fast_path(query)
+            if reply is not None:
+                print(reply)
+                self.chat_history.append({'role': 'assistant', 'content': reply})
+                return reply
         
-        
+        selected_tools = self.available_tools
+        if self.tool_router:
+            selected_tools = self.tool_router.select(query, self.recent_tool_names())
+        widened = len(selected_tools) == len(self.available_tools)
+        selected_names = {tool['name'] for tool in selected_tools}
+
         aggregated_text_output = []
         while True:
             messages_for_anthropic = []
             for msg in self.chat_history:
                 messages_for_anthropic.append(msg)
 
-            response = self.anthropic.messages.create(
-                max_tokens=2024,
-                model='claude-3-haiku-20240307',
-                tools=self.available_tools,
-                messages=messages_for_anthropic,
-                system=self.system_prompt['content']
-            )
+            if widened:
+                tools = self.available_tools
+            else:
+                tools = selected_tools + [REQUEST_MORE_TOOLS_TOOL]
+            if self.result_store:
+                tools = tools + [READ_TOOL_RESULT_TOOL]
+            response = await self.create_message(tools, messages_for_anthropic)
 
             assistant_content = []
             has_tool_use = False
@@ -180,6 +312,41 @@ class MCP_ChatBot:
                     # We append the assistant's tool_use message to history *before* calling the tool
                     self.chat_history.append({'role': 'assistant', 'content': assistant_content})
 
+                    if content.name == REQUEST_MORE_TOOLS_TOOL['name']:
+                        widened = True
+                        TOOL_ROUTER_WIDENED.inc()
+                        self.chat_history.append({
+                            "role": "user",
+                            "content": [{
+                                "type": "tool_result",
+                                "tool_use_id": content.id,
+                                "content": [{"type": "text", "text": "All tools are now available."}]
+                            }]
+                        })
+                        continue
+
+                    if not widened and content.name in self.sessions and content.name not in selected_names:
+                        # The model reached for a tool outside the routed subset; stop trimming for this turn
+                        widened = True
+                        TOOL_ROUTER_WIDENED.inc()
+
+                    if content.name == READ_TOOL_RESULT_TOOL['name']:
+                        page = self.result_store.page(
+                            content.input.get('handle', ''),
+                            content.input.get('offset', 0),
+                            content.input.get('limit', 20),
+                            TOOL_RESULT_TOKEN_BUDGET,
+                        )
+                        self.chat_history.append({
+                            "role": "user",
+                            "content": [{
+                                "type": "tool_result",
+                                "tool_use_id": content.id,
+                                "content": [{"type": "text", "text": page}]
+                            }]
+                        })
+                        continue
+
                     session = self.sessions.get(content.name)
                     if not session:
                         error_msg = f"Tool '{content.name}' not found. This indicates an internal configuration error."
@@ -200,7 +367,14 @@ class MCP_ChatBot:
                         tool_arguments['user_id'] = self.user_id
 
                     try:
-                        result = await session.call_tool(content.name, arguments=tool_arguments)
+                        result_content = await self.call_tool(session, content.name, tool_arguments)
+                        result_content = compact_tool_result(
+                            content.name,
+                            result_content,
+                            self.result_store,
+                            TOOL_RESULT_TOKEN_BUDGET,
+                            TOOL_RESULT_PREVIEW_ROWS,
+                        )
                         # NO DIRECT PRINTING OF TOOL RESULT HERE.
                         # The tool result is added to chat history, and the model will generate the user-facing text.
                         self.chat_history.append({
@@ -208,7 +382,7 @@ class MCP_ChatBot:
                             "content": [{
                                 "type": "tool_result",
                                 "tool_use_id": content.id,
-                                "content": result.content # Add the raw tool result here
+                                "content": result_content # Add the raw tool result here
                             }]
                         })
                     except Exception as e:
@@ -232,6 +406,98 @@ class MCP_ChatBot:
 
         return "\n".join(aggregated_text_output).strip()
 
+    def recent_tool_names(self):
+        """Names of tools used in the (trimmed) chat history; they must stay available to the model."""
+        names = set()
+        for msg in self.chat_history:
+            if msg.get('role') != 'assistant' or not isinstance(msg.get('content'), list):
+                continue
+            for block in msg['content']:
+                block_type = getattr(block, 'type', None) or (block.get('type') if isinstance(block, dict) else None)
+                if block_type == 'tool_use':
+                    names.add(getattr(block, 'name', None) or block.get('name'))
+        return names
+
+    async def try_fast_path(self, query):
+        """Answer `query` directly from mongo tools if it is a simple, unambiguous command."""
+        if not self.user_id or fast_path.match(query) is None:
+            return None
+
+        async def call(tool_name, tool_arguments):
+            session = self.sessions.get(tool_name)
+            if not session:
+                raise LookupError(f"Tool '{tool_name}' not available")
+            return await self.call_tool(session, tool_name, tool_arguments)
+
+        with TRACER.span("chat.fast_path") as span:
+            try:
+                answered = await fast_path.answer(query, self.user_id, call)
+            except Exception as e:
+                print(f"Fast path failed, falling back to the LLM: {e}")
+                answered = None
+            if answered is None:
+                FAST_PATH_QUERIES.inc(intent=fast_path.match(query)[0], outcome='fallback')
+                return None
+            intent, reply = answered
+            span.set_attribute('intent', intent)
+            FAST_PATH_QUERIES.inc(intent=intent, outcome='answered')
+            return reply
+
+    async def create_message(self, tools, messages):
+        """Call anthropic messages.create with tracing, latency and token metrics."""
+        with TRACER.span("llm.messages.create", model=ANTHROPIC_MODEL, tools=len(tools)) as span:
+            try:
+                with LLM_SECONDS.time(model=ANTHROPIC_MODEL):
+                    # The Anthropic client is synchronous; run it off the event loop so other sessions keep moving
+                    response = await asyncio.to_thread(
+                        self.anthropic.messages.create,
+                        max_tokens=2024,
+                        model=ANTHROPIC_MODEL,
+                        tools=tools,
+                        messages=messages,
+                        system=self.system_prompt['content']
+                    )
+            except Exception:
+                LLM_ERRORS.inc(model=ANTHROPIC_MODEL)
+                raise
+            usage = getattr(response, 'usage', None)
+            if usage is not None:
+                LLM_TOKENS.inc(usage.input_tokens, model=ANTHROPIC_MODEL, direction='input')
+                LLM_TOKENS.inc(usage.output_tokens, model=ANTHROPIC_MODEL, direction='output')
+                span.set_attribute('input_tokens', usage.input_tokens)
+                span.set_attribute('output_tokens', usage.output_tokens)
+            return response
+
+    async def call_tool(self, session, tool_name, tool_arguments):
+        """Call an MCP tool through the shared read-through cache and return its content."""
+        user_id = tool_arguments.get('user_id')
+        cacheable = TOOL_CACHE.is_cacheable(tool_name)
+        with TRACER.span("tool.call", tool=tool_name) as span:
+            if cacheable:
+                cached = TOOL_CACHE.get(tool_name, user_id, tool_arguments)
+                if cached is not None:
+                    span.set_attribute('cache_hit', True)
+                    TOOL_CALLS.inc(tool=tool_name, status='cache_hit')
+                    return cached
+
+            try:
+                with TOOL_SECONDS.time(tool=tool_name):
+                    result = await session.send_request(call_tool_request(tool_name, tool_arguments), types.CallToolResult)
+            except Exception:
+                TOOL_CALLS.inc(tool=tool_name, status='error')
+                raise
+            finally:
+                # Invalidate even if the call failed part-way; the write may still have landed
+                TOOL_CACHE.invalidate_for_write(tool_name, user_id, tool_arguments)
+
+            is_error = bool(getattr(result, 'isError', False))
+            TOOL_CALLS.inc(tool=tool_name, status='error' if is_error else 'ok')
+            # Mongo tools report failures (timeouts, rejected queries, bad ids) in the content;
+            # caching those would replay a transient error until the TTL expires
+            if cacheable and not is_error and not is_error_content(result.content):
+                TOOL_CACHE.put(tool_name, user_id, tool_arguments, result.content)
+            return result.content
+
     async def ask(self, query: str) -> str:
         """Convenience wrapper to process a query and return assistant text."""
         return await self.process_query(query)
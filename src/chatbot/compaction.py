@@ -0,0 +1,174 @@
+import json
+import uuid
+from collections import OrderedDict
+
+# Rough heuristic used by Anthropic's docs: ~4 characters per token for English/JSON
+CHARS_PER_TOKEN = 4
+
+READ_TOOL_RESULT_TOOL = {
+    "name": "read_tool_result",
+    "description": (
+        "Page through a large tool result that was compacted before being shown to you. "
+        "Use the handle from the compacted result; offset/limit are rows for tabular results "
+        "and characters for text results."
+    ),
+    "input_schema": {
+        "type": "object",
+        "properties": {
+            "handle": {"type": "string", "description": "Handle returned in the compacted result"},
+            "offset": {"type": "integer", "description": "First row (or character) to return", "default": 0},
+            "limit": {"type": "integer", "description": "Maximum rows (or characters) to return", "default": 20},
+        },
+        "required": ["handle"],
+    },
+}
+
+
+def estimate_tokens(text: str) -> int:
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+# Content blocks that are not text (images, audio, embedded resources) are never compacted
+NON_TEXT_BLOCK_TYPES = {"image", "audio", "resource", "resource_link", "document"}
+
+
+def _is_non_text_block(item) -> bool:
+    block_type = item.get("type") if isinstance(item, dict) else getattr(item, "type", None)
+    return block_type in NON_TEXT_BLOCK_TYPES
+
+
+def _item_text(item) -> str:
+    if hasattr(item, "text"):
+        return item.text
+    if isinstance(item, dict) and "text" in item:
+        return item["text"]
+    return json.dumps(item, default=str)
+
+
+def _as_rows(texts):
+    """Interpret tool output as a list of JSON rows, or return None if it is free text."""
+    if len(texts) == 1:
+        try:
+            value = json.loads(texts[0])
+        except (TypeError, ValueError):
+            return None
+        return value if isinstance(value, list) else None
+    rows = []
+    for text in texts:
+        try:
+            rows.append(json.loads(text))
+        except (TypeError, ValueError):
+            return None
+    return rows
+
+
+def _field_stats(rows, max_fields: int = 30) -> dict:
+    """Per-field type, fill count and numeric range over all rows."""
+    stats = {}
+    for row in rows:
+        if not isinstance(row, dict):
+            continue
+        for key, value in row.items():
+            if key not in stats:
+                if len(stats) >= max_fields:
+                    continue
+                stats[key] = {"types": set(), "present": 0}
+            field = stats[key]
+            field["types"].add(type(value).__name__)
+            field["present"] += 1
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                field["min"] = value if "min" not in field else min(field["min"], value)
+                field["max"] = value if "max" not in field else max(field["max"], value)
+    for field in stats.values():
+        field["types"] = sorted(field["types"])
+    return stats
+
+
+class ToolResultStore:
+    """Keeps full payloads of compacted tool results so the model can page through them."""
+
+    def __init__(self, max_payloads: int = 32):
+        self.max_payloads = max_payloads
+        self._payloads = OrderedDict()
+
+    def __bool__(self):
+        return bool(self._payloads)
+
+    def put(self, tool_name: str, payload) -> str:
+        handle = f"{tool_name}-{uuid.uuid4().hex[:8]}"
+        self._payloads[handle] = payload
+        while len(self._payloads) > self.max_payloads:
+            self._payloads.popitem(last=False)
+        return handle
+
+    def page(self, handle: str, offset: int, limit: int, token_budget: int) -> str:
+        payload = self._payloads.get(handle)
+        if payload is None:
+            return json.dumps({"error": f"Unknown or expired handle '{handle}'. Re-run the original tool."})
+        self._payloads.move_to_end(handle)
+        offset = max(0, int(offset or 0))
+        limit = max(1, int(limit or 20))
+
+        if isinstance(payload, list):
+            while True:
+                body = json.dumps({
+                    "handle": handle,
+                    "offset": offset,
+                    "total_rows": len(payload),
+                    "rows": payload[offset:offset + limit],
+                }, default=str)
+                if limit == 1 or estimate_tokens(body) <= token_budget:
+                    return body
+                limit = max(1, limit // 2)
+
+        limit = min(limit, token_budget * CHARS_PER_TOKEN)
+        return json.dumps({
+            "handle": handle,
+            "offset": offset,
+            "total_chars": len(payload),
+            "text": payload[offset:offset + limit],
+        })
+
+
+def compact_tool_result(tool_name: str, content, store: ToolResultStore, token_budget: int, preview_rows: int = 10):
+    """
+    Return tool result content that fits within token_budget.
+
+    Small results are returned untouched. Large tabular results are replaced by a
+    summary (row count, per-field stats, first rows); large text is truncated. In
+    both cases the full payload is kept in `store` behind a handle for read_tool_result.
+    Non-text blocks such as images are passed through after the compacted text.
+    """
+    items = content if isinstance(content, list) else [content]
+    passthrough = [item for item in items if _is_non_text_block(item)]
+    texts = [_item_text(item) for item in items if not _is_non_text_block(item)]
+    if not texts or estimate_tokens("".join(texts)) <= token_budget:
+        return content
+
+    rows = _as_rows(texts)
+    if rows is not None:
+        handle = store.put(tool_name, rows)
+        summary = {
+            "compacted": True,
+            "handle": handle,
+            "total_rows": len(rows),
+            "fields": _field_stats(rows),
+            "preview": rows[:preview_rows],
+            "note": f"Result was too large to show in full. Call read_tool_result(handle='{handle}', offset, limit) for more rows.",
+        }
+        body = json.dumps(summary, default=str)
+        while estimate_tokens(body) > token_budget and summary["preview"]:
+            summary["preview"] = summary["preview"][:len(summary["preview"]) // 2]
+            body = json.dumps(summary, default=str)
+        return [{"type": "text", "text": body}, *passthrough]
+
+    full_text = "\n".join(texts)
+    handle = store.put(tool_name, full_text)
+    head = full_text[:token_budget * CHARS_PER_TOKEN]
+    return [{
+        "type": "text",
+        "text": (
+            f"{head}\n\n[Truncated: showing {len(head)} of {len(full_text)} characters. "
+            f"Call read_tool_result(handle='{handle}', offset={len(head)}) for more.]"
+        ),
+    }, *passthrough]
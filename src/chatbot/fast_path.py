@@ -0,0 +1,212 @@
+"""
+Rule-based fast path for simple data commands.
+
+Queries such as "list my collections", "count documents in friends" or
+"show contacts where city is Haifa" are matched against a small set of
+patterns, answered by calling the existing mongo_server tools directly and
+phrased from a template, without an LLM round-trip. A match is only acted on
+when the referenced collection (and field, for filters) actually exists;
+anything else returns None so the caller falls back to the LLM.
+"""
+import json
+import re
+
+_COLL = r"(?:the\s+|my\s+)?['\"]?(?P<coll>[\w.-]+)['\"]?(?:\s+collection)?"
+_WHERE = r"\s+(?:where|with|whose)\s+(?P<field>[\w.]+)\s+(?:is|=|==|equals)\s+(?P<value>.+)"
+_DOCS = r"(?:documents|docs|records|entries|items|rows)"
+
+# (intent, pattern) in priority order; patterns must match the whole query
+PATTERNS = [
+    ("schema", re.compile(
+        r"(?:(?:what\s+is|what's|show(?:\s+me)?|get)\s+)?(?:the\s+)?(?:schema|fields)\s+(?:of|for|in)\s+" + _COLL, re.I)),
+    ("schema", re.compile(r"describe\s+" + _COLL, re.I)),
+    ("list_collections", re.compile(
+        r"(?:(?:list|show|get)(?:\s+me)?(?:\s+all)?(?:\s+of)?\s+my\s+collections"
+        r"|(?:what|which)\s+collections\s+do\s+i\s+have"
+        r"|what\s+are\s+my\s+collections)", re.I)),
+    ("count", re.compile(
+        r"(?:count|how\s+many)(?:\s+" + _DOCS + r")?\s+(?:are\s+)?(?:there\s+)?in\s+" + _COLL + f"(?:{_WHERE})?", re.I)),
+    ("count", re.compile(r"how\s+many\s+(?P<coll>[\w.-]+)\s+do\s+i\s+have", re.I)),
+    ("find", re.compile(
+        r"(?:show|find|list|get|display)(?:\s+me)?(?:\s+all)?(?:\s+(?:the\s+)?" + _DOCS + r")?(?:\s+(?:in|from))?\s+"
+        + _COLL + _WHERE, re.I)),
+    ("all_documents", re.compile(
+        r"(?:show|list|get|display)(?:\s+me)?(?:\s+all)?(?:\s+(?:the|my))?\s+" + _DOCS + r"\s+(?:in|from)\s+" + _COLL, re.I)),
+]
+
+MAX_LISTED_ROWS = 20
+
+# A filter value holding any of these is more than one equality test ("Bob and city is Haifa",
+# "not Bob", "over 30", "Tel Aviv, Haifa"); the fast path cannot express it, so it falls back
+_COMPOUND_VALUE = re.compile(
+    r"[,<>!]|\b(?:and|or|nor|not|but|except|over|under|above|below|greater|less|more|fewer"
+    r"|before|after|between|than|since|until)\b",
+    re.I,
+)
+
+# Schema types a spoken value can be converted to; anything else (dates, lists, ids) falls back
+_COERCIBLE_TYPES = {"str", "int", "float", "bool"}
+
+
+def _normalize(query: str) -> str:
+    return re.sub(r"\s+", " ", query).strip().rstrip("?.!").strip()
+
+
+def _texts(content) -> list:
+    return [item.text if hasattr(item, "text") else item.get("text", "") for item in content or []]
+
+
+def _json_items(content) -> list:
+    items = []
+    for text in _texts(content):
+        try:
+            items.append(json.loads(text))
+        except ValueError:
+            items.append(text)
+    return items
+
+
+def _is_error(items) -> bool:
+    for item in items:
+        if isinstance(item, dict) and "error" in item:
+            return True
+        if isinstance(item, str) and item.startswith("Error"):
+            return True
+    return False
+
+
+def _resolve_collection(name: str, collections) -> str:
+    """Map a spoken collection name onto an existing one (case and simple plural insensitive)."""
+    wanted = name.lower()
+    candidates = {wanted, wanted + "s", wanted[:-1] if wanted.endswith("s") else wanted}
+    for collection in collections:
+        if collection.lower() == wanted:
+            return collection
+    for collection in collections:
+        if collection.lower() in candidates:
+            return collection
+    return None
+
+
+def _coerce(value: str, type_name: str):
+    """Convert a spoken filter value to the field's type, or None when that is not safe."""
+    if type_name not in _COERCIBLE_TYPES or _COMPOUND_VALUE.search(value):
+        return None
+    value = value.strip().strip("'\"")
+    if not value:
+        return None
+    try:
+        if type_name == "int":
+            return int(value)
+        if type_name == "float":
+            return float(value)
+    except ValueError:
+        return None
+    if type_name == "bool":
+        lowered = value.lower()
+        if lowered in ("true", "yes"):
+            return True
+        if lowered in ("false", "no"):
+            return False
+        return None
+    return value
+
+
+def _format_row(row) -> str:
+    if not isinstance(row, dict):
+        return str(row)
+    return ", ".join(f"{key}: {value}" for key, value in row.items() if key != "_id")
+
+
+def _format_rows(rows) -> str:
+    lines = [f"- {_format_row(row)}" for row in rows[:MAX_LISTED_ROWS]]
+    if len(rows) > MAX_LISTED_ROWS:
+        lines.append(f"...and {len(rows) - MAX_LISTED_ROWS} more.")
+    return "\n".join(lines)
+
+
+def match(query: str):
+    """Return (intent, groups) for the first pattern that matches the whole query, else None."""
+    text = _normalize(query)
+    for intent, pattern in PATTERNS:
+        found = pattern.fullmatch(text)
+        if found:
+            return intent, {k: v for k, v in found.groupdict().items() if v is not None}
+    return None
+
+
+async def answer(query: str, user_id: str, call_tool):
+    """
+    Try to answer `query` without the LLM.
+
+    `call_tool(name, arguments)` must call an MCP tool and return its content.
+    Returns (intent, reply) on success, or None when the query should go to the LLM.
+    """
+    matched = match(query)
+    if matched is None:
+        return None
+    intent, groups = matched
+
+    collections = _json_items(await call_tool("get_user_collections", {"user_id": user_id}))
+    if _is_error(collections):
+        return None
+
+    if intent == "list_collections":
+        if not collections:
+            return intent, "You don't have any collections yet."
+        return intent, f"You have {len(collections)} collection(s): {', '.join(collections)}."
+
+    collection = _resolve_collection(groups["coll"], collections)
+    if collection is None:
+        return None
+
+    schema_items = _json_items(await call_tool("get_collection_schema", {"user_id": user_id, "collection_name": collection}))
+    schema = schema_items[0] if schema_items and isinstance(schema_items[0], dict) else {}
+    if "error" in schema:
+        return None
+
+    if intent == "schema":
+        if "info" in schema or not schema:
+            return intent, f"The '{collection}' collection is empty, so it has no fields yet."
+        fields = ", ".join(f"{field} ({type_name})" for field, type_name in schema.items())
+        return intent, f"The '{collection}' collection has these fields: {fields}."
+
+    filter_query, condition = {}, ""
+    if "field" in groups:
+        fields = {field.lower(): field for field in schema if field != "info"}
+        field = fields.get(groups["field"].lower())
+        if field is None:
+            return None
+        value = _coerce(groups["value"], schema[field])
+        if value is None:
+            return None
+        if isinstance(value, str):
+            # People rarely type the stored casing ("haifa" for "Haifa"); match it anchored but case-insensitively
+            filter_query = {field: {"$regex": f"^{re.escape(value)}$", "$options": "i"}}
+        else:
+            filter_query = {field: value}
+        condition = f" where {field} is {value}"
+
+    if intent == "count":
+        items = _json_items(await call_tool("count_documents", {
+            "user_id": user_id, "collection_name": collection, "filter_query": filter_query,
+        }))
+        if len(items) != 1 or not isinstance(items[0], int):
+            return None
+        if filter_query and items[0] == 0:
+            return None  # The value may be spelled or typed differently from the data; let the LLM look
+        return intent, f"There are {items[0]} document(s) in '{collection}'{condition}."
+
+    if intent == "find":
+        rows = _json_items(await call_tool("find_documents_by_filter", {
+            "user_id": user_id, "collection_name": collection, "filter_query": filter_query,
+        }))
+    else:
+        rows = _json_items(await call_tool("get_all_documents", {"user_id": user_id, "collection_name": collection}))
+    if _is_error(rows):
+        return None
+    if not rows:
+        if filter_query:
+            return None  # As for count: an empty filtered result is not a confident answer
+        return intent, f"No documents found in '{collection}'{condition}."
+    return intent, f"Found {len(rows)} document(s) in '{collection}'{condition}:\n{_format_rows(rows)}"
@@ -0,0 +1,166 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+
+# Tools whose results only depend on their arguments and the current data
+READ_TOOLS = {
+    "get_user_collections",
+    "get_collection_schema",
+    "find_documents_by_filter",
+    "find_document_by_id",
+    "find_documents_by_ids",
+    "count_documents",
+    "get_all_documents",
+}
+
+# Tools that change data; their (user, collection) entries are dropped after they run
+WRITE_TOOLS = {
+    "create_user_collection_only",
+    "insert_to_collection",
+    "update_document_by_id",
+    "update_documents_by_filter",
+    "delete_document_by_id",
+    "delete_documents_by_filter",
+    "update_collection_schema_fields",
+    "delete_entire_collection",
+}
+
+# Writes that also change the collection list, so user-level entries must go too
+COLLECTION_LEVEL_WRITES = {
+    "create_user_collection_only",
+    "update_collection_schema_fields",
+    "delete_entire_collection",
+}
+
+
+def normalize_arguments(arguments: dict) -> str:
+    """Stable string form of tool arguments so equivalent calls share a key."""
+    return json.dumps(arguments or {}, sort_keys=True, default=str, separators=(",", ":"))
+
+
+class ToolResultCache:
+    """
+    TTL + LRU cache for idempotent MCP tool results.
+
+    Entries are keyed by (tool name, user, normalized arguments) and indexed by
+    (user, collection) so a write tool can invalidate exactly what it touched.
+    The cache is shared by every chatbot session in the process.
+    """
+
+    def __init__(self, max_entries: int = 512, ttl_seconds: float = 60.0):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()  # key -> (expires_at, scope, value)
+        self._scopes = {}  # (user, collection) -> set of keys
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def is_cacheable(tool_name: str) -> bool:
+        return tool_name in READ_TOOLS
+
+    @staticmethod
+    def _scope(user_id, arguments: dict):
+        return (user_id, (arguments or {}).get("collection_name"))
+
+    @staticmethod
+    def _key(tool_name: str, user_id, arguments: dict):
+        return (tool_name, user_id, normalize_arguments(arguments))
+
+    def get(self, tool_name: str, user_id, arguments: dict):
+        """Return the cached value or None on miss/expiry."""
+        key = self._key(tool_name, user_id, arguments)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, _, value = entry
+            if expires_at < time.monotonic():
+                self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, tool_name: str, user_id, arguments: dict, value) -> None:
+        key = self._key(tool_name, user_id, arguments)
+        scope = self._scope(user_id, arguments)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, scope, value)
+            self._scopes.setdefault(scope, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def invalidate(self, user_id, collection_name=None, include_user_level: bool = False) -> int:
+        """
+        Drop entries for (user, collection). With include_user_level, entries that are
+        not tied to a collection (e.g. get_user_collections) are dropped as well.
+        Passing collection_name=None drops everything cached for the user.
+        """
+        with self._lock:
+            if collection_name is None:
+                scopes = [s for s in self._scopes if s[0] == user_id]
+            else:
+                scopes = [(user_id, collection_name)]
+                if include_user_level:
+                    scopes.append((user_id, None))
+            removed = 0
+            for scope in scopes:
+                for key in list(self._scopes.get(scope, ())):
+                    self._remove(key)
+                    removed += 1
+            self.invalidations += removed
+            return removed
+
+    def invalidate_for_write(self, tool_name: str, user_id, arguments: dict) -> int:
+        """Invalidate whatever a write tool may have changed. No-op for other tools."""
+        if tool_name not in WRITE_TOOLS:
+            return 0
+        collection_name = (arguments or {}).get("collection_name")
+        return self.invalidate(
+            user_id,
+            collection_name,
+            include_user_level=tool_name in COLLECTION_LEVEL_WRITES,
+        )
+
+    def clear(self) -> int:
+        """Drop every entry, e.g. after a change whose owner is unknown."""
+        with self._lock:
+            removed = len(self._entries)
+            self._entries.clear()
+            self._scopes.clear()
+            self.invalidations += removed
+            return removed
+
+    def _remove(self, key) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        scope = entry[1]
+        keys = self._scopes.get(scope)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._scopes[scope]
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
@@ -0,0 +1,97 @@
+"""
+Per-query tool selection.
+
+Every connected MCP server contributes tools, and sending all of their JSON
+schemas with each messages.create call costs input tokens and latency. The
+router ranks tools against the current query with BM25 over their names,
+descriptions and parameter names, and returns the top-K plus pinned tools and
+any tools used recently in the conversation. If the query has no signal at all, every tool is
+sent. The model can ask for the rest with the request_more_tools tool.
+"""
+from src.retrieval import BM25Index, tokenize
+
+# Everyday words mapped onto the vocabulary tool descriptions use
+QUERY_EXPANSIONS = {
+    "add": "insert document",
+    "save": "insert document",
+    "store": "insert document",
+    "remember": "insert document",
+    "remove": "delete",
+    "erase": "delete",
+    "drop": "delete collection",
+    "change": "update",
+    "edit": "update",
+    "set": "update",
+    "rename": "update",
+    "many": "count",
+    "number": "count",
+    "total": "count",
+    "show": "find get",
+    "list": "get find",
+    "who": "find document filter",
+    "which": "find document filter",
+    "where": "find document filter",
+    "lookup": "find",
+    "search": "find",
+    "field": "schema",
+    "column": "schema",
+    "structure": "schema",
+    "table": "collection",
+    "paper": "search paper",
+    "article": "search paper",
+    "arxiv": "search paper",
+    "research": "search paper",
+    "url": "fetch",
+    "website": "fetch",
+    "web": "fetch",
+    "directory": "file",
+    "folder": "directory file",
+}
+
+REQUEST_MORE_TOOLS_TOOL = {
+    "name": "request_more_tools",
+    "description": (
+        "Only a subset of tools is currently available. Call this if none of them fits the "
+        "user's request; every tool will be made available for the rest of this turn."
+    ),
+    "input_schema": {
+        "type": "object",
+        "properties": {
+            "reason": {"type": "string", "description": "What you need to do that the current tools cannot"},
+        },
+    },
+}
+
+
+def _tool_document(tool: dict) -> str:
+    schema = tool.get("input_schema") or {}
+    parts = [tool["name"], tool["name"], tool.get("description") or ""]
+    for name, prop in (schema.get("properties") or {}).items():
+        parts.append(name)
+        if isinstance(prop, dict):
+            parts.append(prop.get("description", ""))
+    return " ".join(parts)
+
+
+class ToolRouter:
+    def __init__(self, tools, top_k: int = 8, pinned=()):
+        self.tools = list(tools)
+        self.top_k = top_k
+        self.pinned = set(pinned)  # Always sent when present, e.g. tools the system prompt relies on
+        self._index = BM25Index([_tool_document(tool) for tool in self.tools])
+
+    def select(self, query: str, recent_tool_names=()) -> list:
+        """
+        Return the tools to send for `query`, in their original order.
+        Returns every tool when routing is disabled, trims nothing, or finds no match.
+        """
+        if self.top_k <= 0 or len(self.tools) <= self.top_k:
+            return self.tools
+        expanded = " ".join([query] + [QUERY_EXPANSIONS[t] for t in tokenize(query) if t in QUERY_EXPANSIONS])
+        ranked = self._index.top(expanded, self.top_k)
+        if not ranked:
+            return self.tools
+        chosen = {index for index, _ in ranked}
+        keep = self.pinned | set(recent_tool_names)
+        chosen.update(i for i, tool in enumerate(self.tools) if tool["name"] in keep)
+        return [tool for i, tool in enumerate(self.tools) if i in chosen]
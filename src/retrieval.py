@@ -0,0 +1,63 @@
+"""Small dependency-free BM25 index used for ranking tools and text chunks."""
+import math
+import re
+from collections import Counter
+
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "do", "for", "from", "have", "i", "in", "is",
+    "it", "me", "my", "of", "on", "or", "please", "that", "the", "this", "to", "what", "with", "you",
+}
+
+
+def tokenize(text: str) -> list:
+    """Lowercase word tokens with snake_case split and a crude plural strip."""
+    tokens = []
+    for token in re.findall(r"[a-z0-9]+", (text or "").replace("_", " ").lower()):
+        if token in STOPWORDS:
+            continue
+        if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+
+class BM25Index:
+    def __init__(self, documents, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._docs = [Counter(tokenize(doc)) for doc in documents]
+        self._lengths = [sum(doc.values()) for doc in self._docs]
+        self._avg_length = (sum(self._lengths) / len(self._lengths)) if self._lengths else 0.0
+        document_frequency = Counter()
+        for doc in self._docs:
+            document_frequency.update(doc.keys())
+        total = len(self._docs)
+        self._idf = {
+            term: math.log(1 + (total - freq + 0.5) / (freq + 0.5))
+            for term, freq in document_frequency.items()
+        }
+
+    def __len__(self):
+        return len(self._docs)
+
+    def scores(self, query: str) -> list:
+        terms = tokenize(query)
+        results = []
+        for doc, length in zip(self._docs, self._lengths):
+            score = 0.0
+            norm = self.k1 * (1 - self.b + self.b * length / self._avg_length) if self._avg_length else self.k1
+            for term in terms:
+                freq = doc.get(term)
+                if freq:
+                    score += self._idf[term] * freq * (self.k1 + 1) / (freq + norm)
+            results.append(score)
+        return results
+
+    def top(self, query: str, k: int) -> list:
+        """Return up to k (index, score) pairs with a positive score, best first."""
+        ranked = sorted(
+            ((i, score) for i, score in enumerate(self.scores(query)) if score > 0),
+            key=lambda pair: pair[1],
+            reverse=True,
+        )
+        return ranked[:k]
@@ -0,0 +1,123 @@
+"""
+arXiv queries shared by search_papers and search_papers_batch.
+
+arXiv asks API clients to make at most one request every three seconds. The
+arxiv package only spaces requests made through the same Client, so every
+query here first takes a token from one shared bucket, no matter which tool or
+worker thread issues it. With stdio transport every chat session spawns its own
+server process, so the research server keeps the bucket's state in a locked
+file under PAPER_DIR, and all of those processes draw from the same bucket.
+"""
+import itertools
+import os
+import threading
+import time
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+ARXIV_API_URL = os.environ.get("ARXIV_API_URL")
+ARXIV_REQUEST_INTERVAL = float(os.environ.get("ARXIV_REQUEST_INTERVAL", "3.0"))
+ARXIV_PAGE_SIZE = 100
+
+
+class TokenBucket:
+    """Thread-safe token bucket; acquire() blocks until a token is available.
+
+    With a state_path the tokens live in that file, under an exclusive lock, so every
+    process using the same path shares one bucket (no-op locking where fcntl is unavailable).
+    """
+
+    def __init__(self, interval_seconds: float, capacity: int = 1, state_path: Path = None):
+        self.interval = interval_seconds
+        self.capacity = capacity
+        self.state_path = state_path
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _take(self, tokens: float, updated: float, now: float) -> tuple:
+        """Refill since `updated` and take a token. Returns (tokens left, seconds to wait)."""
+        if self.interval > 0:
+            tokens = min(self.capacity, tokens + max(0.0, now - updated) / self.interval)
+        else:
+            tokens = self.capacity
+        if tokens >= 1:
+            return tokens - 1, 0.0
+        return tokens, (1 - tokens) * self.interval
+
+    def _take_shared(self) -> float:
+        self.state_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.state_path, "a+", encoding="utf-8") as handle:
+            if fcntl is not None:
+                fcntl.flock(handle, fcntl.LOCK_EX)
+            # Wall-clock time, since monotonic clocks are not comparable between processes
+            now = time.time()
+            handle.seek(0)
+            try:
+                tokens, updated = (float(value) for value in handle.read().split())
+            except ValueError:
+                tokens, updated = float(self.capacity), now
+            tokens, delay = self._take(tokens, updated, now)
+            handle.seek(0)
+            handle.truncate()
+            handle.write(f"{tokens} {now}")
+            handle.flush()
+        return delay
+
+    def acquire(self) -> float:
+        """Take one token, sleeping as needed. Returns the seconds spent waiting."""
+        waited = 0.0
+        while True:
+            with self._lock:
+                if self.state_path is None:
+                    now = time.monotonic()
+                    self._tokens, delay = self._take(self._tokens, self._updated, now)
+                    self._updated = now
+                else:
+                    delay = self._take_shared()
+            if not delay:
+                return waited
+            time.sleep(delay)
+            waited += delay
+
+
+ARXIV_BUCKET = TokenBucket(ARXIV_REQUEST_INTERVAL)
+
+
+def fetch_papers(topic: str, max_results: int) -> dict:
+    """Query arXiv for `topic`. Returns {short_id: paper_info} in relevance order."""
+    # Imported here so the server starts (and completes the MCP handshake) without loading arxiv
+    import arxiv
+
+    client = arxiv.Client(page_size=max(1, min(max_results, ARXIV_PAGE_SIZE)), delay_seconds=0)
+    if ARXIV_API_URL:
+        client.query_url_format = ARXIV_API_URL + "?{}"
+
+    search = arxiv.Search(
+        query=topic,
+        max_results=max_results,
+        sort_by=arxiv.SortCriterion.Relevance,
+    )
+
+    papers = {}
+    results = client.results(search)
+    for position in itertools.count():
+        # The client fetches a page when the previous one is used up and more results are
+        # wanted; take a token first, but not for the lookup that only finds the end
+        if position == 0 or (position % client.page_size == 0 and position < max_results):
+            ARXIV_BUCKET.acquire()
+        paper = next(results, None)
+        if paper is None:
+            break
+        papers[paper.get_short_id()] = {
+            'title': paper.title,
+            'authors': [author.name for author in paper.authors],
+            'summary': paper.summary,
+            'pdf_url': paper.pdf_url,
+            'published': str(paper.published.date())
+        }
+    return papers
@@ -0,0 +1,130 @@
+"""
+Move per-user databases into the shared tenancy layout (TENANCY_MODE=shared).
+
+Every collection of each user database is copied in _id-ordered batches into
+SHARED_DB_NAME.documents with the tenant and collection fields added, and its
+name is registered in the catalog. Copying keeps the original _id, so running
+the script again skips documents that were already moved and picks up where an
+interrupted run stopped. Source databases are only dropped with --drop-source,
+and only when every collection's count matches and no _id clashed with another
+tenant's document.
+
+    python -m src.servers.migrate_tenancy --dry-run
+    python -m src.servers.migrate_tenancy --users 64f1c0... 64f1c1...
+    python -m src.servers.migrate_tenancy --drop-source
+"""
+import argparse
+import os
+import sys
+from pathlib import Path
+
+from bson.objectid import ObjectId
+from dotenv import load_dotenv
+
+ROOT_DIR = Path(__file__).resolve().parents[2]
+
+try:
+    from src.servers.tenancy import COLLECTION_FIELD, TENANT_FIELD, SharedTenancy
+except ModuleNotFoundError:
+    if str(ROOT_DIR) not in sys.path:
+        sys.path.append(str(ROOT_DIR))
+    from src.servers.tenancy import COLLECTION_FIELD, TENANT_FIELD, SharedTenancy
+
+load_dotenv()
+
+SYSTEM_DATABASES = {"admin", "local", "config"}
+DUPLICATE_KEY = 11000
+
+
+def user_databases(client, excluded) -> list:
+    """User databases are named after the user's ObjectId (see /api/login)."""
+    return [
+        name for name in client.list_database_names()
+        if name not in excluded and ObjectId.is_valid(name)
+    ]
+
+
+def copy_collection(source, shared: SharedTenancy, user_id: str, name: str, batch_size: int, dry_run: bool) -> dict:
+    from pymongo.errors import BulkWriteError
+
+    stats = {"collection": name, "source": source.count_documents({}), "copied": 0, "skipped": 0, "conflicts": 0}
+    if dry_run:
+        return stats
+
+    shared.create_collection(user_id, name)
+    scope = {TENANT_FIELD: user_id, COLLECTION_FIELD: name}
+    last_id = None
+    while True:
+        query = {} if last_id is None else {"_id": {"$gt": last_id}}
+        batch = list(source.find(query).sort("_id", 1).limit(batch_size))
+        if not batch:
+            break
+        last_id = batch[-1]["_id"]
+        try:
+            result = shared.data.insert_many([{**doc, **scope} for doc in batch], ordered=False)
+            stats["copied"] += len(result.inserted_ids)
+        except BulkWriteError as e:
+            errors = e.details.get("writeErrors", [])
+            stats["copied"] += e.details.get("nInserted", 0)
+            for error in errors:
+                if error.get("code") != DUPLICATE_KEY:
+                    raise
+                doc_id = batch[error["index"]]["_id"]
+                # Already moved by an earlier run, or an _id owned by someone else?
+                if shared.data.count_documents({"_id": doc_id, **scope}, limit=1):
+                    stats["skipped"] += 1
+                else:
+                    stats["conflicts"] += 1
+                    print(f"  conflict: {user_id}.{name} _id={doc_id} already belongs to another tenant", file=sys.stderr)
+    return stats
+
+
+def migrate_user(client, shared: SharedTenancy, user_id: str, batch_size: int, dry_run: bool, drop_source: bool) -> bool:
+    user_db = client[user_id]
+    names = [name for name in user_db.list_collection_names() if not name.startswith("system.")]
+    clean = True
+    for name in names:
+        stats = copy_collection(user_db[name], shared, user_id, name, batch_size, dry_run)
+        if not dry_run:
+            target = shared.data.count_documents({TENANT_FIELD: user_id, COLLECTION_FIELD: name})
+            stats["target"] = target
+            clean = clean and stats["conflicts"] == 0 and target == stats["source"]
+        print(f"{user_id}.{name}: {stats}")
+
+    if drop_source and not dry_run:
+        if clean:
+            client.drop_database(user_id)
+            print(f"{user_id}: source database dropped")
+        else:
+            print(f"{user_id}: counts differ or conflicts found; source database kept", file=sys.stderr)
+    return clean
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Move per-user databases into the shared tenancy collection")
+    parser.add_argument("--mongo-uri", default=os.environ.get("MONGO_URI", "mongodb://localhost:27017/"))
+    parser.add_argument("--shared-db", default=os.environ.get("SHARED_DB_NAME", "datalo"))
+    parser.add_argument("--users", nargs="+", help="User ids to migrate (default: every ObjectId-named database)")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--dry-run", action="store_true", help="Only report what would be copied")
+    parser.add_argument("--drop-source", action="store_true", help="Drop each user database once it is fully copied")
+    args = parser.parse_args()
+
+    from pymongo import MongoClient
+
+    client = MongoClient(args.mongo_uri)
+    excluded = SYSTEM_DATABASES | {
+        args.shared_db,
+        os.environ.get("JOBS_DB_NAME", "datalo_jobs"),
+        os.environ.get("USERS_DB_NAME", "admin"),
+    }
+    users = args.users or user_databases(client, excluded)
+    shared = None if args.dry_run else SharedTenancy(client[args.shared_db])  # Creates the indexes
+
+    failed = [user_id for user_id in users if not migrate_user(client, shared, user_id, args.batch_size, args.dry_run, args.drop_source)]
+    print(f"Migrated {len(users) - len(failed)}/{len(users)} user databases into '{args.shared_db}'.")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
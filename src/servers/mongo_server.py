@@ -1,12 +1,190 @@
 from mcp.server.fastmcp import FastMCP
-from pymongo import MongoClient
 from bson.objectid import ObjectId
-
-mongo_client = MongoClient("mongodb://localhost:27017/")
+from dotenv import load_dotenv
+from pathlib import Path
+import asyncio
+import functools
+import os
+import sys
+import threading
+import time
+
+ROOT_DIR = Path(__file__).resolve().parents[2]
+
+# Support both `python -m src.servers.mongo_server` and direct script execution
+try:
+    from src.telemetry import REGISTRY, MetricsFileWriter, get_tracer
+except ModuleNotFoundError:
+    if str(ROOT_DIR) not in sys.path:
+        sys.path.append(str(ROOT_DIR))
+    from src.telemetry import REGISTRY, MetricsFileWriter, get_tracer
+from src.change_feed import ChangeOutbox
+from src.servers.transport import run_server
+from src.servers.schema_jobs import SchemaMigrationRunner, describe_job
+from src.servers.tenancy import create_tenancy
+from src.servers.query_guard import QueryGuard
+from src.tool_results import is_error_result
+
+load_dotenv()
+
+MONGO_URI = os.environ.get("MONGO_URI", "mongodb://localhost:27017/")
+
+
+def create_mongo_client():
+    """Connect to MONGO_URI; `mongomock://` gives an in-memory database for benchmarks."""
+    if MONGO_URI.startswith("mongomock://"):
+        import mongomock
+        return mongomock.MongoClient()
+    from pymongo import MongoClient
+    return MongoClient(MONGO_URI)
+
+
+_mongo_client = None
+# Tools run in worker threads, so first use can happen on several threads at once
+_init_lock = threading.Lock()
+
+
+def get_mongo_client():
+    """
+    Create the client on first use rather than at import, so the MCP handshake
+    does not wait for pymongo to load and the client to start its monitors.
+    """
+    global _mongo_client
+    if _mongo_client is None:
+        with _init_lock:
+            if _mongo_client is None:
+                _mongo_client = create_mongo_client()
+    return _mongo_client
+
+# "database": one database per user (default). "shared": all users in one collection of SHARED_DB_NAME.
+TENANCY_MODE = os.environ.get("TENANCY_MODE", "database")
+SHARED_DB_NAME = os.environ.get("SHARED_DB_NAME", "datalo")
+_tenancy = None
+
+
+def get_tenancy():
+    """Resolve user_id + collection name to storage according to TENANCY_MODE."""
+    global _tenancy
+    if _tenancy is None:
+        client = get_mongo_client()
+        with _init_lock:
+            if _tenancy is None:
+                _tenancy = create_tenancy(client, TENANCY_MODE, SHARED_DB_NAME)
+    return _tenancy
+
+
+def get_collection(user_id: str, collection_name: str):
+    return get_tenancy().collection(user_id, collection_name)
+
+
+def list_collections(user_id: str) -> list:
+    return get_tenancy().list_collection_names(user_id)
+
+# Successful writes are appended to a capped outbox so the API can invalidate caches and
+# notify clients even where MongoDB change streams are unavailable (standalone mongod)
+CHANGE_FEED_DB = os.environ.get("CHANGE_FEED_DB", "datalo_events")
+change_outbox = ChangeOutbox(
+    lambda: get_mongo_client()[CHANGE_FEED_DB],
+    enabled=os.environ.get("CHANGE_OUTBOX", "1") == "1",
+)
+
+# Write tools and the change operation they publish
+CHANGE_OPERATIONS = {
+    "create_user_collection_only": "create",
+    "insert_to_collection": "insert",
+    "update_document_by_id": "update",
+    "update_documents_by_filter": "update",
+    "delete_document_by_id": "delete",
+    "delete_documents_by_filter": "delete",
+    "update_collection_schema_fields": "update",
+    "delete_entire_collection": "drop",
+}
 
 mcp = FastMCP("mongo")
 
+# Schema migrations run in the background; progress lives in JOBS_DB_NAME so jobs can resume
+JOBS_DB_NAME = os.environ.get("JOBS_DB_NAME", "datalo_jobs")
+schema_jobs = SchemaMigrationRunner(
+    jobs_collection=lambda: get_mongo_client()[JOBS_DB_NAME]["schema_migrations"],
+    target_collection=get_collection,
+    batch_size=int(os.environ.get("SCHEMA_JOB_BATCH_SIZE", "500")),
+    throttle_seconds=float(os.environ.get("SCHEMA_JOB_THROTTLE_SECONDS", "0.05")),
+    on_batch=lambda user_id, collection_name: change_outbox.record(user_id, collection_name, "update"),
+)
+
+TRACER = get_tracer("mongo_server")
+TOOL_SECONDS = REGISTRY.histogram("mongo_tool_seconds", "Latency of mongo_server tools, including MongoDB round-trips", ["tool"])
+TOOL_CALLS = REGISTRY.counter("mongo_tool_calls_total", "mongo_server tool calls by outcome (ok, error)", ["tool", "status"])
+QUERY_TIMEOUTS = REGISTRY.counter("mongo_query_timeouts_total", "Queries stopped by their time limit", ["tool"])
+QUERY_REJECTED = REGISTRY.counter("mongo_query_rejected_total", "Queries refused by the explain pre-flight", ["tool"])
+
+# Filters come from the LLM, so bound what one query may cost. Writes get a longer limit
+# because they touch every matching document.
+QUERY_MAX_TIME_MS = int(os.environ.get("QUERY_MAX_TIME_MS", "5000"))
+WRITE_MAX_TIME_MS = int(os.environ.get("WRITE_MAX_TIME_MS", "15000"))
+query_guard = QueryGuard(
+    max_time_ms={
+        "find_documents_by_filter": QUERY_MAX_TIME_MS,
+        "count_documents": QUERY_MAX_TIME_MS,
+        "find_documents_by_ids": QUERY_MAX_TIME_MS,
+        "update_documents_by_filter": WRITE_MAX_TIME_MS,
+        "delete_documents_by_filter": WRITE_MAX_TIME_MS,
+    },
+    default_max_time_ms=QUERY_MAX_TIME_MS,
+    explain=os.environ.get("QUERY_EXPLAIN_GUARD", "0") == "1",
+    scan_limit=int(os.environ.get("QUERY_SCAN_LIMIT", "100000")),
+    on_timeout=lambda tool: QUERY_TIMEOUTS.inc(tool=tool),
+    on_reject=lambda tool: QUERY_REJECTED.inc(tool=tool),
+)
+
+
+def client_traceparent():
+    """The traceparent the chatbot sent in the tools/call _meta, if any."""
+    try:
+        meta = mcp.get_context().request_context.meta
+    except ValueError:
+        return None  # Called outside an MCP request
+    return getattr(meta, "traceparent", None) if meta is not None else None
+
+
+def instrumented(func):
+    """
+    Record latency, outcome and a trace span for a tool, and publish a change event
+    after a successful write. Apply below @mcp.tool().
+
+    The tool body and the outbox insert are blocking pymongo code, so they run in a worker
+    thread; otherwise one slow query would stall every session sharing an HTTP server's
+    event loop.
+    """
+    operation = CHANGE_OPERATIONS.get(func.__name__)
+
+    def call_and_record(*args, **kwargs):
+        result = func(*args, **kwargs)
+        if operation and not is_error_result(result):
+            change_outbox.record(kwargs.get("user_id"), kwargs.get("collection_name"), operation)
+        return result
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        with TRACER.span(
+            f"mongo.{func.__name__}", traceparent=client_traceparent(), collection=kwargs.get("collection_name", "")
+        ) as span:
+            start = time.perf_counter()
+            status = "error"
+            try:
+                result = await asyncio.to_thread(call_and_record, *args, **kwargs)
+                if is_error_result(result):
+                    span.error = str(result)[:200]
+                else:
+                    status = "ok"
+                return result
+            finally:
+                TOOL_SECONDS.observe(time.perf_counter() - start, tool=func.__name__)
+                TOOL_CALLS.inc(tool=func.__name__, status=status)
+    return wrapper
+
 @mcp.tool()
+@instrumented
 def create_user_collection_only(
     user_id: str, # user_id is now mandatory
     collection_name: str = "main"
@@ -23,12 +201,10 @@ def create_user_collection_only(
         Confirmation string
     """
     try:
-        user_db = mongo_client[user_id] # This line correctly uses the dynamic user_id
-
-        if collection_name in user_db.list_collection_names():
+        if collection_name in list_collections(user_id):
             return f"Collection '{collection_name}' already exists in DB '{user_id}'."
 
-        user_db.create_collection(collection_name)
+        get_tenancy().create_collection(user_id, collection_name)
         # FIX IS HERE: Use the actual user_id variable, not a hardcoded string
         return f"Empty collection '{collection_name}' was successfully created in DB '{user_id}'."
 
@@ -36,88 +212,104 @@ def create_user_collection_only(
         return f"Error creating collection: {str(e)}"
 
 @mcp.tool()
+@instrumented
 def find_documents_by_filter(user_id: str, collection_name: str, filter_query: dict = {}) -> list:
     """
     Find documents in a collection that match a given filter query.
     """
     try:
-        collection = mongo_client[user_id][collection_name]
-        docs = collection.find(filter_query)
-        return [{**doc, "_id": str(doc["_id"])} for doc in docs]
+        collection = get_collection(user_id, collection_name)
+        with query_guard.limit("find_documents_by_filter"):
+            query_guard.check("find_documents_by_filter", collection, filter_query)
+            docs = collection.find(filter_query)
+            return [{**doc, "_id": str(doc["_id"])} for doc in docs]
     except Exception as e:
         return [{"error": str(e)}]
 
 @mcp.tool()
+@instrumented
 def delete_document_by_id(user_id: str, collection_name: str, document_id: str) -> str:
     """
     Delete a single document from a collection by its MongoDB _id.
     """
     try:
-        collection = mongo_client[user_id][collection_name]
+        collection = get_collection(user_id, collection_name)
         result = collection.delete_one({"_id": ObjectId(document_id)})
         return f"{result.deleted_count} document deleted."
     except Exception as e:
         return f"Error: {str(e)}"
 
 @mcp.tool()
+@instrumented
 def delete_documents_by_filter(user_id: str, collection_name: str, filter_query: dict) -> str:
     """
     Delete all documents that match a given filter query.
     """
     try:
-        collection = mongo_client[user_id][collection_name]
-        result = collection.delete_many(filter_query)
+        collection = get_collection(user_id, collection_name)
+        with query_guard.limit("delete_documents_by_filter"):
+            query_guard.check("delete_documents_by_filter", collection, filter_query)
+            result = collection.delete_many(filter_query)
         return f"{result.deleted_count} documents deleted."
     except Exception as e:
         return f"Error: {str(e)}"
 
 @mcp.tool()
+@instrumented
 def update_document_by_id(user_id: str, collection_name: str, document_id: str, update_fields: dict) -> str:
     """
     Update a single document by _id.
     """
     try:
-        collection = mongo_client[user_id][collection_name]
+        collection = get_collection(user_id, collection_name)
         result = collection.update_one({"_id": ObjectId(document_id)}, {"$set": update_fields})
         return f"{result.modified_count} document updated."
     except Exception as e:
         return f"Error: {str(e)}"
 
 @mcp.tool()
+@instrumented
 def update_documents_by_filter(user_id: str, collection_name: str, filter_query: dict, update_fields: dict) -> str:
     """
     Update all documents matching the filter with the specified fields.
     """
     try:
-        collection = mongo_client[user_id][collection_name]
-        result = collection.update_many(filter_query, {"$set": update_fields})
+        collection = get_collection(user_id, collection_name)
+        with query_guard.limit("update_documents_by_filter"):
+            query_guard.check("update_documents_by_filter", collection, filter_query)
+            result = collection.update_many(filter_query, {"$set": update_fields})
         return f"{result.modified_count} documents updated."
     except Exception as e:
         return f"Error: {str(e)}"
 
 @mcp.tool()
+@instrumented
 def count_documents(user_id: str, collection_name: str, filter_query: dict = {}) -> int:
     """
     Count documents in a collection matching the given filter.
     """
     try:
-        collection = mongo_client[user_id][collection_name]
-        return collection.count_documents(filter_query)
+        collection = get_collection(user_id, collection_name)
+        with query_guard.limit("count_documents"):
+            query_guard.check("count_documents", collection, filter_query)
+            return collection.count_documents(filter_query)
     except Exception as e:
         return f"Error: {str(e)}"
 
 @mcp.tool()
+@instrumented
 def get_all_documents(user_id: str, collection_name: str) -> list:
     """
     Retrieve all documents from a collection.
     """
     try:
-        collection = mongo_client[user_id][collection_name]
+        collection = get_collection(user_id, collection_name)
         return [{**doc, "_id": str(doc["_id"])} for doc in collection.find()]
     except Exception as e:
         return [{"error": str(e)}]
 
 @mcp.tool()
+@instrumented
 def get_collection_schema(
     user_id: str, # user_id is now mandatory
     collection_name: str = "main"
@@ -133,12 +325,10 @@ def get_collection_schema(
         A dictionary showing sample keys and their inferred types
     """
     try:
-        user_db = mongo_client[user_id]
-
-        if collection_name not in user_db.list_collection_names():
+        if collection_name not in list_collections(user_id):
             return {"error": f"Collection '{collection_name}' does not exist."}
 
-        collection = user_db[collection_name]
+        collection = get_collection(user_id, collection_name)
         sample = collection.find_one()
 
         if not sample:
@@ -165,6 +355,7 @@ def default_value_for_type(t: type) -> any:
     return ""  # Default for str and others
 
 @mcp.tool()
+@instrumented
 def insert_to_collection(
     user_id: str,
     collection_name: str,
@@ -175,12 +366,10 @@ def insert_to_collection(
     If schema mismatch is found, returns an error and asks for schema update approval.
     """
     try:
-        user_db = mongo_client[user_id]
-
-        if collection_name not in user_db.list_collection_names():
+        if collection_name not in list_collections(user_id):
             return f"Error: Collection '{collection_name}' does not exist in DB '{user_id}'. Please create it first using 'create_user_collection_only'."
 
-        collection = user_db[collection_name]
+        collection = get_collection(user_id, collection_name)
         sample = collection.find_one()
 
         if not sample:
@@ -221,12 +410,13 @@ def insert_to_collection(
         return f"Error inserting document: {str(e)}"
 
 @mcp.tool()
+@instrumented
 def find_document_by_id(user_id: str, collection_name: str, document_id: str) -> dict:
     """
     Find a single document in a collection by its MongoDB _id.
     """
     try:
-        collection = mongo_client[user_id][collection_name]
+        collection = get_collection(user_id, collection_name)
         doc = collection.find_one({"_id": ObjectId(document_id)})
         if not doc:
             return {"info": "Document not found."}
@@ -235,26 +425,74 @@ def find_document_by_id(user_id: str, collection_name: str, document_id: str) ->
     except Exception as e:
         return {"error": str(e)}
 
+# find_documents_by_ids splits long id lists so each $in stays a modest query
+FIND_BY_IDS_BATCH_SIZE = int(os.environ.get("FIND_BY_IDS_BATCH_SIZE", "500"))
+
 @mcp.tool()
+@instrumented
+def find_documents_by_ids(user_id: str, collection_name: str, document_ids: list, projection: dict = {}) -> list:
+    """
+    Find several documents by their MongoDB _id in one call. Prefer this over calling
+    find_document_by_id repeatedly.
+
+    Args:
+        user_id: The ID of the user (used as the database name)
+        collection_name: The name of the collection
+        document_ids: The _id values to fetch
+        projection: Optional fields to return, e.g. {"name": 1, "email": 1}
+
+    Returns:
+        One entry per requested id, in the same order; ids that do not exist are marked "Document not found."
+    """
+    try:
+        invalid = [doc_id for doc_id in document_ids if not ObjectId.is_valid(str(doc_id))]
+        if invalid:
+            return [{"error": f"Invalid document ids: {invalid}"}]
+
+        # The _id is needed to put results back in input order
+        fields = None
+        if projection:
+            fields = {**projection, "_id": 1} if any(projection.values()) else {k: v for k, v in projection.items() if k != "_id"} or None
+
+        unique_ids = list(dict.fromkeys(ObjectId(str(doc_id)) for doc_id in document_ids))
+        collection = get_collection(user_id, collection_name)
+        found = {}
+        with query_guard.limit("find_documents_by_ids"):
+            for start in range(0, len(unique_ids), FIND_BY_IDS_BATCH_SIZE):
+                batch = unique_ids[start:start + FIND_BY_IDS_BATCH_SIZE]
+                for doc in collection.find({"_id": {"$in": batch}}, fields):
+                    found[doc["_id"]] = {**doc, "_id": str(doc["_id"])}
+
+        return [
+            found.get(ObjectId(str(doc_id)), {"_id": str(doc_id), "info": "Document not found."})
+            for doc_id in document_ids
+        ]
+    except Exception as e:
+        return [{"error": str(e)}]
+
+@mcp.tool()
+@instrumented
 def get_user_collections(user_id: str) -> list:
     """
     Return the list of collections inside the user's MongoDB database.
     """
     try:
-        user_db = mongo_client[user_id]
-        return user_db.list_collection_names()
+        return list_collections(user_id)
     except Exception as e:
         return [f"Error: {str(e)}"]
 
 @mcp.tool()
+@instrumented
 def update_collection_schema_fields(
     user_id: str,
     collection_name: str,
     new_fields: dict
 ) -> str:
     """
-    Adds new fields with default values to all existing documents in the collection.
-    If a field in `new_fields` already exists, its value will be updated across all documents.
+    Adds new fields with default values to the documents in the collection that do not have them yet.
+    Existing values are never overwritten. On non-empty collections the update runs as a background job
+    and this tool returns immediately with a job id; use get_schema_job_status to follow its progress.
+    Calling it again with the same fields resumes an interrupted job.
 
     Args:
         user_id: The user's database
@@ -265,32 +503,53 @@ def update_collection_schema_fields(
         Success or error message
     """
     try:
-        user_db = mongo_client[user_id]
-        collection = user_db[collection_name]
-
-        if collection_name not in user_db.list_collection_names():
+        if collection_name not in list_collections(user_id):
             return f"Error: Collection '{collection_name}' does not exist."
 
-        update_result = collection.update_many(
-            {},  # Apply to all docs
-            {"$set": new_fields}
-        )
+        collection = get_collection(user_id, collection_name)
 
-        # Also, if there are no documents, this update_many will not create the fields in the schema.
-        # We might want to explicitly insert an empty document with the new fields if the collection is empty.
-        # This is an edge case, but important for schema consistency.
-        if collection.count_documents({}) == 0:
+        # If there are no documents, there is nothing to migrate; insert a document so the
+        # new fields become part of the sampled schema.
+        if collection.find_one({}, {"_id": 1}) is None:
             collection.insert_one(new_fields)
             return f"Collection was empty. Schema updated and an initial document with new fields inserted. New fields: {list(new_fields.keys())}."
 
-
-        return f"Schema updated. {update_result.modified_count} documents modified with new fields: {list(new_fields.keys())}."
+        job, resumed = schema_jobs.start(user_id, collection_name, new_fields)
+        action = "resumed" if resumed else "started"
+        return (
+            f"Schema update {action} in the background (job id: {job['_id']}). "
+            f"Documents missing {list(new_fields.keys())} will be filled in batches. "
+            "Use get_schema_job_status to check progress."
+        )
 
     except Exception as e:
         return f"Error updating schema: {str(e)}"
 
+@mcp.tool()
+@instrumented
+def get_schema_job_status(user_id: str, job_id: str = "", collection_name: str = "") -> list:
+    """
+    Report progress of background schema updates started by update_collection_schema_fields.
+
+    Args:
+        user_id: The user's database
+        job_id: A specific job id; leave empty to list recent jobs
+        collection_name: Optionally restrict the listing to one collection
+
+    Returns:
+        A list of jobs with status (pending, running, completed, failed), batches processed and fields set
+    """
+    try:
+        jobs = schema_jobs.status(user_id, job_id, collection_name)
+        if not jobs:
+            return [{"info": "No schema update jobs found."}]
+        return [describe_job(job) for job in jobs]
+    except Exception as e:
+        return [{"error": str(e)}]
+
 # Add new tools for demonstration and future use
 @mcp.tool()
+@instrumented
 def delete_entire_collection(user_id: str, collection_name: str) -> str:
     """
     Deletes an entire collection from the user's database. USE WITH CAUTION as this operation is irreversible.
@@ -303,16 +562,16 @@ def delete_entire_collection(user_id: str, collection_name: str) -> str:
         Confirmation string
     """
     try:
-        user_db = mongo_client[user_id]
-        if collection_name not in user_db.list_collection_names():
+        if collection_name not in list_collections(user_id):
             return f"Collection '{collection_name}' does not exist in DB '{user_id}'."
         
-        user_db.drop_collection(collection_name)
+        get_tenancy().drop_collection(user_id, collection_name)
         return f"Collection '{collection_name}' successfully deleted from DB '{user_id}'."
     except Exception as e:
         return f"Error deleting collection: {str(e)}"
 
 
-# Step 3: Run the server (stdio)
+# Step 3: Run the server (stdio by default, or HTTP/SSE shared by many sessions)
 if __name__ == "__main__":
-    mcp.run(transport="stdio")
\ No newline at end of file
+    MetricsFileWriter("mongo_server").start()
+    run_server(mcp, default_port=8101)
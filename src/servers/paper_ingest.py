@@ -0,0 +1,237 @@
+"""
+PDF ingestion for papers cached by research_server.
+
+For a topic directory holding papers_info.json, the pipeline:
+  1. downloads the PDFs concurrently (bounded by a semaphore) with httpx,
+  2. extracts their text with pypdf in a process pool, so parsing does not
+     block the server's event loop or its GIL,
+  3. splits the text into overlapping word-window chunks and writes them to
+     chunks.json next to papers_info.json.
+
+Extracted text is cached under PAPER_DIR/_text by the SHA-256 of the PDF, so a
+paper that appears under several topics, or is re-downloaded, is parsed once;
+papers already in chunks.json with the same pdf_url are not downloaded again.
+
+Ingests of the same topic are serialized, every file is written to a temporary
+name and renamed into place, and file I/O runs in worker threads so the server's
+event loop keeps serving other sessions.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import sys
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from src.retrieval import BM25Index
+
+CHUNKS_FILE = "chunks.json"
+TEXT_CACHE_DIR = "_text"
+
+CHUNK_WORDS = int(os.environ.get("PAPER_CHUNK_WORDS", "200"))
+CHUNK_OVERLAP = int(os.environ.get("PAPER_CHUNK_OVERLAP", "40"))
+FETCH_CONCURRENCY = int(os.environ.get("PDF_FETCH_CONCURRENCY", "4"))
+EXTRACT_WORKERS = int(os.environ.get("PDF_EXTRACT_WORKERS", str(min(4, os.cpu_count() or 1))))
+MAX_PDF_BYTES = int(os.environ.get("PDF_MAX_BYTES", str(50 * 1024 * 1024)))
+
+# Serve PDFs from a local stand-in (e.g. for benchmarks or offline use) instead of arxiv.org
+ARXIV_PDF_BASE_URL = os.environ.get("ARXIV_PDF_BASE_URL")
+
+_executor = None
+
+# One ingest per topic directory at a time, so concurrent calls do not drop each other's chunks
+_topic_locks = {}
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=EXTRACT_WORKERS)
+    return _executor
+
+
+def extract_pdf_text(data: bytes) -> str:
+    """Runs in a worker process."""
+    import io
+    from pypdf import PdfReader
+
+    reader = PdfReader(io.BytesIO(data))
+    return "\n".join(page.extract_text() or "" for page in reader.pages)
+
+
+def chunk_text(text: str, size: int = CHUNK_WORDS, overlap: int = CHUNK_OVERLAP) -> list:
+    words = text.split()
+    if not words:
+        return []
+    step = max(1, size - overlap)
+    return [" ".join(words[start:start + size]) for start in range(0, max(1, len(words) - overlap), step)]
+
+
+def pdf_url_for(pdf_url: str) -> str:
+    if not ARXIV_PDF_BASE_URL or "/pdf/" not in pdf_url:
+        return pdf_url
+    return ARXIV_PDF_BASE_URL.rstrip("/") + "/" + pdf_url.split("/pdf/", 1)[1]
+
+
+def _read_json(path: Path, default):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return default
+
+
+def _write_atomic(path: Path, text: str) -> None:
+    # Write then rename, so readers and a crash never leave a half-written file under `path`
+    tmp = path.with_name(f"{path.name}.{uuid.uuid4().hex[:8]}.tmp")
+    try:
+        tmp.write_text(text, encoding="utf-8")
+        os.replace(tmp, path)
+    finally:
+        tmp.unlink(missing_ok=True)
+
+
+def _write_json(path: Path, data) -> None:
+    _write_atomic(path, json.dumps(data))
+
+
+def _read_text(path: Path):
+    try:
+        return path.read_text(encoding="utf-8")
+    except FileNotFoundError:
+        return None
+
+
+def _store_text(text_dir: Path, cached: Path, text: str) -> None:
+    text_dir.mkdir(parents=True, exist_ok=True)
+    _write_atomic(cached, text)
+
+
+async def _fetch(client, semaphore: asyncio.Semaphore, url: str) -> bytes:
+    async with semaphore:
+        async with client.stream("GET", url) as response:
+            response.raise_for_status()
+            data = bytearray()
+            async for block in response.aiter_bytes():
+                data.extend(block)
+                if len(data) > MAX_PDF_BYTES:
+                    raise ValueError(f"PDF larger than {MAX_PDF_BYTES} bytes")
+            return bytes(data)
+
+
+async def _text_for(data: bytes, text_dir: Path) -> tuple:
+    digest = hashlib.sha256(data).hexdigest()
+    cached = text_dir / f"{digest}.txt"
+    text = await asyncio.to_thread(_read_text, cached)
+    if text is not None:
+        return digest, text
+    loop = asyncio.get_running_loop()
+    text = await loop.run_in_executor(_get_executor(), extract_pdf_text, data)
+    await asyncio.to_thread(_store_text, text_dir, cached, text)
+    return digest, text
+
+
+async def ingest_topic(paper_dir: Path, topic_dir: Path, max_papers: int = 10, force: bool = False) -> dict:
+    """Fetch, extract and chunk the papers of one topic. Returns a summary of what was done."""
+    lock = _topic_locks.setdefault(topic_dir.resolve(), asyncio.Lock())
+    async with lock:
+        return await _ingest_topic(paper_dir, topic_dir, max_papers, force)
+
+
+async def _ingest_topic(paper_dir: Path, topic_dir: Path, max_papers: int, force: bool) -> dict:
+    import httpx
+
+    papers_info = await asyncio.to_thread(_read_json, topic_dir / "papers_info.json", {})
+    chunks_path = topic_dir / CHUNKS_FILE
+    index = await asyncio.to_thread(_read_json, chunks_path, {})
+    text_dir = paper_dir / TEXT_CACHE_DIR
+
+    todo = {}
+    skipped = []
+    for paper_id, info in list(papers_info.items())[:max_papers]:
+        done = index.get(paper_id)
+        if not force and done and done.get("pdf_url") == info.get("pdf_url"):
+            skipped.append(paper_id)
+        elif info.get("pdf_url"):
+            todo[paper_id] = info
+
+    summary = {"topic": topic_dir.name, "ingested": [], "skipped": skipped, "failed": {}}
+    if not todo:
+        return summary
+
+    semaphore = asyncio.Semaphore(FETCH_CONCURRENCY)
+    async with httpx.AsyncClient(timeout=60.0, follow_redirects=True) as client:
+
+        async def ingest_one(paper_id: str, info: dict):
+            data = await _fetch(client, semaphore, pdf_url_for(info["pdf_url"]))
+            digest, text = await _text_for(data, text_dir)
+            return paper_id, {
+                "title": info.get("title", ""),
+                "pdf_url": info["pdf_url"],
+                "sha256": digest,
+                "chunks": chunk_text(text),
+            }
+
+        results = await asyncio.gather(
+            *(ingest_one(paper_id, info) for paper_id, info in todo.items()),
+            return_exceptions=True,
+        )
+
+    ingested = {}
+    for paper_id, result in zip(todo, results):
+        if isinstance(result, BaseException):
+            summary["failed"][paper_id] = str(result) or type(result).__name__
+            print(f"Ingesting {paper_id} failed: {result}", file=sys.stderr)
+            continue
+        ingested[paper_id] = result[1]
+        summary["ingested"].append(paper_id)
+
+    if ingested:
+        # Merge into the current file rather than the copy read before the downloads,
+        # so a server process ingesting the same topic meanwhile keeps its chunks
+        index = await asyncio.to_thread(_read_json, chunks_path, {})
+        index.update(ingested)
+        await asyncio.to_thread(_write_json, chunks_path, index)
+    return summary
+
+
+class ChunkSearcher:
+    """BM25 over stored chunks; indexes are rebuilt only when a chunks.json changes."""
+
+    def __init__(self):
+        self._indexes = {}  # path -> (mtime, BM25Index, [(paper_id, title, chunk)])
+
+    def _load(self, path: Path):
+        mtime = path.stat().st_mtime
+        cached = self._indexes.get(path)
+        if cached and cached[0] == mtime:
+            return cached[1], cached[2]
+        entries = [
+            (paper_id, paper.get("title", ""), chunk)
+            for paper_id, paper in _read_json(path, {}).items()
+            for chunk in paper.get("chunks", [])
+        ]
+        index = BM25Index([f"{title} {chunk}" for _, title, chunk in entries])
+        self._indexes[path] = (mtime, index, entries)
+        return index, entries
+
+    def search(self, query: str, topic_dirs, top_k: int = 5) -> list:
+        hits = []
+        for topic_dir in topic_dirs:
+            path = topic_dir / CHUNKS_FILE
+            if not path.is_file():
+                continue
+            index, entries = self._load(path)
+            for i, score in index.top(query, top_k):
+                paper_id, title, chunk = entries[i]
+                hits.append({
+                    "topic": topic_dir.name,
+                    "paper_id": paper_id,
+                    "title": title,
+                    "score": round(score, 3),
+                    "text": chunk,
+                })
+        hits.sort(key=lambda hit: hit["score"], reverse=True)
+        return hits[:top_k]
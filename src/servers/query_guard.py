@@ -0,0 +1,165 @@
+"""
+Cost guardrails for the filter-based mongo_server tools.
+
+Filters are written by the LLM, so a regex or unindexed filter on a large
+collection can keep mongod busy for minutes. Each guarded tool runs under a
+client-side operation timeout (pymongo.timeout, sent to the server as
+maxTimeMS). Optionally, a queryPlanner explain runs first and the query is
+refused when the winning plan is a collection scan over more documents than
+the configured limit. Explain results are cached per filter shape, so repeated
+queries of the same form cost one extra round-trip at most once a minute.
+
+Under shared tenancy every query is scoped to (tenant, collection), so the plan
+always uses the index on those fields. An index scan whose bounds narrow only
+the scope fields still reads every document of the logical collection, so it
+counts as a collection scan, and the limit applies to the documents in scope.
+"""
+import json
+import sys
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from src.servers.tenancy import TenantCollection
+
+OPERATORS_PREFIX = "$"
+
+
+class QueryRejected(Exception):
+    pass
+
+
+class QueryTimedOut(Exception):
+    pass
+
+
+def filter_shape(filter_query) -> str:
+    """The filter with values blanked out, so queries of the same form share a plan."""
+    def shape(value):
+        if isinstance(value, dict):
+            return {key: shape(inner) for key, inner in sorted(value.items())}
+        if isinstance(value, list):
+            return [shape(inner) for inner in value]
+        return 1
+    return json.dumps(shape(filter_query or {}), sort_keys=True)
+
+
+def filter_fields(filter_query) -> list:
+    """Field names a filter tests, including those nested in $and/$or/$nor."""
+    fields = []
+    for key, value in (filter_query or {}).items():
+        if key.startswith(OPERATORS_PREFIX):
+            for clause in value if isinstance(value, list) else []:
+                fields.extend(name for name in filter_fields(clause) if name not in fields)
+        elif key not in fields:
+            fields.append(key)
+    return fields
+
+
+UNBOUNDED = (["[MinKey, MaxKey]"], ["[MaxKey, MinKey]"])
+
+
+def scans_only_scope(stage: dict, scope_fields) -> bool:
+    """An IXSCAN whose bounds narrow nothing but the scope fields, i.e. the whole logical collection."""
+    bounds = stage.get("indexBounds")
+    if stage.get("stage") != "IXSCAN" or not scope_fields or not isinstance(bounds, dict):
+        return False
+    return all(field in scope_fields for field, field_bounds in bounds.items() if field_bounds not in UNBOUNDED)
+
+
+def has_collection_scan(plan, scope_fields=()) -> bool:
+    if isinstance(plan, dict):
+        if plan.get("stage") == "COLLSCAN" or scans_only_scope(plan, scope_fields):
+            return True
+        return any(has_collection_scan(value, scope_fields) for value in plan.values())
+    if isinstance(plan, list):
+        return any(has_collection_scan(value, scope_fields) for value in plan)
+    return False
+
+
+def physical_query(collection, filter_query):
+    """
+    The pymongo collection and filter actually sent, and the scope added to the filter
+    (e.g. the tenant and collection of shared tenancy; empty otherwise).
+    """
+    # Not hasattr(): pymongo's Collection answers any attribute name with a sub-collection
+    if isinstance(collection, TenantCollection):
+        target, effective_filter = collection.physical_query(filter_query)
+        return target, effective_filter, collection.scope
+    return collection, filter_query or {}, {}
+
+
+class QueryGuard:
+    def __init__(self, max_time_ms: dict, default_max_time_ms: int = 5000, explain: bool = False,
+                 scan_limit: int = 100_000, on_timeout=None, on_reject=None, plan_ttl_seconds: float = 60.0):
+        self.max_time_ms = max_time_ms
+        self.default_max_time_ms = default_max_time_ms
+        self.explain = explain
+        self.scan_limit = scan_limit
+        self.on_timeout = on_timeout
+        self.on_reject = on_reject
+        self.plan_ttl_seconds = plan_ttl_seconds
+        self._plans = OrderedDict()  # (db, collection, shape) -> (expires_at, is_collscan)
+        self._plans_lock = threading.Lock()  # Tools call check() from worker threads
+
+    @contextmanager
+    def limit(self, tool: str):
+        """Run the block under the tool's time limit; timeouts become QueryTimedOut."""
+        import pymongo
+        from pymongo.errors import PyMongoError
+
+        max_time_ms = self.max_time_ms.get(tool, self.default_max_time_ms)
+        try:
+            with pymongo.timeout(max_time_ms / 1000):
+                yield
+        except PyMongoError as e:
+            if not getattr(e, "timeout", False):
+                raise
+            if self.on_timeout:
+                self.on_timeout(tool)
+            raise QueryTimedOut(
+                f"Query exceeded the {max_time_ms} ms time limit. Narrow the filter or filter on indexed fields."
+            ) from e
+
+    def check(self, tool: str, collection, filter_query) -> None:
+        """Raise QueryRejected if the filter would scan a large collection without an index."""
+        if not self.explain or not filter_query:
+            return  # An empty filter asks for the whole collection by design
+        target, effective_filter, scope = physical_query(collection, filter_query)
+        key = (target.database.name, target.name, filter_shape(effective_filter))
+        now = time.monotonic()
+        with self._plans_lock:
+            cached = self._plans.get(key)
+        if cached and cached[0] > now:
+            collscan = cached[1]
+        else:
+            try:
+                explained = target.database.command(
+                    {"explain": {"find": target.name, "filter": effective_filter}, "verbosity": "queryPlanner"}
+                )
+            except Exception as e:
+                # Fail open: a guard that cannot explain must not take the tools down
+                print(f"Query guard: explain failed ({e}); running the query unchecked", file=sys.stderr)
+                return
+            collscan = has_collection_scan(explained.get("queryPlanner", {}).get("winningPlan"), scope)
+            with self._plans_lock:
+                self._plans[key] = (now + self.plan_ttl_seconds, collscan)
+                self._plans.move_to_end(key)
+                while len(self._plans) > 1000:
+                    self._plans.popitem(last=False)
+
+        if not collscan:
+            return
+        # A scoped scan reads only the documents in scope, not the whole shared collection
+        documents = target.count_documents(scope) if scope else target.estimated_document_count()
+        if documents <= self.scan_limit:
+            return
+        if self.on_reject:
+            self.on_reject(tool)
+        fields = filter_fields(filter_query)
+        raise QueryRejected(
+            f"Query rejected: it would scan all ~{documents} documents of '{getattr(collection, 'name', target.name)}' "
+            f"(limit {self.scan_limit}) because no index covers {fields}. "
+            f"Ask an administrator to create an index on {fields}, or filter on an indexed field."
+        )
@@ -1,19 +1,102 @@
-import arxiv
+import asyncio
 import json
+import os
+import sys
+import threading
 from pathlib import Path
 from typing import List
-from mcp.server.fastmcp import FastMCP
+from dotenv import load_dotenv
+from mcp.server.fastmcp import Context, FastMCP
 
 BASE_DIR = Path(__file__).resolve().parents[2]
-PAPER_DIR = BASE_DIR / "data" / "papers"
-PAPER_DIR.mkdir(parents=True, exist_ok=True)
+
+# Support both `python -m src.servers.research_server` and direct script execution
+try:
+    from src.servers.transport import run_server
+except ModuleNotFoundError:
+    if str(BASE_DIR) not in sys.path:
+        sys.path.append(str(BASE_DIR))
+    from src.servers.transport import run_server
+
+# Before the imports below: arxiv_search and paper_ingest read their settings at import time
+load_dotenv()
+
+from src.servers.arxiv_search import ARXIV_BUCKET, fetch_papers
+from src.servers.paper_ingest import ChunkSearcher, ingest_topic
+
+# Created lazily by search_papers; readers treat a missing directory as "no papers yet"
+PAPER_DIR = Path(os.environ.get("PAPER_DIR", BASE_DIR / "data" / "papers"))
+
+# Every server process using this PAPER_DIR (one per stdio session) shares the arXiv rate limit
+ARXIV_BUCKET.state_path = PAPER_DIR / ".arxiv_rate"
+
+# Topics searched concurrently by search_papers_batch; arXiv requests are still spaced by the shared rate limit
+ARXIV_BATCH_WORKERS = int(os.environ.get("ARXIV_BATCH_WORKERS", "4"))
 
 # Initialize FastMCP server
 mcp = FastMCP("research")
 
+chunk_searcher = ChunkSearcher()
+
+_papers_file_lock = threading.Lock()
+
+# Searches in progress, so identical topics requested concurrently share one arXiv query
+_inflight_searches = {}
+
+
+def normalize_topic(topic: str) -> str:
+    """Topics that differ only in case or spacing are the same topic."""
+    return " ".join(topic.lower().split())
+
+
+def topic_dir_name(topic: str) -> str:
+    return normalize_topic(topic).replace(" ", "_")
+
+
+def store_papers(topic: str, papers: dict) -> Path:
+    """Merge papers into the topic's papers_info.json and return its path."""
+    topic_dir = PAPER_DIR / topic_dir_name(topic)
+    topic_dir.mkdir(parents=True, exist_ok=True)
+    file_path = topic_dir / "papers_info.json"
+
+    with _papers_file_lock:
+        # Try to load existing papers info
+        try:
+            with open(file_path, "r", encoding="utf-8") as json_file:
+                papers_info = json.load(json_file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            papers_info = {}
+
+        papers_info.update(papers)
+
+        # Save updated papers_info to json file
+        with open(file_path, "w", encoding="utf-8") as json_file:
+            json.dump(papers_info, json_file, indent=2)
+
+    return file_path
+
+
+def _search_and_store(topic: str, max_results: int) -> List[str]:
+    papers = fetch_papers(topic, max_results)
+    file_path = store_papers(topic, papers)
+    print(f"Results are saved in: {file_path}", file=sys.stderr)
+    return list(papers)
+
+
+async def _search(topic: str, max_results: int) -> List[str]:
+    """Run a search in a worker thread, joining an identical search that is already running."""
+    topic = normalize_topic(topic)
+    key = (topic, max_results)
+    task = _inflight_searches.get(key)
+    if task is None:
+        task = asyncio.ensure_future(asyncio.to_thread(_search_and_store, topic, max_results))
+        _inflight_searches[key] = task
+        task.add_done_callback(lambda _: _inflight_searches.pop(key, None))
+    return await asyncio.shield(task)
+
+
 @mcp.tool()
-def search_papers(topic: str, max_results: int = 5) -> List[str]:
-    print(f"Using tool search_papers with topic: {topic} and max_results: {max_results}")
+async def search_papers(topic: str, max_results: int = 5) -> List[str]:
     """
     Search for papers on arXiv based on a topic and store their information.
     
@@ -24,52 +107,47 @@ def search_papers(topic: str, max_results: int = 5) -> List[str]:
     Returns:
         List of paper IDs found in the search
     """
-    
-    # Use arxiv to find the papers 
-    client = arxiv.Client()
-
-    # Search for the most relevant articles matching the queried topic
-    search = arxiv.Search(
-        query = topic,
-        max_results = max_results,
-        sort_by = arxiv.SortCriterion.Relevance
-    )
+    print(f"Using tool search_papers with topic: {topic} and max_results: {max_results}", file=sys.stderr)
+    return await _search(topic, max_results)
 
-    papers = client.results(search)
-    
-    # Create directory for this topic
-    topic_dir = PAPER_DIR / topic.lower().replace(" ", "_")
-    topic_dir.mkdir(parents=True, exist_ok=True)
+@mcp.tool()
+async def search_papers_batch(topics: List[str], ctx: Context, max_results: int = 5) -> str:
+    """
+    Search arXiv for several topics in one call and store the papers of each topic.
+    Duplicate topics are searched once. Progress is reported as each topic completes.
 
-    file_path = topic_dir / "papers_info.json"
+    Args:
+        topics: The topics to search for
+        max_results: Maximum number of results per topic (default: 5)
 
-    # Try to load existing papers info
-    try:
-        with open(file_path, "r", encoding="utf-8") as json_file:
-            papers_info = json.load(json_file)
-    except (FileNotFoundError, json.JSONDecodeError):
-        papers_info = {}
-
-    # Process each paper and add to papers_info  
-    paper_ids = []
-    for paper in papers:
-        paper_ids.append(paper.get_short_id())
-        paper_info = {
-            'title': paper.title,
-            'authors': [author.name for author in paper.authors],
-            'summary': paper.summary,
-            'pdf_url': paper.pdf_url,
-            'published': str(paper.published.date())
-        }
-        papers_info[paper.get_short_id()] = paper_info
-    
-    # Save updated papers_info to json file
-    with open(file_path, "w", encoding="utf-8") as json_file:
-        json.dump(papers_info, json_file, indent=2)
-    
-    print(f"Results are saved in: {file_path}")
-    
-    return paper_ids
+    Returns:
+        JSON object mapping each topic to its paper IDs, or to an error message
+    """
+    unique = {}
+    for topic in topics:
+        unique.setdefault(normalize_topic(topic), topic)
+    total = len(unique)
+    results = {}
+    workers = asyncio.Semaphore(ARXIV_BATCH_WORKERS)
+
+    async def run(topic: str):
+        async with workers:
+            try:
+                paper_ids = await _search(topic, max_results)
+                results[topic] = paper_ids
+                await ctx.info(f"{topic}: {len(paper_ids)} papers")
+            except Exception as e:
+                results[topic] = {"error": str(e)}
+                await ctx.warning(f"{topic}: search failed ({e})")
+            await ctx.report_progress(len(results), total)
+
+    await asyncio.gather(*(run(topic) for topic in unique.values()))
+
+    # Answer for every requested spelling, in the order given
+    return json.dumps(
+        {topic: results[unique[normalize_topic(topic)]] for topic in topics},
+        indent=2,
+    )
 
 @mcp.tool()
 def extract_info(paper_id: str) -> str:
@@ -83,6 +161,9 @@ def extract_info(paper_id: str) -> str:
         JSON string with paper information if found, error message if not found
     """
  
+    if not PAPER_DIR.exists():
+        return f"There's no saved information related to paper {paper_id}."
+
     for topic_dir in PAPER_DIR.iterdir():
         if topic_dir.is_dir():
             file_path = topic_dir / "papers_info.json"
@@ -100,6 +181,52 @@ def extract_info(paper_id: str) -> str:
 
 
 
+@mcp.tool()
+async def ingest_papers(topic: str, max_papers: int = 10, force: bool = False) -> str:
+    """
+    Download and index the full text of papers saved by search_papers for a topic, so
+    search_paper_chunks can answer questions about their content. Papers that were
+    already ingested are skipped unless force is set.
+
+    Args:
+        topic: A topic previously used with search_papers
+        max_papers: Maximum number of papers of the topic to ingest (default: 10)
+        force: Re-download and re-chunk papers that were already ingested
+
+    Returns:
+        JSON summary with ingested, skipped and failed paper IDs
+    """
+    topic_dir = PAPER_DIR / topic_dir_name(topic)
+    if not (topic_dir / "papers_info.json").is_file():
+        return f"No papers saved for topic '{topic}'. Use search_papers first."
+    summary = await ingest_topic(PAPER_DIR, topic_dir, max_papers=max_papers, force=force)
+    return json.dumps(summary, indent=2)
+
+@mcp.tool()
+def search_paper_chunks(query: str, topic: str = "", top_k: int = 5) -> str:
+    """
+    Find the passages of ingested papers most relevant to a question.
+
+    Args:
+        query: What to look for in the papers' text
+        topic: Restrict the search to one topic (default: all ingested topics)
+        top_k: Number of passages to return (default: 5)
+
+    Returns:
+        JSON list of passages with paper ID, title and relevance score
+    """
+    if topic:
+        topic_dirs = [PAPER_DIR / topic_dir_name(topic)]
+    elif PAPER_DIR.exists():
+        topic_dirs = [path for path in PAPER_DIR.iterdir() if path.is_dir()]
+    else:
+        topic_dirs = []
+
+    hits = chunk_searcher.search(query, topic_dirs, top_k)
+    if not hits:
+        return "No matching passages. Ingest papers for the topic with ingest_papers first."
+    return json.dumps(hits, indent=2)
+
 @mcp.resource("papers://folders")
 def get_available_folders() -> str:
     """
@@ -136,7 +263,7 @@ def get_topic_papers(topic: str) -> str:
     Args:
         topic: The research topic to retrieve papers for
     """
-    topic_dir = PAPER_DIR / topic.lower().replace(" ", "_")
+    topic_dir = PAPER_DIR / topic_dir_name(topic)
     papers_file = topic_dir / "papers_info.json"
 
     if not papers_file.exists():
@@ -190,5 +317,6 @@ Follow these instructions:
 Please present both detailed information about each paper and a high-level synthesis of the research landscape in {topic}."""
 
 if __name__ == "__main__":
-    # Initialize and run the server
-    mcp.run(transport='stdio')
+    # Initialize and run the server (stdio by default, or HTTP/SSE shared by many sessions)
+    run_server(mcp, default_port=8102)
+
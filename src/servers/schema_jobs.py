@@ -0,0 +1,212 @@
+"""
+Background, resumable schema migrations for mongo_server.
+
+update_collection_schema_fields used to run one update_many over the whole
+collection inside the tool call. Jobs here fill in missing fields in batches
+ordered by _id, only touching documents where the field does not exist yet,
+and record progress (last _id, counters, heartbeat) in a jobs collection so a
+job interrupted by a timeout or a process exit resumes where it stopped.
+
+Several mongo_server processes can share the jobs collection: a worker claims a
+job by owning it with a fresh heartbeat, and another process may only take it
+over once the heartbeat is stale. A unique partial index allows one active job
+per (user, collection, fields), so concurrent starts of the same migration share it.
+"""
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+ACTIVE_STATUSES = ("pending", "running", "failed")
+
+
+def _now():
+    return datetime.now(timezone.utc)
+
+
+def fields_key(new_fields: dict) -> str:
+    """Canonical form of a job's fields and defaults; independent of key order."""
+    return json.dumps(new_fields, sort_keys=True, default=str, separators=(",", ":"))
+
+
+class SchemaMigrationRunner:
+    def __init__(self, jobs_collection, target_collection, batch_size: int = 500,
+                 throttle_seconds: float = 0.05, stale_after_seconds: float = 60.0, on_batch=None):
+        """
+        Args:
+            jobs_collection: callable returning the collection that stores job documents
+            target_collection: callable (user_id, collection_name) -> collection to migrate
+            on_batch: optional callable (user_id, collection_name) run after each batch is written
+        """
+        self.jobs_collection = jobs_collection
+        self.target_collection = target_collection
+        self.batch_size = batch_size
+        self.throttle_seconds = throttle_seconds
+        self.stale_after = timedelta(seconds=stale_after_seconds)
+        self.on_batch = on_batch
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self._threads = {}
+        self._lock = threading.Lock()
+        self._indexed = False
+
+    def _jobs(self):
+        jobs = self.jobs_collection()
+        if not self._indexed:
+            # "active" is true until the job completes; failed jobs stay active so start() retries them
+            jobs.create_index(
+                [("user_id", 1), ("collection_name", 1), ("fields_key", 1)],
+                unique=True, partialFilterExpression={"active": True}, name="one_active_job",
+            )
+            self._indexed = True
+        return jobs
+
+    def start(self, user_id: str, collection_name: str, new_fields: dict):
+        """Start (or resume) a job for these fields. Returns (job, resumed)."""
+        from pymongo.errors import DuplicateKeyError
+
+        jobs = self._jobs()
+        active = {
+            "user_id": user_id,
+            "collection_name": collection_name,
+            "fields_key": fields_key(new_fields),
+            "active": True,
+        }
+        job = jobs.find_one(active)
+        resumed = job is not None
+        if job is None:
+            job = {
+                "_id": uuid.uuid4().hex,
+                **active,
+                "new_fields": new_fields,
+                "status": "pending",
+                "last_id": None,
+                "batches": 0,
+                "fields_set": 0,
+                "error": None,
+                "owner": None,
+                "heartbeat": None,
+                "created_at": _now(),
+                "updated_at": _now(),
+            }
+            try:
+                jobs.insert_one(job)
+            except DuplicateKeyError:
+                # Another call started the same migration between our lookup and insert
+                job, resumed = jobs.find_one(active), True
+        self._spawn(job["_id"])
+        return job, resumed
+
+    def status(self, user_id: str, job_id: str = "", collection_name: str = "") -> list:
+        """
+        Return matching jobs (newest first), resuming any whose worker has died: running
+        jobs with a stale heartbeat, and pending jobs no worker claimed in time.
+        """
+        query = {"user_id": user_id}
+        if job_id:
+            query["_id"] = job_id
+        if collection_name:
+            query["collection_name"] = collection_name
+        jobs = list(self._jobs().find(query).sort("created_at", -1).limit(20))
+        for job in jobs:
+            if job["status"] in ("pending", "running") and self._is_stale(job):
+                self._spawn(job["_id"])
+        return jobs
+
+    def _is_stale(self, job) -> bool:
+        # A pending job has no heartbeat yet; it is abandoned once it has waited as long
+        heartbeat = job.get("heartbeat") or job.get("updated_at")
+        if heartbeat is None:
+            return True
+        if heartbeat.tzinfo is None:  # pymongo returns naive UTC datetimes by default
+            heartbeat = heartbeat.replace(tzinfo=timezone.utc)
+        return _now() - heartbeat > self.stale_after
+
+    def _spawn(self, job_id: str) -> None:
+        with self._lock:
+            thread = self._threads.get(job_id)
+            if thread is not None and thread.is_alive():
+                return
+            thread = threading.Thread(target=self._run, args=(job_id,), name=f"schema-job-{job_id[:8]}", daemon=True)
+            self._threads[job_id] = thread
+            thread.start()
+
+    def _claim(self, job_id: str):
+        """Take ownership unless another live worker holds the job."""
+        now = _now()
+        return self._jobs().find_one_and_update(
+            {
+                "_id": job_id,
+                "status": {"$in": list(ACTIVE_STATUSES)},
+                "$or": [
+                    {"owner": None},
+                    {"owner": self.owner},
+                    {"heartbeat": {"$lt": now - self.stale_after}},
+                ],
+            },
+            {"$set": {"owner": self.owner, "heartbeat": now, "status": "running", "error": None, "updated_at": now}},
+            return_document=True,
+        )
+
+    def _run(self, job_id: str) -> None:
+        jobs = self._jobs()
+        job = self._claim(job_id)
+        if job is None:
+            return
+        try:
+            collection = self.target_collection(job["user_id"], job["collection_name"])
+            fields = job["new_fields"]
+            missing_any = {"$or": [{field: {"$exists": False}} for field in fields]}
+            last_id = job.get("last_id")
+            while True:
+                query = missing_any if last_id is None else {"$and": [{"_id": {"$gt": last_id}}, missing_any]}
+                ids = [doc["_id"] for doc in collection.find(query, {"_id": 1}).sort("_id", 1).limit(self.batch_size)]
+                if not ids:
+                    break
+                fields_set = 0
+                for field, default in fields.items():
+                    result = collection.update_many(
+                        {"_id": {"$in": ids}, field: {"$exists": False}},
+                        {"$set": {field: default}},
+                    )
+                    fields_set += result.modified_count
+                last_id = ids[-1]
+                now = _now()
+                progress = jobs.update_one(
+                    {"_id": job_id, "owner": self.owner},
+                    {"$set": {"last_id": last_id, "heartbeat": now, "updated_at": now},
+                     "$inc": {"batches": 1, "fields_set": fields_set}},
+                )
+                if progress.matched_count == 0:
+                    return  # Another worker took the job over after our heartbeat went stale
+                if self.on_batch is not None and fields_set:
+                    self.on_batch(job["user_id"], job["collection_name"])
+                if self.throttle_seconds:
+                    time.sleep(self.throttle_seconds)
+            jobs.update_one(
+                {"_id": job_id, "owner": self.owner},
+                {"$set": {"status": "completed", "active": False, "owner": None, "updated_at": _now()}},
+            )
+        except Exception as e:
+            jobs.update_one(
+                {"_id": job_id, "owner": self.owner},
+                {"$set": {"status": "failed", "owner": None, "error": str(e), "updated_at": _now()}},
+            )
+
+
+def describe_job(job: dict) -> dict:
+    """JSON-friendly view of a job document for tool results."""
+    return {
+        "job_id": job["_id"],
+        "collection_name": job["collection_name"],
+        "new_fields": list(job["new_fields"].keys()),
+        "status": job["status"],
+        "batches": job.get("batches", 0),
+        "fields_set": job.get("fields_set", 0),
+        "last_id": str(job["last_id"]) if job.get("last_id") is not None else None,
+        "error": job.get("error"),
+        "created_at": str(job.get("created_at")),
+        "updated_at": str(job.get("updated_at")),
+    }
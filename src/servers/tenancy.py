@@ -0,0 +1,159 @@
+"""
+Tenancy modes for mongo_server.
+
+database (default): every user gets a MongoDB database named after their user_id
+and each logical collection is a physical collection inside it.
+
+shared: all users share one physical `documents` collection in SHARED_DB_NAME.
+Every document carries the owning tenant and logical collection name, every
+filter the tools send is scoped to both, and a small `collections` catalog
+records which logical collections exist. This keeps the number of databases,
+collections and WiredTiger files constant no matter how many users sign up.
+"""
+TENANT_FIELD = "_tenant_id"
+COLLECTION_FIELD = "_collection"
+RESERVED_FIELDS = (TENANT_FIELD, COLLECTION_FIELD)
+
+DATA_COLLECTION = "documents"
+CATALOG_COLLECTION = "collections"
+
+
+def _hidden_projection(projection):
+    """Keep the scope fields out of results unless the caller asked for specific fields."""
+    if projection is None:
+        return {field: 0 for field in RESERVED_FIELDS}
+    fields = {key: value for key, value in projection.items() if key != "_id"}
+    excluding = all(not value for value in fields.values()) if fields else not projection.get("_id", 1)
+    if excluding:
+        return {**projection, **{field: 0 for field in RESERVED_FIELDS}}
+    return projection
+
+
+def _check_update(update: dict) -> None:
+    for operator, fields in update.items():
+        if not isinstance(fields, dict):
+            continue
+        names = list(fields)
+        if operator == "$rename":
+            names += [target for target in fields.values() if isinstance(target, str)]  # Renaming onto a scope field
+        if any(name.split(".")[0] in RESERVED_FIELDS for name in names):
+            raise ValueError(f"Fields {list(RESERVED_FIELDS)} are reserved and cannot be modified.")
+
+
+class TenantCollection:
+    """
+    A logical collection inside the shared physical collection. Implements the subset of
+    the pymongo Collection API the tools use, injecting the tenant and collection into
+    every filter and document.
+    """
+
+    def __init__(self, physical, tenant_id: str, name: str):
+        self._physical = physical
+        self.tenant_id = tenant_id
+        self.name = name
+        self._scope = {TENANT_FIELD: tenant_id, COLLECTION_FIELD: name}
+
+    def _scoped(self, filter_query=None) -> dict:
+        # The scope keys go last so a filter can never widen itself to another tenant
+        return {**(filter_query or {}), **self._scope}
+
+    @property
+    def scope(self) -> dict:
+        """The fields and values that confine queries to this collection."""
+        return dict(self._scope)
+
+    def physical_query(self, filter_query=None):
+        """The shared collection and the scoped filter a query on this collection really runs."""
+        return self._physical, self._scoped(filter_query)
+
+    def find(self, filter_query=None, projection=None):
+        return self._physical.find(self._scoped(filter_query), _hidden_projection(projection))
+
+    def find_one(self, filter_query=None, projection=None):
+        return self._physical.find_one(self._scoped(filter_query), _hidden_projection(projection))
+
+    def count_documents(self, filter_query=None):
+        return self._physical.count_documents(self._scoped(filter_query))
+
+    def insert_one(self, document: dict):
+        result = self._physical.insert_one({**document, **self._scope})
+        document.setdefault("_id", result.inserted_id)  # Same side effect as pymongo's insert_one
+        return result
+
+    def update_one(self, filter_query, update: dict):
+        _check_update(update)
+        return self._physical.update_one(self._scoped(filter_query), update)
+
+    def update_many(self, filter_query, update: dict):
+        _check_update(update)
+        return self._physical.update_many(self._scoped(filter_query), update)
+
+    def delete_one(self, filter_query):
+        return self._physical.delete_one(self._scoped(filter_query))
+
+    def delete_many(self, filter_query):
+        return self._physical.delete_many(self._scoped(filter_query))
+
+
+class DatabaseTenancy:
+    """One database per user: the layout mongo_server has always used."""
+
+    mode = "database"
+
+    def __init__(self, client):
+        self.client = client
+
+    def collection(self, user_id: str, name: str):
+        return self.client[user_id][name]
+
+    def list_collection_names(self, user_id: str) -> list:
+        return self.client[user_id].list_collection_names()
+
+    def create_collection(self, user_id: str, name: str) -> None:
+        self.client[user_id].create_collection(name)
+
+    def drop_collection(self, user_id: str, name: str) -> None:
+        self.client[user_id].drop_collection(name)
+
+
+class SharedTenancy:
+    """All users in one physical collection, keyed by tenant and logical collection name."""
+
+    mode = "shared"
+
+    def __init__(self, db):
+        self.db = db
+        self.data = db[DATA_COLLECTION]
+        self.catalog = db[CATALOG_COLLECTION]
+        self.ensure_indexes()
+
+    def ensure_indexes(self) -> None:
+        # Every tool query is an equality on (tenant, collection) plus the user's filter;
+        # the _id suffix also serves the _id-ordered batches of schema migrations.
+        self.data.create_index([(TENANT_FIELD, 1), (COLLECTION_FIELD, 1), ("_id", 1)])
+        self.catalog.create_index([("tenant_id", 1), ("name", 1)], unique=True)
+
+    def collection(self, user_id: str, name: str) -> TenantCollection:
+        return TenantCollection(self.data, user_id, name)
+
+    def list_collection_names(self, user_id: str) -> list:
+        return [entry["name"] for entry in self.catalog.find({"tenant_id": user_id}, {"name": 1, "_id": 0}).sort("name", 1)]
+
+    def create_collection(self, user_id: str, name: str) -> None:
+        self.catalog.update_one(
+            {"tenant_id": user_id, "name": name},
+            {"$setOnInsert": {"tenant_id": user_id, "name": name}},
+            upsert=True,
+        )
+
+    def drop_collection(self, user_id: str, name: str) -> None:
+        self.data.delete_many({TENANT_FIELD: user_id, COLLECTION_FIELD: name})
+        self.catalog.delete_one({"tenant_id": user_id, "name": name})
+
+
+def create_tenancy(client, mode: str, shared_db_name: str):
+    if mode == "database":
+        return DatabaseTenancy(client)
+    if mode == "shared":
+        return SharedTenancy(client[shared_db_name])
+    raise ValueError(f"Unknown TENANCY_MODE '{mode}'; expected 'database' or 'shared'.")
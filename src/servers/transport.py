@@ -0,0 +1,25 @@
+"""Command-line entry point shared by the Python MCP servers."""
+import argparse
+import os
+
+TRANSPORTS = ("stdio", "sse", "streamable-http")
+
+
+def run_server(mcp, default_port: int) -> None:
+    """
+    Run a FastMCP server over stdio (one client per process, the default) or as a
+    long-lived HTTP service that many chatbot sessions share.
+
+    Flags fall back to MCP_TRANSPORT, MCP_HOST and MCP_PORT. Streamable HTTP is
+    served at /mcp and SSE at /sse.
+    """
+    parser = argparse.ArgumentParser(description=f"{mcp.name} MCP server")
+    parser.add_argument("--transport", choices=TRANSPORTS, default=os.environ.get("MCP_TRANSPORT", "stdio"))
+    parser.add_argument("--host", default=os.environ.get("MCP_HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.environ.get("MCP_PORT", default_port)))
+    args = parser.parse_args()
+
+    if args.transport != "stdio":
+        mcp.settings.host = args.host
+        mcp.settings.port = args.port
+    mcp.run(transport=args.transport)
@@ -0,0 +1,543 @@
+"""
+Lightweight metrics and tracing shared by the API, the chatbot and the MCP servers.
+
+Metrics are kept in a process-local registry and rendered in the Prometheus text
+format. MCP servers run as separate processes, so they periodically write their
+registry to METRICS_DIR and the API merges those files into its /metrics output.
+Counters and histograms of processes that have exited are folded into a retained
+aggregate, so the merged totals never go down.
+
+Spans are exported as JSON lines to TRACE_FILE and/or to an OTLP/HTTP collector at
+OTEL_EXPORTER_OTLP_ENDPOINT. Nested spans (a chat turn and the LLM/tool calls it
+makes) share a trace id through a context variable; across processes the parent is
+passed as a W3C traceparent string (see traceparent()).
+"""
+import atexit
+import contextvars
+import json
+import os
+import queue
+import re
+import secrets
+import sys
+import threading
+import time
+import urllib.request
+from contextlib import contextmanager
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def metrics_dir() -> Path:
+    # Read lazily so values from .env (loaded by each entry point) are honoured
+    return Path(os.environ.get("METRICS_DIR", ROOT_DIR / "data" / "metrics"))
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", " ")
+
+
+def _format_labels(names, values, extra=None) -> str:
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict):
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            for key, value in self._values.items():
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels) -> None:
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state["counts"][i] += 1
+            state["sum"] += value
+            state["count"] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            for key, state in self._values.items():
+                for bound, count in zip(self.buckets, state["counts"]):
+                    lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, ('le', bound))} {count}")
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, ('le', '+Inf'))} {state['count']}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {state['sum']}")
+                lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {state['count']}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, cls, name, documentation, labelnames=(), **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, documentation, labelnames, **kwargs)
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames=()) -> Counter:
+        return self._register(Counter, name, documentation, labelnames)
+
+    def gauge(self, name: str, documentation: str, labelnames=()) -> Gauge:
+        return self._register(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+class MetricsFileWriter:
+    """Periodically dumps REGISTRY to METRICS_DIR/<service>-<pid>.prom for out-of-process scraping."""
+
+    def __init__(self, service: str, interval: float = 5.0):
+        self.path = metrics_dir() / f"{service}-{os.getpid()}.prom"
+        self.interval = interval
+        self._thread = None
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="metrics-writer", daemon=True)
+        self._thread.start()
+        # Leave the final values behind; render_all folds them into the retained totals
+        atexit.register(self.write)
+
+    def _run(self) -> None:
+        while True:
+            self.write()
+            time.sleep(self.interval)
+
+    def write(self) -> None:
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_suffix(".tmp")
+            tmp_path.write_text(REGISTRY.render(), encoding="utf-8")
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            # stdout may be an MCP stdio transport, so diagnostics go to stderr
+            print(f"Error writing metrics file {self.path}: {e}", file=sys.stderr)
+
+    def remove(self) -> None:
+        try:
+            self.path.unlink()
+        except OSError:
+            pass
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+# Counters and histograms of exited processes, summed; gauges of dead processes are dropped
+RETIRED_METRICS_FILE = "retired.prom"
+RETAINED_KINDS = ("counter", "histogram")
+
+
+def _parse_families(text: str) -> dict:
+    """Prometheus text -> {family name: {"help", "type", "samples": {series: value}}}."""
+    families = {}
+    current = None
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        if line.startswith("# HELP ") or line.startswith("# TYPE "):
+            current = line.split()[2]
+            family = families.setdefault(current, {"help": None, "type": None, "samples": {}})
+            family["help" if line.startswith("# HELP ") else "type"] = line
+        elif current is not None:
+            series, _, value = line.rpartition(" ")
+            samples = families[current]["samples"]
+            try:
+                samples[series] = samples.get(series, 0.0) + float(value)
+            except ValueError:
+                continue
+    return families
+
+
+def _merge_families(into: dict, families: dict, kinds=None) -> None:
+    """Sum identical series of `families` into `into`, optionally only families of the given types."""
+    for name, family in families.items():
+        kind = family["type"].split()[-1] if family["type"] else None
+        if kinds is not None and kind not in kinds:
+            continue
+        target = into.setdefault(name, {"help": None, "type": None, "samples": {}})
+        target["help"] = target["help"] or family["help"]
+        target["type"] = target["type"] or family["type"]
+        for series, value in family["samples"].items():
+            target["samples"][series] = target["samples"].get(series, 0.0) + value
+
+
+def _render_families(families: dict) -> str:
+    lines = []
+    for family in families.values():
+        lines.extend(line for line in (family["help"], family["type"]) if line)
+        lines.extend(f"{series} {value}" for series, value in family["samples"].items())
+    return "\n".join(lines) + "\n"
+
+
+@contextmanager
+def _file_lock(path: Path):
+    """Exclusive lock between processes sharing METRICS_DIR (no-op where fcntl is unavailable)."""
+    try:
+        import fcntl
+    except ImportError:
+        fcntl = None
+    with open(path, "a") as handle:
+        if fcntl is not None:
+            fcntl.flock(handle, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(handle, fcntl.LOCK_UN)
+
+
+def _retire(path: Path) -> None:
+    """Fold a dead process's counters and histograms into RETIRED_METRICS_FILE and delete its file."""
+    claimed = path.with_name(f"{path.name}.retiring-{os.getpid()}")
+    try:
+        os.rename(path, claimed)  # Only one renderer (API worker) may fold a given file
+    except OSError:
+        return
+    try:
+        with _file_lock(path.parent / "retired.lock"):
+            retired_path = path.parent / RETIRED_METRICS_FILE
+            retired = _parse_families(retired_path.read_text(encoding="utf-8")) if retired_path.exists() else {}
+            _merge_families(retired, _parse_families(claimed.read_text(encoding="utf-8")), RETAINED_KINDS)
+            tmp_path = retired_path.with_suffix(f".tmp-{os.getpid()}")
+            tmp_path.write_text(_render_families(retired), encoding="utf-8")
+            os.replace(tmp_path, retired_path)
+        claimed.unlink(missing_ok=True)
+    except OSError as e:
+        print(f"Error retiring metrics file {path}: {e}", file=sys.stderr)
+
+
+def render_all() -> str:
+    """
+    Render this process's registry merged with the metric files written by MCP server
+    processes. Identical series from different processes (e.g. one mongo_server per
+    chat session) are summed, so counters and histograms aggregate across processes.
+    Files of processes that have exited are folded into RETIRED_METRICS_FILE first.
+    """
+    families = {}
+    _merge_families(families, _parse_families(REGISTRY.render()))
+    directory = metrics_dir()
+    if directory.is_dir():
+        for path in sorted(directory.glob("*.prom")):
+            pid = path.stem.rsplit("-", 1)[-1]
+            if pid.isdigit() and int(pid) != os.getpid() and not _pid_alive(int(pid)):
+                _retire(path)
+        for path in sorted(directory.glob("*.prom")):
+            pid = path.stem.rsplit("-", 1)[-1]
+            if pid.isdigit() and int(pid) == os.getpid():
+                continue
+            try:
+                _merge_families(families, _parse_families(path.read_text(encoding="utf-8")))
+            except OSError:
+                continue
+    return _render_families(families)
+
+
+# ---------------------------------------------------------------------------
+# Tracing
+# ---------------------------------------------------------------------------
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    def __init__(self, name: str, service: str, parent=None, attributes=None):
+        self.name = name
+        self.service = service
+        self.trace_id = parent.trace_id if parent else secrets.token_hex(16)
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent.span_id if parent else None
+        self.attributes = dict(attributes or {})
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.error = None
+
+    def set_attribute(self, key: str, value) -> None:
+        self.attributes[key] = value
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "service": self.service,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "duration_ms": round((self.end_ns - self.start_ns) / 1e6, 3) if self.end_ns else None,
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+_TRACEPARENT = re.compile(r"^[0-9a-f]{2}-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}$")
+
+
+class SpanContext:
+    """The ids of a span in another process, used as the parent of local spans."""
+
+    def __init__(self, trace_id: str, span_id: str):
+        self.trace_id = trace_id
+        self.span_id = span_id
+
+
+def traceparent():
+    """The current span as a W3C traceparent header value, or None outside a span."""
+    span = _current_span.get()
+    if span is None:
+        return None
+    return f"00-{span.trace_id}-{span.span_id}-01"
+
+
+def parse_traceparent(value):
+    """SpanContext for a W3C traceparent value, or None if it is missing or malformed."""
+    match = _TRACEPARENT.match(value) if isinstance(value, str) else None
+    if match is None or not int(match.group(1), 16) or not int(match.group(2), 16):
+        return None
+    return SpanContext(match.group(1), match.group(2))
+
+
+class FileSpanExporter:
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+
+    def export(self, spans) -> None:
+        lines = "".join(json.dumps(span.to_dict(), default=str) + "\n" for span in spans)
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(lines)
+
+
+def _otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class OTLPHttpSpanExporter:
+    """Posts spans as OTLP/HTTP JSON to <endpoint>/v1/traces."""
+
+    def __init__(self, endpoint: str, timeout: float = 5.0):
+        self.url = endpoint.rstrip("/") + "/v1/traces"
+        self.timeout = timeout
+
+    def export(self, spans) -> None:
+        by_service = {}
+        for span in spans:
+            by_service.setdefault(span.service, []).append({
+                "traceId": span.trace_id,
+                "spanId": span.span_id,
+                "parentSpanId": span.parent_id or "",
+                "name": span.name,
+                "kind": 1,
+                "startTimeUnixNano": str(span.start_ns),
+                "endTimeUnixNano": str(span.end_ns),
+                "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in span.attributes.items()],
+                "status": {"code": 2, "message": span.error} if span.error else {"code": 1},
+            })
+        body = {"resourceSpans": [
+            {
+                "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": service}}]},
+                "scopeSpans": [{"scope": {"name": "datalo"}, "spans": otlp_spans}],
+            }
+            for service, otlp_spans in by_service.items()
+        ]}
+        request = urllib.request.Request(
+            self.url,
+            data=json.dumps(body).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+            method="POST",
+        )
+        urllib.request.urlopen(request, timeout=self.timeout).close()
+
+
+class BatchSpanProcessor:
+    """Exports finished spans from a background thread so tracing never blocks a request."""
+
+    def __init__(self, exporters, max_batch: int = 256, flush_interval: float = 2.0):
+        self.exporters = exporters
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=10_000)
+        self._thread = threading.Thread(target=self._run, name="span-exporter", daemon=True)
+        self._thread.start()
+        atexit.register(self.flush)
+
+    def on_end(self, span: Span) -> None:
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            pass  # Drop spans rather than apply backpressure to requests
+
+    def _drain(self, first=None) -> list:
+        batch = [first] if first is not None else []
+        while len(batch) < self.max_batch:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _export(self, batch) -> None:
+        for exporter in self.exporters:
+            try:
+                exporter.export(batch)
+            except Exception as e:
+                print(f"Error exporting spans via {type(exporter).__name__}: {e}", file=sys.stderr)
+
+    def _run(self) -> None:
+        while True:
+            try:
+                first = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            self._export(self._drain(first))
+
+    def flush(self) -> None:
+        batch = self._drain()
+        while batch:
+            self._export(batch)
+            batch = self._drain()
+
+
+class Tracer:
+    def __init__(self, service: str, processor=None):
+        self.service = service
+        self.processor = processor
+
+    @contextmanager
+    def span(self, name: str, traceparent=None, **attributes):
+        """
+        Start a span as a child of the current span, or of the remote span described by
+        `traceparent` (e.g. the client's tool call) when there is no current span.
+        """
+        parent = _current_span.get() or parse_traceparent(traceparent)
+        span = Span(name, self.service, parent, attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            _current_span.reset(token)
+            span.end_ns = time.time_ns()
+            if self.processor is not None:
+                self.processor.on_end(span)
+
+
+_processor = None
+
+
+def get_tracer(service: str) -> Tracer:
+    """Return a tracer whose spans go to the exporters configured through the environment."""
+    global _processor
+    if _processor is None:
+        exporters = []
+        trace_file = os.environ.get("TRACE_FILE")
+        otlp_endpoint = os.environ.get("OTEL_EXPORTER_OTLP_ENDPOINT")
+        if trace_file:
+            exporters.append(FileSpanExporter(trace_file))
+        if otlp_endpoint:
+            exporters.append(OTLPHttpSpanExporter(otlp_endpoint))
+        if exporters:
+            _processor = BatchSpanProcessor(exporters)
+    return Tracer(service, _processor)
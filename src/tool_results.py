@@ -0,0 +1,29 @@
+"""Recognising failures that tools report in their return value instead of raising."""
+import json
+
+
+def is_error_result(result) -> bool:
+    """The mongo tools return "Error: ...", {"error": ...} or [{"error": ...}] on failure."""
+    if isinstance(result, str):
+        return result.startswith("Error")
+    if isinstance(result, dict):
+        return "error" in result
+    if isinstance(result, list) and result:
+        first = result[0]
+        return (isinstance(first, dict) and "error" in first) or (isinstance(first, str) and first.startswith("Error"))
+    return False
+
+
+def is_error_content(content) -> bool:
+    """is_error_result for MCP content blocks, as the client receives a tool's return value."""
+    items = []
+    for block in content or []:
+        text = getattr(block, "text", None)
+        if text is None:
+            continue
+        try:
+            items.append(json.loads(text))
+        except ValueError:
+            items.append(text)
+    # FastMCP sends a list return value as one block per item
+    return is_error_result(items[0] if len(items) == 1 else items)
@@ -0,0 +1,25 @@
+import asyncio
+from types import SimpleNamespace
+
+import mongomock
+import pytest
+
+from src.servers import mongo_server
+from src.servers.tenancy import create_tenancy
+
+
+@pytest.fixture(params=["database", "shared"])
+def mongo(request, monkeypatch):
+    """mongo_server backed by mongomock, once per tenancy mode. `call` runs a tool to completion."""
+    client = mongomock.MongoClient()
+    monkeypatch.setattr(mongo_server, "_mongo_client", client)
+    monkeypatch.setattr(mongo_server, "_tenancy", create_tenancy(client, request.param, "datalo"))
+    # mongomock cannot create the capped outbox collection, so hand the outbox a plain one
+    monkeypatch.setattr(mongo_server.change_outbox, "_collection", client[mongo_server.CHANGE_FEED_DB]["changes"])
+    monkeypatch.setattr(mongo_server.change_outbox, "enabled", True)
+    monkeypatch.setattr(mongo_server.query_guard, "_plans", type(mongo_server.query_guard._plans)())
+
+    def call(tool, **arguments):
+        return asyncio.run(getattr(mongo_server, tool)(**arguments))
+
+    return SimpleNamespace(server=mongo_server, client=client, mode=request.param, call=call)
@@ -0,0 +1,161 @@
+import asyncio
+
+import anyio
+import httpx
+import jwt
+import pytest
+
+from src.api import server
+
+
+def test_session_gate_serializes_turns_of_one_session():
+    gate = server.SessionGate(max_pending=5)
+    running = []
+    overlap = []
+
+    async def turn(session_id):
+        async with gate.hold(session_id):
+            running.append(session_id)
+            overlap.append(running.count(session_id))
+            await asyncio.sleep(0.01)
+            running.remove(session_id)
+
+    async def main():
+        await asyncio.gather(*(turn("s1") for _ in range(3)), turn("s2"))
+
+    asyncio.run(main())
+    assert max(overlap) == 1
+    assert gate._locks == {} and gate._pending == {}
+
+
+def test_session_gate_lets_other_sessions_run_concurrently():
+    gate = server.SessionGate(max_pending=5)
+    inside = []
+
+    async def turn(session_id, release):
+        async with gate.hold(session_id):
+            inside.append(session_id)
+            await release.wait()
+
+    async def main():
+        release = asyncio.Event()
+        tasks = [asyncio.create_task(turn(name, release)) for name in ("s1", "s2")]
+        await asyncio.sleep(0.01)
+        assert sorted(inside) == ["s1", "s2"]
+        release.set()
+        await asyncio.gather(*tasks)
+
+    asyncio.run(main())
+
+
+def test_session_gate_rejects_when_session_queue_is_full():
+    gate = server.SessionGate(max_pending=1)
+
+    async def main():
+        release = asyncio.Event()
+
+        async def turn():
+            async with gate.hold("s1"):
+                await release.wait()
+
+        tasks = [asyncio.create_task(turn()) for _ in range(2)]  # one running, one queued
+        await asyncio.sleep(0.01)
+        with pytest.raises(server.Overloaded) as excinfo:
+            async with gate.hold("s1"):
+                pass
+        assert excinfo.value.reason == "session"
+        release.set()
+        await asyncio.gather(*tasks)
+
+    asyncio.run(main())
+
+
+def test_turn_limiter_rejects_when_queue_is_full():
+    limiter = server.TurnLimiter(max_active=1, max_queued=1, queue_timeout=5)
+
+    async def main():
+        release = asyncio.Event()
+
+        async def turn():
+            async with limiter.slot():
+                await release.wait()
+
+        tasks = [asyncio.create_task(turn()) for _ in range(2)]  # one active, one queued
+        await asyncio.sleep(0.01)
+        assert (limiter.active, limiter.queued) == (1, 1)
+        with pytest.raises(server.Overloaded) as excinfo:
+            async with limiter.slot():
+                pass
+        assert excinfo.value.reason == "global"
+        release.set()
+        await asyncio.gather(*tasks)
+        assert (limiter.active, limiter.queued) == (0, 0)
+
+    asyncio.run(main())
+
+
+def test_turn_limiter_times_out_waiting_for_a_slot():
+    limiter = server.TurnLimiter(max_active=1, max_queued=5, queue_timeout=0.05)
+
+    async def main():
+        release = asyncio.Event()
+
+        async def turn():
+            async with limiter.slot():
+                await release.wait()
+
+        task = asyncio.create_task(turn())
+        await asyncio.sleep(0.01)
+        with pytest.raises(server.Overloaded, match="Timed out"):
+            async with limiter.slot():
+                pass
+        assert limiter.queued == 0
+        release.set()
+        await task
+
+    asyncio.run(main())
+
+
+class SlowBot:
+    def __init__(self):
+        self.user_id = None
+        self.release = asyncio.Event()
+        self.active = 0
+        self.max_active = 0
+
+    async def ask(self, message):
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        await self.release.wait()
+        self.active -= 1
+        return f"reply to {message}"
+
+
+def test_overflowing_session_gets_429_with_retry_after(monkeypatch):
+    bot = SlowBot()
+    monkeypatch.setitem(server.chatbot_sessions, "s1", bot)
+    monkeypatch.setattr(server, "session_gate", server.SessionGate(max_pending=1))
+    monkeypatch.setattr(server, "turn_limiter", server.TurnLimiter(max_active=4, max_queued=4, queue_timeout=5))
+    token = jwt.encode({"user_id": "u1"}, server.JWT_SECRET, algorithm=server.JWT_ALG)
+    headers = {"Authorization": f"Bearer {token}"}
+
+    async def main():
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            def send(text):
+                return asyncio.create_task(
+                    client.post("/api/message", json={"session_id": "s1", "message": text}, headers=headers)
+                )
+
+            first, second = send("one"), send("two")
+            await asyncio.sleep(0.05)
+            rejected = await client.post("/api/message", json={"session_id": "s1", "message": "three"}, headers=headers)
+            bot.release.set()
+            return await first, await second, rejected
+
+    # anyio.run, not asyncio.run: it also shuts down the worker threads FastAPI runs sync dependencies in
+    first, second, rejected = anyio.run(main)
+    assert first.status_code == second.status_code == 200
+    assert bot.max_active == 1
+    assert rejected.status_code == 429
+    assert rejected.headers["Retry-After"] == str(server.RETRY_AFTER_SECONDS)
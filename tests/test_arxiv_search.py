@@ -0,0 +1,121 @@
+import sys
+import types
+from datetime import datetime
+
+from src.servers import arxiv_search
+
+
+class FakePaper:
+    def __init__(self, number: int):
+        self.number = number
+        self.title = f"Paper {number}"
+        self.authors = []
+        self.summary = ""
+        self.pdf_url = f"https://arxiv.org/pdf/{number}"
+        self.published = datetime(2024, 1, 1)
+
+    def get_short_id(self):
+        return str(self.number)
+
+
+def install_fake_arxiv(monkeypatch, available: int):
+    """An arxiv module whose client serves `available` papers and records each page request."""
+    pages = []
+
+    class Client:
+        def __init__(self, page_size, delay_seconds):
+            self.page_size = page_size
+
+        def results(self, search):
+            wanted = min(search.max_results, available)
+            for offset in range(0, wanted, self.page_size):
+                pages.append(offset)
+                yield from (FakePaper(n) for n in range(offset, min(offset + self.page_size, wanted)))
+
+    class Search:
+        def __init__(self, query, max_results, sort_by):
+            self.max_results = max_results
+
+    module = types.SimpleNamespace(Client=Client, Search=Search,
+                                   SortCriterion=types.SimpleNamespace(Relevance="relevance"))
+    monkeypatch.setitem(sys.modules, "arxiv", module)
+    return pages
+
+
+def count_tokens(monkeypatch) -> list:
+    taken = []
+    monkeypatch.setattr(arxiv_search.ARXIV_BUCKET, "acquire", lambda: taken.append(1) or 0.0)
+    return taken
+
+
+def test_single_page_search_takes_one_token(monkeypatch):
+    pages = install_fake_arxiv(monkeypatch, available=50)
+    taken = count_tokens(monkeypatch)
+    papers = arxiv_search.fetch_papers("physics", 5)
+    assert len(papers) == 5
+    assert len(pages) == 1
+    assert len(taken) == 1
+
+
+def test_full_last_page_takes_no_extra_token(monkeypatch):
+    pages = install_fake_arxiv(monkeypatch, available=500)
+    taken = count_tokens(monkeypatch)
+    papers = arxiv_search.fetch_papers("physics", 200)
+    assert len(papers) == 200
+    assert len(pages) == 2
+    assert len(taken) == 2
+
+
+def test_short_result_set_takes_one_token(monkeypatch):
+    pages = install_fake_arxiv(monkeypatch, available=3)
+    taken = count_tokens(monkeypatch)
+    papers = arxiv_search.fetch_papers("physics", 10)
+    assert len(papers) == 3
+    assert len(taken) == len(pages) == 1
+
+
+class FakeTime:
+    """Stands in for arxiv_search.time: sleeping advances the clock."""
+
+    def __init__(self):
+        self.now = 1_700_000_000.0
+        self.slept = 0.0
+
+    def time(self):
+        return self.now
+
+    monotonic = time
+
+    def sleep(self, seconds):
+        self.slept += seconds
+        self.now += seconds
+
+
+def test_buckets_sharing_a_state_file_share_the_rate(monkeypatch, tmp_path):
+    clock = FakeTime()
+    monkeypatch.setattr(arxiv_search, "time", clock)
+    # Two processes' buckets, as each stdio session gets its own server process
+    first = arxiv_search.TokenBucket(3.0, state_path=tmp_path / ".arxiv_rate")
+    second = arxiv_search.TokenBucket(3.0, state_path=tmp_path / ".arxiv_rate")
+
+    assert first.acquire() == 0.0
+    assert second.acquire() == 3.0
+    clock.now += 1.0
+    assert first.acquire() == 2.0
+    assert clock.slept == 5.0
+
+
+def test_buckets_without_a_state_file_are_independent(monkeypatch):
+    clock = FakeTime()
+    monkeypatch.setattr(arxiv_search, "time", clock)
+    first, second = arxiv_search.TokenBucket(3.0), arxiv_search.TokenBucket(3.0)
+    assert first.acquire() == second.acquire() == 0.0
+    assert first.acquire() == 3.0
+
+
+def test_unreadable_state_file_starts_a_full_bucket(monkeypatch, tmp_path):
+    monkeypatch.setattr(arxiv_search, "time", FakeTime())
+    state_path = tmp_path / "papers" / ".arxiv_rate"
+    state_path.parent.mkdir()
+    state_path.write_text("garbage")
+    assert arxiv_search.TokenBucket(3.0, state_path=state_path).acquire() == 0.0
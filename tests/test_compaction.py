@@ -0,0 +1,90 @@
+import json
+
+from mcp.types import ImageContent, TextContent
+
+from src.chatbot.compaction import CHARS_PER_TOKEN, ToolResultStore, compact_tool_result
+
+ROWS = [{"_id": str(i), "name": f"friend {i}", "age": 20 + i, "city": "Haifa" if i % 2 else None} for i in range(200)]
+
+
+def row_blocks(rows):
+    # FastMCP sends a list return value as one text block per item
+    return [TextContent(type="text", text=json.dumps(row)) for row in rows]
+
+
+def test_small_results_are_returned_untouched():
+    store = ToolResultStore()
+    content = row_blocks(ROWS[:2])
+    assert compact_tool_result("find_documents_by_filter", content, store, token_budget=1000) is content
+    assert not store
+
+
+def test_large_row_results_become_a_summary():
+    store = ToolResultStore()
+    compacted = compact_tool_result("get_all_documents", row_blocks(ROWS), store, token_budget=500, preview_rows=5)
+
+    assert len(compacted) == 1
+    summary = json.loads(compacted[0]["text"])
+    assert summary["compacted"] is True
+    assert summary["total_rows"] == 200
+    assert summary["fields"]["age"] == {"types": ["int"], "present": 200, "min": 20, "max": 219}
+    assert summary["fields"]["city"]["types"] == ["NoneType", "str"]
+    assert summary["preview"] == ROWS[:len(summary["preview"])]
+    assert 0 < len(summary["preview"]) <= 5
+    assert len(compacted[0]["text"]) <= 500 * CHARS_PER_TOKEN
+
+    page = json.loads(store.page(summary["handle"], 10, 3, token_budget=500))
+    assert page["rows"] == ROWS[10:13]
+
+
+def test_large_text_is_truncated_with_a_handle():
+    store = ToolResultStore()
+    text = "word " * 2000
+    compacted = compact_tool_result("get_collection_schema", [TextContent(type="text", text=text)], store, token_budget=100)
+
+    body = compacted[0]["text"]
+    assert body.startswith(text[:400])
+    assert "[Truncated: showing 400 of 10000 characters." in body
+    handle = body.split("handle='")[1].split("'")[0]
+    assert json.loads(store.page(handle, 400, 50, token_budget=100))["text"] == text[400:450]
+
+
+def test_non_text_blocks_pass_through_uncompacted():
+    store = ToolResultStore()
+    image = ImageContent(type="image", data="iVBORw0KGgo" * 500, mimeType="image/png")
+    compacted = compact_tool_result("render_chart", [*row_blocks(ROWS), image], store, token_budget=500)
+
+    assert compacted[-1] is image
+    assert json.loads(compacted[0]["text"])["total_rows"] == 200
+
+
+def test_results_with_only_non_text_blocks_are_untouched():
+    store = ToolResultStore()
+    content = [{"type": "image", "source": {"type": "base64", "media_type": "image/png", "data": "x" * 50_000}}]
+    assert compact_tool_result("render_chart", content, store, token_budget=100) is content
+    assert not store
+
+
+def test_page_bounds():
+    store = ToolResultStore()
+    handle = store.put("get_all_documents", ROWS[:30])
+
+    first = json.loads(store.page(handle, -5, 0, token_budget=10_000))
+    assert first["offset"] == 0
+    assert first["rows"] == ROWS[:20]  # limit 0 falls back to the default page size
+
+    past_end = json.loads(store.page(handle, 100, 10, token_budget=10_000))
+    assert past_end["rows"] == [] and past_end["total_rows"] == 30
+
+    small_budget = json.loads(store.page(handle, 0, 30, token_budget=60))
+    assert 1 <= len(small_budget["rows"]) < 30
+
+    assert "error" in json.loads(store.page("missing-handle", 0, 10, token_budget=100))
+
+
+def test_store_drops_the_oldest_payloads():
+    store = ToolResultStore(max_payloads=2)
+    first = store.put("a", [1])
+    store.put("b", [2])
+    store.put("c", [3])
+    assert "error" in json.loads(store.page(first, 0, 10, token_budget=100))
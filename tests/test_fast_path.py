@@ -0,0 +1,125 @@
+import asyncio
+import json
+from datetime import datetime
+
+from src.chatbot import fast_path
+
+SCHEMA = {"name": "str", "city": "str", "age": "int", "score": "float", "active": "bool",
+          "joined": "datetime", "tags": "list", "owner": "ObjectId"}
+
+
+def run_answer(query: str, rows=({"name": "Bob", "city": "Haifa", "age": 30},)):
+    """Answer `query` against one 'friends' collection holding `rows`; returns (result, tool calls made)."""
+    calls = []
+
+    async def call_tool(name, arguments):
+        calls.append((name, arguments))
+        if name == "get_user_collections":
+            return [{"text": "friends"}]
+        if name == "get_collection_schema":
+            return [{"text": json.dumps(SCHEMA)}]
+        if name == "count_documents":
+            return [{"text": str(len(rows))}]
+        return [{"text": json.dumps(row)} for row in rows]
+
+    return asyncio.run(fast_path.answer(query, "user-1", call_tool)), calls
+
+
+def data_calls(calls) -> list:
+    return [call for call in calls if call[0] in ("find_documents_by_filter", "count_documents")]
+
+
+def test_simple_equality_is_answered():
+    result, calls = run_answer("show friends where city is Haifa")
+    assert result is not None
+    assert data_calls(calls)[0][1]["filter_query"] == {"city": {"$regex": "^Haifa$", "$options": "i"}}
+
+
+def test_value_is_coerced_to_field_type():
+    result, calls = run_answer("count documents in friends where age is 30")
+    assert result is not None
+    assert data_calls(calls)[0][1]["filter_query"] == {"age": 30}
+
+
+def test_compound_and_condition_falls_back():
+    result, calls = run_answer("show friends where name is Bob and city is Haifa")
+    assert result is None
+    assert data_calls(calls) == []
+
+
+def test_negation_falls_back():
+    result, calls = run_answer("show friends where name is not Bob")
+    assert result is None
+    assert data_calls(calls) == []
+
+
+def test_or_condition_falls_back():
+    result, calls = run_answer("show friends where city is Tel Aviv or Haifa")
+    assert result is None
+    assert data_calls(calls) == []
+
+
+def test_compound_count_falls_back():
+    result, calls = run_answer("count documents in friends where city is Haifa and age is 30")
+    assert result is None
+    assert data_calls(calls) == []
+
+
+def test_comparison_words_fall_back():
+    for query in ("show friends where age is over 30",
+                  "show friends where age is greater than 30",
+                  "count documents in friends where age is less than 30"):
+        result, calls = run_answer(query)
+        assert result is None, query
+        assert data_calls(calls) == [], query
+
+
+def test_list_of_values_falls_back():
+    result, calls = run_answer("show friends where city is Haifa, Tel Aviv")
+    assert result is None
+    assert data_calls(calls) == []
+
+
+def test_non_scalar_field_types_fall_back():
+    for field, value in (("joined", "2024-01-01"), ("tags", "music"), ("owner", "64f1c0a2b3c4d5e6f7a8b9c0")):
+        result, calls = run_answer(f"show friends where {field} is {value}")
+        assert result is None, field
+        assert data_calls(calls) == [], field
+
+
+def test_coerce_only_handles_scalar_types():
+    assert fast_path._coerce("Haifa", "str") == "Haifa"
+    assert fast_path._coerce("30", "int") == 30
+    assert fast_path._coerce("1.5", "float") == 1.5
+    assert fast_path._coerce("yes", "bool") is True
+    assert fast_path._coerce("thirty", "int") is None
+    assert fast_path._coerce(str(datetime(2024, 1, 1)), "datetime") is None
+    assert fast_path._coerce("a", "list") is None
+    assert fast_path._coerce("a", "dict") is None
+    assert fast_path._coerce("64f1c0a2b3c4d5e6f7a8b9c0", "ObjectId") is None
+
+
+def test_empty_filtered_result_falls_back():
+    for query in ("show friends where city is Haifa", "count documents in friends where age is 30"):
+        result, calls = run_answer(query, rows=())
+        assert result is None, query
+        assert len(data_calls(calls)) == 1, query
+
+
+def test_empty_collection_without_filter_is_answered():
+    result, _ = run_answer("count documents in friends", rows=())
+    assert result == ("count", "There are 0 document(s) in 'friends'.")
+
+
+def test_string_match_ignores_case_against_the_real_tools(mongo):
+    mongo.call("create_user_collection_only", user_id="u1", collection_name="friends")
+    mongo.call("insert_to_collection", user_id="u1", collection_name="friends", new_data={"name": "Dana", "city": "Haifa"})
+    mongo.call("insert_to_collection", user_id="u1", collection_name="friends", new_data={"name": "Noa", "city": "Haifa (old town)"})
+
+    async def call_tool(name, arguments):
+        return await mongo.server.mcp.call_tool(name, arguments)
+
+    intent, reply = asyncio.run(fast_path.answer("show friends where city is haifa", "u1", call_tool))
+    assert intent == "find"
+    assert reply.startswith("Found 1 document(s) in 'friends' where city is haifa")
+    assert "Dana" in reply and "Noa" not in reply
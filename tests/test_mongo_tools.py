@@ -0,0 +1,96 @@
+import threading
+
+from bson.objectid import ObjectId
+
+
+def test_tool_body_and_change_record_run_off_the_event_loop(mongo, monkeypatch):
+    threads = {}
+    record = mongo.server.change_outbox.record
+
+    def record_on_thread(*args):
+        threads["record"] = threading.current_thread()
+        record(*args)
+
+    monkeypatch.setattr(mongo.server.change_outbox, "record", record_on_thread)
+
+    assert "created" in mongo.call("create_user_collection_only", user_id="u1", collection_name="friends").lower()
+    assert threads["record"] is not threading.main_thread()
+    assert mongo.client["datalo_events"]["changes"].count_documents({"user_id": "u1", "operation": "create"}) == 1
+
+
+def test_failed_write_records_no_change(mongo):
+    result = mongo.call("insert_to_collection", user_id="u1", collection_name="missing", new_data={"a": 1})
+    assert result.startswith("Error")
+    assert mongo.client["datalo_events"]["changes"].count_documents({}) == 0
+
+
+def insert_friends(mongo, count: int) -> list:
+    mongo.call("create_user_collection_only", user_id="u1", collection_name="friends")
+    for i in range(count):
+        mongo.call("insert_to_collection", user_id="u1", collection_name="friends", new_data={"name": f"friend {i}", "age": i})
+    return [doc["_id"] for doc in mongo.call("find_documents_by_filter", user_id="u1", collection_name="friends", filter_query={})]
+
+
+def spy_on_finds(mongo, monkeypatch) -> list:
+    """Record the filter of every find that reaches the collection."""
+    finds = []
+    get_collection = mongo.server.get_collection
+
+    def spied(user_id, collection_name):
+        collection = get_collection(user_id, collection_name)
+        find = collection.find
+
+        def recording_find(filter_query=None, *args, **kwargs):
+            finds.append(filter_query)
+            return find(filter_query, *args, **kwargs)
+
+        monkeypatch.setattr(collection, "find", recording_find)
+        return collection
+
+    monkeypatch.setattr(mongo.server, "get_collection", spied)
+    return finds
+
+
+def find_by_ids(mongo, document_ids, **arguments):
+    return mongo.call("find_documents_by_ids", user_id="u1", collection_name="friends", document_ids=document_ids, **arguments)
+
+
+def test_find_by_ids_answers_in_input_order_with_duplicates(mongo):
+    ids = insert_friends(mongo, 3)
+    results = find_by_ids(mongo, [ids[2], ids[0], ids[2]])
+    assert [result["_id"] for result in results] == [ids[2], ids[0], ids[2]]
+    assert [result["name"] for result in results] == ["friend 2", "friend 0", "friend 2"]
+    assert all("_tenant_id" not in result for result in results)
+
+
+def test_find_by_ids_marks_missing_ids(mongo):
+    ids = insert_friends(mongo, 1)
+    missing = str(ObjectId())
+    assert find_by_ids(mongo, [missing, ids[0]]) == [
+        {"_id": missing, "info": "Document not found."},
+        {"_id": ids[0], "name": "friend 0", "age": 0},
+    ]
+
+
+def test_find_by_ids_keeps_the_id_for_projections(mongo):
+    ids = insert_friends(mongo, 2)
+    assert find_by_ids(mongo, ids, projection={"name": 1}) == [{"_id": ids[0], "name": "friend 0"}, {"_id": ids[1], "name": "friend 1"}]
+    assert find_by_ids(mongo, ids[:1], projection={"_id": 0, "age": 0}) == [{"_id": ids[0], "name": "friend 0"}]
+
+
+def test_find_by_ids_rejects_invalid_ids_before_querying(mongo, monkeypatch):
+    ids = insert_friends(mongo, 1)
+    finds = spy_on_finds(mongo, monkeypatch)
+    assert find_by_ids(mongo, [ids[0], "not-an-id", 42]) == [{"error": "Invalid document ids: ['not-an-id', 42]"}]
+    assert finds == []
+
+
+def test_find_by_ids_queries_in_batches(mongo, monkeypatch):
+    ids = insert_friends(mongo, 5)
+    monkeypatch.setattr(mongo.server, "FIND_BY_IDS_BATCH_SIZE", 2)
+    finds = spy_on_finds(mongo, monkeypatch)
+
+    results = find_by_ids(mongo, [*reversed(ids), ids[0]])
+    assert [result["_id"] for result in results] == [*reversed(ids), ids[0]]
+    # Duplicates are fetched once: five unique ids in batches of two
+    assert [len(query["_id"]["$in"]) for query in finds] == [2, 2, 1]
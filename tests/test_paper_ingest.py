@@ -0,0 +1,79 @@
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from src.servers import paper_ingest
+
+
+def write_topic(tmp_path, paper_ids):
+    topic_dir = tmp_path / "diffusion_models"
+    topic_dir.mkdir()
+    papers = {paper_id: {"title": paper_id, "pdf_url": f"https://arxiv.org/pdf/{paper_id}"} for paper_id in paper_ids}
+    (topic_dir / "papers_info.json").write_text(json.dumps(papers))
+    return topic_dir
+
+
+@pytest.fixture
+def fake_pdfs(monkeypatch):
+    """PDFs are their own text; `delays` slows a download, `failures` makes one raise."""
+    pdfs = {"delays": {}, "failures": set()}
+
+    async def fetch(client, semaphore, url):
+        paper_id = url.rsplit("/", 1)[1]
+        await asyncio.sleep(pdfs["delays"].get(paper_id, 0))
+        if paper_id in pdfs["failures"]:
+            raise ValueError(f"{paper_id} unavailable")
+        return f"text of {paper_id}".encode()
+
+    monkeypatch.setattr(paper_ingest, "_fetch", fetch)
+    monkeypatch.setattr(paper_ingest, "extract_pdf_text", bytes.decode)
+    monkeypatch.setattr(paper_ingest, "_executor", ThreadPoolExecutor(max_workers=2))
+    return pdfs
+
+
+def test_concurrent_ingests_of_a_topic_keep_every_paper(tmp_path, fake_pdfs):
+    topic_dir = write_topic(tmp_path, ["p1", "p2"])
+    fake_pdfs["delays"]["p1"] = 0.2
+
+    async def main():
+        slow = asyncio.create_task(paper_ingest.ingest_topic(tmp_path, topic_dir, max_papers=1))
+        await asyncio.sleep(0.05)
+        return await asyncio.gather(slow, paper_ingest.ingest_topic(tmp_path, topic_dir, max_papers=2))
+
+    first, second = asyncio.run(main())
+    assert first["ingested"] == ["p1"]
+    # The second call waited for the first, so it only downloads what is still missing
+    assert second["skipped"] == ["p1"] and second["ingested"] == ["p2"]
+    chunks = json.loads((topic_dir / paper_ingest.CHUNKS_FILE).read_text())
+    assert sorted(chunks) == ["p1", "p2"]
+    assert chunks["p2"]["chunks"] == ["text of p2"]
+
+
+def test_failed_papers_are_not_written(tmp_path, fake_pdfs):
+    topic_dir = write_topic(tmp_path, ["p1", "p2"])
+    fake_pdfs["failures"].add("p2")
+
+    summary = asyncio.run(paper_ingest.ingest_topic(tmp_path, topic_dir))
+    assert summary["ingested"] == ["p1"] and "p2" in summary["failed"]
+    assert list(json.loads((topic_dir / paper_ingest.CHUNKS_FILE).read_text())) == ["p1"]
+
+
+def test_interrupted_cache_write_leaves_no_partial_file(tmp_path, fake_pdfs, monkeypatch):
+    text_dir = tmp_path / paper_ingest.TEXT_CACHE_DIR
+    real_replace = paper_ingest.os.replace
+
+    def crash(source, target):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(paper_ingest.os, "replace", crash)
+    with pytest.raises(OSError):
+        asyncio.run(paper_ingest._text_for(b"hello world", text_dir))
+    assert list(text_dir.iterdir()) == []
+
+    monkeypatch.setattr(paper_ingest.os, "replace", real_replace)
+    digest, text = asyncio.run(paper_ingest._text_for(b"hello world", text_dir))
+    assert text == "hello world"
+    assert (text_dir / f"{digest}.txt").read_text() == "hello world"
+    assert [path.suffix for path in text_dir.iterdir()] == [".txt"]
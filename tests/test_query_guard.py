@@ -0,0 +1,81 @@
+import pytest
+
+from src.servers.query_guard import QueryGuard, QueryRejected, has_collection_scan, physical_query
+from src.servers.tenancy import COLLECTION_FIELD, TENANT_FIELD
+
+UNBOUNDED = ["[MinKey, MaxKey]"]
+SCOPE_BOUNDS = {TENANT_FIELD: ['["alice", "alice"]'], COLLECTION_FIELD: ['["friends", "friends"]']}
+
+
+def scan_plan(mode: str) -> dict:
+    """The winning plan of {"name": ...}: a COLLSCAN, or under shared tenancy the scope index plus a FETCH filter."""
+    if mode == "database":
+        return {"stage": "COLLSCAN", "filter": {"name": {"$eq": "Dana"}}, "direction": "forward"}
+    return {
+        "stage": "FETCH",
+        "filter": {"name": {"$eq": "Dana"}},
+        "inputStage": {
+            "stage": "IXSCAN",
+            "keyPattern": {TENANT_FIELD: 1, COLLECTION_FIELD: 1, "_id": 1},
+            "indexBounds": {**SCOPE_BOUNDS, "_id": UNBOUNDED},
+        },
+    }
+
+
+def indexed_plan(mode: str) -> dict:
+    bounds = {"name": ['["Dana", "Dana"]']}
+    if mode == "shared":
+        bounds = {**SCOPE_BOUNDS, **bounds}
+    return {"stage": "FETCH", "inputStage": {"stage": "IXSCAN", "keyPattern": dict.fromkeys(bounds, 1), "indexBounds": bounds}}
+
+
+def guard_with_plan(monkeypatch, collection, plan) -> QueryGuard:
+    explained = []
+
+    def command(self, spec):
+        explained.append(spec)
+        return {"queryPlanner": {"winningPlan": plan}}
+
+    target = physical_query(collection, {})[0]
+    monkeypatch.setattr(type(target.database), "command", command)
+    return QueryGuard({}, explain=True, scan_limit=3)
+
+
+def friends(mongo, user_id: str, count: int):
+    collection = mongo.server._tenancy.collection(user_id, "friends")
+    for i in range(count):
+        collection.insert_one({"name": f"friend {i}"})
+    return collection
+
+
+def test_scan_of_more_documents_than_the_limit_is_rejected(mongo, monkeypatch):
+    alice = friends(mongo, "alice", 5)
+    guard = guard_with_plan(monkeypatch, alice, scan_plan(mongo.mode))
+    with pytest.raises(QueryRejected, match="all ~5 documents of 'friends'"):
+        guard.check("find_documents_by_filter", alice, {"name": "Dana"})
+
+
+def test_scan_limit_counts_only_the_documents_in_scope(mongo, monkeypatch):
+    alice = friends(mongo, "alice", 2)
+    friends(mongo, "bob", 10)  # In the shared collection too under shared tenancy
+    guard = guard_with_plan(monkeypatch, alice, scan_plan(mongo.mode))
+    guard.check("find_documents_by_filter", alice, {"name": "Dana"})
+
+
+def test_indexed_plans_run(mongo, monkeypatch):
+    alice = friends(mongo, "alice", 5)
+    guard = guard_with_plan(monkeypatch, alice, indexed_plan(mongo.mode))
+    guard.check("find_documents_by_filter", alice, {"name": "Dana"})
+
+
+def test_only_scope_bounds_make_an_index_scan_a_collection_scan():
+    scope = {TENANT_FIELD: "alice", COLLECTION_FIELD: "friends"}
+    by_id = {"stage": "IXSCAN", "indexBounds": {**SCOPE_BOUNDS, "_id": ["[ObjectId('65a0'), ObjectId('65a0')]"]}}
+    backwards = {"stage": "IXSCAN", "indexBounds": {**SCOPE_BOUNDS, "_id": ["[MaxKey, MinKey]"]}}
+
+    assert has_collection_scan(scan_plan("shared"), scope)
+    assert has_collection_scan({"stage": "LIMIT", "inputStage": backwards}, scope)
+    assert not has_collection_scan(by_id, scope)
+    assert not has_collection_scan(indexed_plan("shared"), scope)
+    # Without a scope (one database per user) index scans are never collection scans
+    assert not has_collection_scan(scan_plan("shared"))
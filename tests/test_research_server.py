@@ -0,0 +1,29 @@
+import asyncio
+import json
+import time
+
+from src.servers import research_server
+
+
+def test_spellings_of_a_topic_share_one_search_and_one_directory(monkeypatch, tmp_path):
+    monkeypatch.setattr(research_server, "PAPER_DIR", tmp_path)
+    queries = []
+
+    def fetch_papers(topic, max_results):
+        queries.append(topic)
+        time.sleep(0.1)
+        return {"2401.00001": {"title": "Paper", "pdf_url": "https://arxiv.org/pdf/2401.00001"}}
+
+    monkeypatch.setattr(research_server, "fetch_papers", fetch_papers)
+
+    async def main():
+        return await asyncio.gather(
+            research_server.search_papers("Diffusion  Models"),
+            research_server.search_papers(" diffusion models"),
+        )
+
+    assert asyncio.run(main()) == [["2401.00001"], ["2401.00001"]]
+    assert queries == ["diffusion models"]
+    assert [path.name for path in tmp_path.iterdir()] == ["diffusion_models"]
+    assert research_server.topic_dir_name("DIFFUSION\tmodels") == "diffusion_models"
+    assert json.loads(research_server.extract_info("2401.00001"))["title"] == "Paper"
@@ -0,0 +1,149 @@
+import time
+from datetime import timedelta
+
+import mongomock
+import pytest
+from pymongo.errors import DuplicateKeyError
+
+from src.servers.schema_jobs import SchemaMigrationRunner, _now, fields_key
+
+
+@pytest.fixture
+def db():
+    return mongomock.MongoClient()["datalo"]
+
+
+def make_runner(db, owner="this-host:1"):
+    runner = SchemaMigrationRunner(
+        jobs_collection=lambda: db["schema_migrations"],
+        target_collection=lambda user_id, name: db[f"{user_id}.{name}"],
+        batch_size=2,
+        throttle_seconds=0,
+        stale_after_seconds=60,
+    )
+    runner.owner = owner
+    return runner
+
+
+def wait_for(runner, job_id, status="completed", timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = runner.jobs_collection().find_one({"_id": job_id})
+        if job["status"] == status:
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"job {job_id} is {job['status']}, expected {status}")
+
+
+def abandoned_job(db, status, last_id=None, **extra):
+    """A job document as left behind by a process that died."""
+    job = {
+        "_id": f"{status}-job",
+        "user_id": "u1",
+        "collection_name": "friends",
+        "fields_key": fields_key({"city": "", "age": 0}),
+        "active": True,
+        "new_fields": {"city": "", "age": 0},
+        "status": status,
+        "last_id": last_id,
+        "batches": 0,
+        "fields_set": 0,
+        "error": None,
+        "owner": None,
+        "heartbeat": None,
+        "created_at": _now() - timedelta(minutes=10),
+        "updated_at": _now() - timedelta(minutes=10),
+        **extra,
+    }
+    db["schema_migrations"].insert_one(job)
+    return job
+
+
+def insert_friends(db, count=5):
+    db["u1.friends"].insert_many([{"_id": i, "name": f"friend {i}"} for i in range(count)])
+
+
+@pytest.mark.parametrize("status, extra", [
+    ("pending", {}),
+    ("running", {"owner": "dead-host:9", "heartbeat": _now() - timedelta(minutes=5)}),
+])
+def test_status_resumes_abandoned_jobs(db, status, extra):
+    insert_friends(db)
+    job = abandoned_job(db, status, **extra)
+    runner = make_runner(db)
+
+    runner.status("u1")
+    done = wait_for(runner, job["_id"])
+    assert done["active"] is False and done["owner"] is None
+    assert db["u1.friends"].count_documents({"city": "", "age": 0}) == 5
+
+
+def test_resume_continues_after_the_last_batch(db):
+    insert_friends(db)
+    job = abandoned_job(db, "running", last_id=2, owner="dead-host:9", heartbeat=_now() - timedelta(minutes=5))
+    runner = make_runner(db)
+
+    runner.status("u1")
+    wait_for(runner, job["_id"])
+    assert db["u1.friends"].count_documents({"city": {"$exists": True}}) == 2  # _id 3 and 4 only
+
+
+def test_jobs_with_a_live_worker_are_left_alone(db):
+    job = abandoned_job(db, "running", owner="other-host:2", heartbeat=_now())
+    fresh = abandoned_job(db, "pending", _id="fresh-job", fields_key="other", created_at=_now(), updated_at=_now())
+    runner = make_runner(db)
+
+    runner.status("u1")
+    time.sleep(0.05)
+    assert runner._threads == {}
+    assert runner.jobs_collection().find_one({"_id": job["_id"]})["owner"] == "other-host:2"
+    assert runner.jobs_collection().find_one({"_id": fresh["_id"]})["status"] == "pending"
+
+
+def test_start_matches_fields_in_any_key_order(db):
+    runner = make_runner(db)
+    runner._spawn = lambda job_id: None  # Keep the first job active
+    first, resumed_first = runner.start("u1", "friends", {"city": "", "age": 0})
+    second, resumed_second = runner.start("u1", "friends", {"age": 0, "city": ""})
+
+    assert not resumed_first and resumed_second
+    assert second["_id"] == first["_id"]
+    assert runner.jobs_collection().count_documents({}) == 1
+
+
+def test_only_one_active_job_per_collection_and_fields(db):
+    runner = make_runner(db)
+    runner._spawn = lambda job_id: None
+    job, _ = runner.start("u1", "friends", {"city": ""})
+
+    duplicate = {**job, "_id": "racing-insert"}
+    with pytest.raises(DuplicateKeyError):
+        runner.jobs_collection().insert_one(duplicate)
+
+    # Once the first job completes, the same fields can be migrated again
+    runner.jobs_collection().update_one({"_id": job["_id"]}, {"$set": {"status": "completed", "active": False}})
+    again, resumed = runner.start("u1", "friends", {"city": ""})
+    assert not resumed and again["_id"] != job["_id"]
+
+
+def test_start_joins_a_job_inserted_by_a_concurrent_call(db):
+    runner = make_runner(db)
+    runner._spawn = lambda job_id: None
+    jobs = runner._jobs()
+    racing = abandoned_job(db, "pending", fields_key=fields_key({"city": ""}), new_fields={"city": ""})
+    find_one = jobs.find_one
+    lookups = []
+
+    class RacingJobs:
+        """The first lookup misses, as if the concurrent insert landed right after it."""
+
+        def find_one(self, query):
+            lookups.append(query)
+            return None if len(lookups) == 1 else find_one(query)
+
+        def __getattr__(self, name):
+            return getattr(jobs, name)
+
+    runner.jobs_collection = lambda: RacingJobs()
+    job, resumed = runner.start("u1", "friends", {"city": ""})
+    assert resumed and job["_id"] == racing["_id"]
@@ -0,0 +1,93 @@
+import anyio
+from mcp.shared.memory import create_connected_server_and_client_session
+
+from src import telemetry
+from src.chatbot import app
+
+DEAD_PID = 999_999_001
+LIVE_PID = 999_999_002
+
+SERVER_METRICS = """# HELP mongo_tool_calls_total mongo_server tool calls by outcome (ok, error)
+# TYPE mongo_tool_calls_total counter
+mongo_tool_calls_total{{tool="count_documents",status="ok"}} {calls}
+# HELP mongo_tool_seconds Latency of mongo_server tools
+# TYPE mongo_tool_seconds histogram
+mongo_tool_seconds_bucket{{tool="count_documents",le="+Inf"}} {calls}
+mongo_tool_seconds_sum{{tool="count_documents"}} 0.5
+mongo_tool_seconds_count{{tool="count_documents"}} {calls}
+# HELP mongo_pool_connections Open connections
+# TYPE mongo_pool_connections gauge
+mongo_pool_connections 4
+"""
+
+
+def sample(rendered: str, series: str) -> float:
+    for line in rendered.splitlines():
+        if line.startswith(series + " "):
+            return float(line.rsplit(" ", 1)[1])
+    return None
+
+
+class Collector:
+    def __init__(self):
+        self.spans = []
+
+    def on_end(self, span):
+        self.spans.append(span)
+
+
+def test_counters_of_exited_processes_are_retained(tmp_path, monkeypatch):
+    monkeypatch.setenv("METRICS_DIR", str(tmp_path))
+    monkeypatch.setattr(telemetry, "_pid_alive", lambda pid: pid != DEAD_PID)
+    calls = 'mongo_tool_calls_total{tool="count_documents",status="ok"}'
+    count = 'mongo_tool_seconds_count{tool="count_documents"}'
+
+    (tmp_path / f"mongo_server-{LIVE_PID}.prom").write_text(SERVER_METRICS.format(calls=2))
+    (tmp_path / f"mongo_server-{DEAD_PID}.prom").write_text(SERVER_METRICS.format(calls=3))
+    before = telemetry.render_all()
+    assert sample(before, calls) == 5
+    assert sample(before, count) == 5
+    assert sample(before, "mongo_pool_connections") == 4  # Gauges of the dead process are dropped
+    assert not (tmp_path / f"mongo_server-{DEAD_PID}.prom").exists()
+
+    # The same pid number can die again after reuse; its totals keep adding up
+    (tmp_path / f"mongo_server-{DEAD_PID}.prom").write_text(SERVER_METRICS.format(calls=1))
+    after = telemetry.render_all()
+    assert sample(after, calls) == 6
+    assert sample(after, count) == 6
+    assert sorted(path.name for path in tmp_path.glob("*.prom")) == [f"mongo_server-{LIVE_PID}.prom", "retired.prom"]
+
+
+def test_span_joins_a_remote_parent():
+    collector = Collector()
+    tracer = telemetry.Tracer("mongo_server", processor=collector)
+    with telemetry.Tracer("chatbot").span("tool.call") as client_span:
+        parent = telemetry.traceparent()
+    assert parent == f"00-{client_span.trace_id}-{client_span.span_id}-01"
+
+    with tracer.span("mongo.count_documents", traceparent=parent):
+        pass
+    with tracer.span("mongo.count_documents", traceparent="not-a-traceparent"):
+        pass
+    spans = collector.spans
+    assert (spans[0].trace_id, spans[0].parent_id) == (client_span.trace_id, client_span.span_id)
+    assert spans[1].parent_id is None and spans[1].trace_id != client_span.trace_id
+
+
+def test_tool_spans_join_the_chat_turn_trace(mongo, monkeypatch):
+    collector = Collector()
+    monkeypatch.setattr(app.TRACER, "processor", collector)
+    monkeypatch.setattr(mongo.server.TRACER, "processor", collector)
+    monkeypatch.setattr(app, "TOOL_CACHE", app.ToolResultCache())
+    bot = app.MCP_ChatBot.__new__(app.MCP_ChatBot)
+
+    async def main():
+        async with create_connected_server_and_client_session(mongo.server.mcp._mcp_server) as session:
+            with app.TRACER.span("chat.turn"):
+                await bot.call_tool(session, "get_user_collections", {"user_id": "u1"})
+
+    anyio.run(main)
+    spans = {span.name: span for span in collector.spans}
+    turn, call, tool = spans["chat.turn"], spans["tool.call"], spans["mongo.get_user_collections"]
+    assert turn.trace_id == call.trace_id == tool.trace_id
+    assert tool.parent_id == call.span_id
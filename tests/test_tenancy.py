@@ -0,0 +1,139 @@
+import mongomock
+import pytest
+from bson.objectid import ObjectId
+
+from src.servers import migrate_tenancy
+from src.servers.tenancy import COLLECTION_FIELD, TENANT_FIELD, SharedTenancy, _hidden_projection
+
+HIDDEN = {TENANT_FIELD: 0, COLLECTION_FIELD: 0}
+
+
+@pytest.fixture
+def shared():
+    return SharedTenancy(mongomock.MongoClient()["datalo"])
+
+
+def two_tenants(shared):
+    alice, bob = shared.collection("alice", "friends"), shared.collection("bob", "friends")
+    alice.insert_one({"name": "Dana", "city": "Haifa"})
+    bob.insert_one({"name": "Omer", "city": "Haifa"})
+    return alice, bob
+
+
+def test_reads_only_see_the_tenants_own_documents(shared):
+    alice, bob = two_tenants(shared)
+    assert [doc["name"] for doc in alice.find({"city": "Haifa"})] == ["Dana"]
+    assert alice.count_documents({}) == 1
+    assert alice.find_one({"name": "Omer"}) is None
+    assert shared.collection("alice", "pets").count_documents({}) == 0
+
+
+def test_filters_cannot_widen_the_scope(shared):
+    alice, _ = two_tenants(shared)
+    # The scope keys override whatever the filter says about them
+    assert [doc["name"] for doc in alice.find({TENANT_FIELD: "bob"})] == ["Dana"]
+    assert alice.count_documents({TENANT_FIELD: "bob", COLLECTION_FIELD: "pets"}) == 1
+    assert list(alice.find({"$or": [{TENANT_FIELD: "bob"}, {"name": "Omer"}]})) == []
+
+
+def test_writes_cannot_touch_another_tenant(shared):
+    alice, bob = two_tenants(shared)
+    omer_id = bob.find_one({})["_id"]
+
+    assert alice.update_one({"_id": omer_id}, {"$set": {"city": "Eilat"}}).matched_count == 0
+    assert alice.update_many({}, {"$set": {"city": "Eilat"}}).modified_count == 1
+    assert alice.delete_one({"_id": omer_id}).deleted_count == 0
+    assert alice.delete_many({}).deleted_count == 1
+    assert bob.find_one({"_id": omer_id})["city"] == "Haifa"
+
+
+@pytest.mark.parametrize("update", [
+    {"$set": {TENANT_FIELD: "bob"}},
+    {"$set": {f"{COLLECTION_FIELD}.x": 1}},
+    {"$unset": {TENANT_FIELD: ""}},
+    {"$rename": {COLLECTION_FIELD: "other"}},
+    {"$rename": {"name": TENANT_FIELD}},
+])
+def test_updates_of_the_scope_fields_are_rejected(shared, update):
+    alice, _ = two_tenants(shared)
+    with pytest.raises(ValueError, match="reserved"):
+        alice.update_one({}, update)
+    with pytest.raises(ValueError, match="reserved"):
+        alice.update_many({}, update)
+    assert shared.data.count_documents({TENANT_FIELD: "alice"}) == 1
+
+
+def test_inserted_documents_get_the_scope_and_an_id(shared):
+    alice = shared.collection("alice", "friends")
+    document = {"name": "Dana"}
+    alice.insert_one(document)
+    stored = shared.data.find_one({"_id": document["_id"]})
+    assert (stored[TENANT_FIELD], stored[COLLECTION_FIELD]) == ("alice", "friends")
+    assert TENANT_FIELD not in alice.find_one({}) and COLLECTION_FIELD not in alice.find_one({})
+
+
+@pytest.mark.parametrize("projection, expected", [
+    (None, HIDDEN),
+    ({"age": 0}, {"age": 0, **HIDDEN}),
+    ({"_id": 0}, {"_id": 0, **HIDDEN}),
+    ({"name": 1}, {"name": 1}),
+    ({"_id": 0, "name": 1}, {"_id": 0, "name": 1}),
+])
+def test_hidden_projection(projection, expected):
+    assert _hidden_projection(projection) == expected
+
+
+def test_catalog_and_drop_are_per_tenant(shared):
+    two_tenants(shared)
+    shared.create_collection("alice", "friends")
+    shared.create_collection("bob", "friends")
+    shared.create_collection("alice", "pets")
+    assert shared.list_collection_names("alice") == ["friends", "pets"]
+
+    shared.drop_collection("alice", "friends")
+    assert shared.list_collection_names("alice") == ["pets"]
+    assert shared.list_collection_names("bob") == ["friends"]
+    assert shared.collection("bob", "friends").count_documents({}) == 1
+
+
+def test_tools_do_not_cross_tenants(mongo):
+    mongo.call("create_user_collection_only", user_id="alice", collection_name="friends")
+    mongo.call("insert_to_collection", user_id="alice", collection_name="friends", new_data={"name": "Dana"})
+    dana_id = mongo.call("find_documents_by_filter", user_id="alice", collection_name="friends", filter_query={})[0]["_id"]
+    mongo.call("create_user_collection_only", user_id="bob", collection_name="friends")
+
+    assert mongo.call("find_document_by_id", user_id="bob", collection_name="friends", document_id=dana_id) == {"info": "Document not found."}
+    mongo.call("update_document_by_id", user_id="bob", collection_name="friends", document_id=dana_id, update_fields={"name": "X"})
+    mongo.call("delete_documents_by_filter", user_id="bob", collection_name="friends", filter_query={})
+    assert mongo.call("find_document_by_id", user_id="alice", collection_name="friends", document_id=dana_id)["name"] == "Dana"
+    assert mongo.call("get_user_collections", user_id="bob") == ["friends"]
+
+
+def test_migration_copies_and_resumes(capsys):
+    client = mongomock.MongoClient()
+    user_id = str(ObjectId())
+    client[user_id]["friends"].insert_many([{"_id": i, "name": f"friend {i}"} for i in range(5)])
+    shared = SharedTenancy(client["datalo"])
+    # An earlier run stopped after copying the first two documents
+    shared.data.insert_many([{"_id": i, "name": f"friend {i}", TENANT_FIELD: user_id, COLLECTION_FIELD: "friends"} for i in range(2)])
+
+    assert migrate_tenancy.migrate_user(client, shared, user_id, batch_size=2, dry_run=False, drop_source=True)
+    assert "'copied': 3, 'skipped': 2, 'conflicts': 0" in capsys.readouterr().out
+    assert shared.collection(user_id, "friends").count_documents({}) == 5
+    assert shared.list_collection_names(user_id) == ["friends"]
+    assert user_id not in client.list_database_names()
+
+
+def test_migration_keeps_the_source_on_id_conflicts(capsys):
+    client = mongomock.MongoClient()
+    user_id = str(ObjectId())
+    client[user_id]["friends"].insert_many([{"_id": i, "name": f"friend {i}"} for i in range(3)])
+    shared = SharedTenancy(client["datalo"])
+    shared.collection("someone-else", "friends").insert_one({"_id": 1, "name": "not yours"})
+
+    assert not migrate_tenancy.migrate_user(client, shared, user_id, batch_size=10, dry_run=False, drop_source=True)
+    output = capsys.readouterr()
+    assert "'copied': 2, 'skipped': 0, 'conflicts': 1" in output.out
+    assert "source database kept" in output.err
+    assert user_id in client.list_database_names()
+    assert shared.collection("someone-else", "friends").find_one({"_id": 1})["name"] == "not yours"
@@ -0,0 +1,139 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+from mcp.types import TextContent
+
+from src.chatbot import app, tool_cache
+from src.chatbot.tool_cache import ToolResultCache
+from src.tool_results import is_error_content
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_entries_expire_after_ttl(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(tool_cache.time, "monotonic", clock)
+    cache = ToolResultCache(ttl_seconds=60)
+    cache.put("count_documents", "u1", {"collection_name": "friends"}, ["3"])
+
+    clock.now += 59
+    assert cache.get("count_documents", "u1", {"collection_name": "friends"}) == ["3"]
+    clock.now += 2
+    assert cache.get("count_documents", "u1", {"collection_name": "friends"}) is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_argument_order_does_not_change_the_key():
+    cache = ToolResultCache()
+    cache.put("find_documents_by_filter", "u1", {"collection_name": "friends", "filter_query": {"a": 1, "b": 2}}, ["x"])
+    assert cache.get("find_documents_by_filter", "u1", {"filter_query": {"b": 2, "a": 1}, "collection_name": "friends"}) == ["x"]
+    assert cache.get("find_documents_by_filter", "u2", {"collection_name": "friends", "filter_query": {"a": 1, "b": 2}}) is None
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = ToolResultCache(max_entries=2)
+    cache.put("count_documents", "u1", {"collection_name": "a"}, ["1"])
+    cache.put("count_documents", "u1", {"collection_name": "b"}, ["2"])
+    assert cache.get("count_documents", "u1", {"collection_name": "a"}) == ["1"]  # b is now the oldest
+    cache.put("count_documents", "u1", {"collection_name": "c"}, ["3"])
+
+    assert cache.get("count_documents", "u1", {"collection_name": "b"}) is None
+    assert cache.get("count_documents", "u1", {"collection_name": "a"}) == ["1"]
+    assert cache.get("count_documents", "u1", {"collection_name": "c"}) == ["3"]
+    assert cache.stats()["evictions"] == 1
+
+
+def fill(cache):
+    cache.put("get_user_collections", "u1", {"user_id": "u1"}, ["friends", "pets"])
+    cache.put("count_documents", "u1", {"user_id": "u1", "collection_name": "friends"}, ["3"])
+    cache.put("count_documents", "u1", {"user_id": "u1", "collection_name": "pets"}, ["5"])
+    cache.put("count_documents", "u2", {"user_id": "u2", "collection_name": "friends"}, ["7"])
+
+
+def test_write_invalidates_only_its_user_and_collection():
+    cache = ToolResultCache()
+    fill(cache)
+    removed = cache.invalidate_for_write("insert_to_collection", "u1", {"user_id": "u1", "collection_name": "friends"})
+
+    assert removed == 1
+    assert cache.get("count_documents", "u1", {"user_id": "u1", "collection_name": "friends"}) is None
+    assert cache.get("count_documents", "u1", {"user_id": "u1", "collection_name": "pets"}) == ["5"]
+    assert cache.get("count_documents", "u2", {"user_id": "u2", "collection_name": "friends"}) == ["7"]
+    assert cache.get("get_user_collections", "u1", {"user_id": "u1"}) == ["friends", "pets"]
+
+
+def test_collection_level_write_also_drops_the_collection_listing():
+    for tool_name in tool_cache.COLLECTION_LEVEL_WRITES:
+        cache = ToolResultCache()
+        fill(cache)
+        cache.invalidate_for_write(tool_name, "u1", {"user_id": "u1", "collection_name": "friends"})
+
+        assert cache.get("get_user_collections", "u1", {"user_id": "u1"}) is None, tool_name
+        assert cache.get("count_documents", "u1", {"user_id": "u1", "collection_name": "pets"}) == ["5"], tool_name
+
+
+def test_read_tools_do_not_invalidate():
+    cache = ToolResultCache()
+    fill(cache)
+    assert cache.invalidate_for_write("find_documents_by_filter", "u1", {"collection_name": "friends"}) == 0
+    assert cache.stats()["entries"] == 4
+
+
+def test_invalidate_without_collection_drops_everything_for_the_user():
+    cache = ToolResultCache()
+    fill(cache)
+    assert cache.invalidate("u1") == 3
+    assert cache.get("count_documents", "u2", {"user_id": "u2", "collection_name": "friends"}) == ["7"]
+
+
+def text_blocks(*values):
+    return [TextContent(type="text", text=value if isinstance(value, str) else json.dumps(value)) for value in values]
+
+
+def test_is_error_content_recognises_error_shapes():
+    assert is_error_content(text_blocks("Error: Query exceeded the 5000 ms time limit."))
+    assert is_error_content(text_blocks({"error": "Invalid ObjectId"}))
+    assert is_error_content(text_blocks({"error": "Invalid ObjectId"}, {"_id": "1"}))
+    assert not is_error_content(text_blocks({"_id": "1", "name": "Bob"}))
+    assert not is_error_content(text_blocks("3"))
+    assert not is_error_content([])
+
+
+class FakeSession:
+    def __init__(self, content):
+        self.content = content
+        self.calls = 0
+
+    async def send_request(self, request, result_type):
+        self.calls += 1
+        return SimpleNamespace(content=self.content, isError=False)
+
+
+def call_twice(monkeypatch, content):
+    monkeypatch.setattr(app, "TOOL_CACHE", ToolResultCache())
+    bot = app.MCP_ChatBot.__new__(app.MCP_ChatBot)
+    session = FakeSession(content)
+    arguments = {"user_id": "u1", "collection_name": "friends", "filter_query": {"name": "Bob"}}
+
+    async def main():
+        for _ in range(2):
+            assert await bot.call_tool(session, "find_documents_by_filter", arguments) == content
+
+    asyncio.run(main())
+    return session.calls
+
+
+def test_successful_read_results_are_cached(monkeypatch):
+    assert call_twice(monkeypatch, text_blocks({"_id": "1", "name": "Bob"})) == 1
+
+
+def test_error_results_are_not_cached(monkeypatch):
+    assert call_twice(monkeypatch, text_blocks("Error: Query exceeded the 5000 ms time limit.")) == 2
+    assert call_twice(monkeypatch, text_blocks({"error": "Query rejected"})) == 2
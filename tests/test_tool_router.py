@@ -0,0 +1,92 @@
+import asyncio
+from types import SimpleNamespace
+
+from src.chatbot import app
+from src.chatbot.tool_router import REQUEST_MORE_TOOLS_TOOL, ToolRouter
+
+
+def tool(name: str, description: str, *params) -> dict:
+    return {
+        "name": name,
+        "description": description,
+        "input_schema": {"type": "object", "properties": {param: {"type": "string"} for param in params}},
+    }
+
+
+TOOLS = [
+    tool("get_user_collections", "Return the list of collections inside the user's database.", "user_id"),
+    tool("get_collection_schema", "Get the schema (field names and types) of a collection.", "user_id", "collection_name"),
+    tool("insert_to_collection", "Insert a new document into a collection.", "user_id", "collection_name", "new_data"),
+    tool("delete_document_by_id", "Delete a single document from a collection by its _id.", "user_id", "document_id"),
+    tool("count_documents", "Count documents in a collection matching the given filter.", "user_id", "filter_query"),
+    tool("find_documents_by_filter", "Find documents in a collection that match a filter query.", "user_id", "filter_query"),
+    tool("update_document_by_id", "Update a single document by _id.", "user_id", "document_id", "update_fields"),
+    tool("search_papers", "Search for papers on arXiv based on a topic and store their information.", "topic"),
+    tool("extract_info", "Search for information about a specific paper across all topic directories.", "paper_id"),
+    tool("fetch", "Fetch a URL from the internet and return its contents.", "url"),
+]
+PINNED = ("get_user_collections", "get_collection_schema")
+
+
+def names(tools) -> list:
+    return [tool["name"] for tool in tools]
+
+
+def test_top_k_tools_keep_their_original_order():
+    router = ToolRouter(TOOLS, top_k=2)
+    selected = names(router.select("how many documents are in my friends collection"))
+    assert "count_documents" in selected
+    assert len(selected) == 2
+    assert selected == [name for name in names(TOOLS) if name in selected]
+
+
+def test_query_expansion_maps_everyday_words_onto_tools():
+    router = ToolRouter(TOOLS, top_k=2)
+    assert "insert_to_collection" in names(router.select("please remember that Dana likes tea"))
+    assert "search_papers" in names(router.select("any good articles about diffusion models?"))
+
+
+def test_pinned_and_recent_tools_are_always_sent():
+    router = ToolRouter(TOOLS, top_k=1, pinned=PINNED)
+    selected = names(router.select("fetch https://example.com", recent_tool_names={"update_document_by_id"}))
+    assert selected == ["get_user_collections", "get_collection_schema", "update_document_by_id", "fetch"]
+
+
+def test_query_without_lexical_signal_gets_every_tool():
+    router = ToolRouter(TOOLS, top_k=3, pinned=PINNED)
+    assert router.select("hmm ok thanks!") == TOOLS
+
+
+def test_top_k_zero_disables_routing():
+    router = ToolRouter(TOOLS, top_k=0)
+    assert router.select("count documents") == TOOLS
+    assert ToolRouter(TOOLS, top_k=len(TOOLS)).select("count documents") == TOOLS
+
+
+def text_block(text):
+    return SimpleNamespace(type="text", text=text)
+
+
+def test_request_more_tools_widens_the_rest_of_the_turn(monkeypatch):
+    monkeypatch.setenv("ANTHROPIC_API_KEY", "test-key")
+    bot = app.MCP_ChatBot()
+    bot.available_tools = TOOLS
+    bot.tool_router = ToolRouter(TOOLS, top_k=2, pinned=PINNED)
+    responses = [
+        SimpleNamespace(content=[SimpleNamespace(type="tool_use", id="t1", name="request_more_tools", input={})]),
+        SimpleNamespace(content=[text_block("Done.")]),
+    ]
+    sent = []
+
+    async def create_message(tools, messages):
+        sent.append(names(tools))
+        return responses.pop(0)
+
+    monkeypatch.setattr(app, "FAST_PATH_ENABLED", False)
+    monkeypatch.setattr(bot, "create_message", create_message)
+    assert asyncio.run(bot.process_query("how many friends do I have")) == "Done."
+
+    first, second = sent
+    assert REQUEST_MORE_TOOLS_TOOL["name"] in first
+    assert "count_documents" in first and len(first) < len(TOOLS)
+    assert second == names(TOOLS)